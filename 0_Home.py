@@ -6,6 +6,7 @@ from PIL import Image
 from datetime import timedelta
 #from data_load import fetch_summary_workout_data, fetch_edge_workout_data, fetch_summary_workout_data_by_date, fetch_error_workout_data
 
+from helpers.db import get_engine
 from helpers.utils import get_first_day_of_last_month
 
 # PAGE CONFIGS
@@ -16,4 +17,5 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-
+# Build (and warm) the shared connection pool when the app starts
+get_engine()
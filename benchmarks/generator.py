@@ -0,0 +1,188 @@
+# benchmarks/generator.py
+"""Deterministic synthetic taxonomy, mappings, preferences and warning rules.
+
+generate(sizes, seed) always yields the same rows for the same inputs, so two
+benchmark runs (or two machines) measure the same database. Preferences and
+rule conditions only use values mapped to their node, as the UI does, so rules
+actually fire. load() bulk-inserts the rows into a migrated, empty database
+(SQL Server, SQLite or DuckDB).
+"""
+import random
+from typing import Dict, List
+
+import pandas as pd
+from sqlalchemy import text
+
+from helpers.dialect import dialect_for
+
+SCALES: Dict[str, Dict[str, int]] = {
+    "small": {
+        "categories": 10, "subcategories": 60, "nodes": 500, "values": 10_000,
+        "mappings_per_node": 20, "users": 200, "sources": 2, "prefs_per_profile": 30,
+        "rules": 100,
+    },
+    # ~ production: 50 categories, 5k nodes, 100k values, 1M preferences
+    "prod": {
+        "categories": 50, "subcategories": 500, "nodes": 5_000, "values": 100_000,
+        "mappings_per_node": 40, "users": 5_000, "sources": 2, "prefs_per_profile": 100,
+        "rules": 1_000,
+    },
+}
+
+OPERATOR_WEIGHTS = (("=", 70), ("!=", 15), ("IS NULL", 10), ("IS NOT NULL", 5))
+SEVERITY_WEIGHTS = (("Info", 30), ("Warning", 50), ("Error", 20))
+
+
+def resolve_sizes(scale: str = "small", overrides: Dict[str, int] = None) -> Dict[str, int]:
+    sizes = dict(SCALES[scale])
+    for key, value in (overrides or {}).items():
+        if key not in sizes:
+            raise ValueError(f"unknown size '{key}' (expected one of {', '.join(sizes)})")
+        sizes[key] = int(value)
+    return sizes
+
+
+def user_name(i: int) -> str:
+    return f"user{i:05d}"
+
+
+def source_name(i: int) -> str:
+    return f"source {i}"
+
+
+def _weighted(rng: random.Random, pairs) -> str:
+    return rng.choices([p[0] for p in pairs], weights=[p[1] for p in pairs])[0]
+
+
+def generate(sizes: Dict[str, int], seed: int = 42) -> Dict[str, List[tuple]]:
+    """Rows per table, with explicit ids; column order matches COLUMNS."""
+    rng = random.Random(seed)
+    n_cat, n_sub, n_node, n_val = sizes["categories"], sizes["subcategories"], sizes["nodes"], sizes["values"]
+
+    categories = [(i, f"Category {i:04d}") for i in range(1, n_cat + 1)]
+    # Every category gets at least one subcategory, every subcategory one node
+    subcategories = [(i, (i - 1) % n_cat + 1 if i <= n_cat else rng.randint(1, n_cat), f"Subcategory {i:05d}")
+                     for i in range(1, n_sub + 1)]
+    nodes = [(i, (i - 1) % n_sub + 1 if i <= n_sub else rng.randint(1, n_sub),
+              f"Node {i:05d}", f"Synthetic node {i} for benchmarking")
+             for i in range(1, n_node + 1)]
+    values = [(i, f"value {i:06d}", f"stand-in description {rng.randint(0, 10**6):07d}" if rng.random() < 0.8 else None)
+              for i in range(1, n_val + 1)]
+
+    per_node = min(sizes["mappings_per_node"], n_val)
+    mapped: Dict[int, List[int]] = {}
+    mappings = []
+    for node_id in range(1, n_node + 1):
+        ids = sorted(rng.sample(range(1, n_val + 1), per_node))
+        mapped[node_id] = ids
+        mappings.extend((node_id, vid) for vid in ids)
+
+    prefs = []
+    per_profile = min(sizes["prefs_per_profile"], n_node)
+    for u in range(1, sizes["users"] + 1):
+        for s in range(1, sizes["sources"] + 1):
+            for node_id in rng.sample(range(1, n_node + 1), per_profile):
+                prefs.append((user_name(u), node_id, rng.choice(mapped[node_id]), source_name(s)))
+
+    rules, conditions = [], []
+    for r in range(1, sizes["rules"] + 1):
+        ds_filter = source_name(rng.randint(1, sizes["sources"])) if rng.random() < 0.1 else None
+        rules.append((r, f"Rule {r:05d}", f"Synthetic warning {r % 97}", _weighted(rng, SEVERITY_WEIGHTS), 1, ds_filter))
+        for node_id in rng.sample(range(1, n_node + 1), rng.randint(1, 3)):
+            op = _weighted(rng, OPERATOR_WEIGHTS)
+            target = rng.choice(mapped[node_id]) if op in ("=", "!=") else None
+            conditions.append((r, node_id, op, target))
+
+    return {
+        "category": categories,
+        "subCategory": subcategories,
+        "pillarNode": nodes,
+        "pillarNodeValue": values,
+        "pillarNodeValueMapping": mappings,
+        "userNodePreference": prefs,
+        "warningRule": rules,
+        "warningRuleCondition": conditions,
+    }
+
+
+# (columns, rows carry explicit identity values)
+COLUMNS = {
+    "category": (["id", "category"], True),
+    "subCategory": (["id", "category_id", "subCategory"], True),
+    "pillarNode": (["id", "subCategory_id", "pillarNode", "pillarNodeDescription"], True),
+    "pillarNodeValue": (["id", "pillarNodeValue", "pillarNodeValueDescription"], True),
+    "pillarNodeValueMapping": (["pillarNode_id", "pillarNodeValue_id"], False),
+    "userNodePreference": (["userName", "pillarNode_id", "pillarNodeValue_id", "dataSource"], False),
+    "warningRule": (["id", "name", "message", "severity", "isActive", "dataSourceFilter"], True),
+    "warningRuleCondition": (["rule_id", "pillarNode_id", "operator", "pillarNodeValue_id"], False),
+}
+
+CHUNK = 50_000
+
+
+def load(engine, data: Dict[str, List[tuple]]) -> Dict[str, int]:
+    """Bulk-insert generated rows (tables in FK order) into an empty, migrated database."""
+    d = dialect_for(engine)
+    if d.name == "mssql":
+        _load_mssql(engine, data)
+    elif d.name == "duckdb":
+        _load_duckdb(engine, data)
+    else:
+        _load_executemany(engine, data)
+    with engine.begin() as cx:
+        for table, (cols, identity) in COLUMNS.items():
+            if identity and data[table]:
+                for stmt in d.sync_identity(table, max(row[0] for row in data[table])):
+                    cx.execute(text(stmt))
+
+    from helpers.mapping_counts import reconcile_mapping_counts
+
+    reconcile_mapping_counts(engine)
+    with engine.begin() as cx:
+        cx.exec_driver_sql(d.update_statistics)
+    return {table: len(rows) for table, rows in data.items()}
+
+
+def _load_mssql(engine, data: Dict[str, List[tuple]]):
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.fast_executemany = True
+        for table, (cols, identity) in COLUMNS.items():
+            rows = data[table]
+            if identity:
+                cur.execute(f"SET IDENTITY_INSERT dbo.{table} ON;")
+            sql = f"INSERT INTO dbo.{table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))});"
+            for start in range(0, len(rows), CHUNK):
+                cur.executemany(sql, rows[start:start + CHUNK])
+            if identity:
+                cur.execute(f"SET IDENTITY_INSERT dbo.{table} OFF;")
+        raw.commit()
+    finally:
+        raw.close()
+
+
+def _load_executemany(engine, data: Dict[str, List[tuple]]):
+    # SQLite: explicit ids are accepted as-is; one transaction for the whole load
+    with engine.begin() as cx:
+        for table, (cols, _) in COLUMNS.items():
+            sql = f"INSERT INTO dbo.{table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))});"
+            rows = data[table]
+            for start in range(0, len(rows), CHUNK):
+                cx.exec_driver_sql(sql, rows[start:start + CHUNK])
+
+
+def _load_duckdb(engine, data: Dict[str, List[tuple]]):
+    # Row-at-a-time executemany is slow in DuckDB; insert each table from a DataFrame scan
+    raw = engine.raw_connection()
+    try:
+        con = raw.driver_connection
+        for table, (cols, _) in COLUMNS.items():
+            if not data[table]:
+                continue
+            con.register("generated_rows", pd.DataFrame(data[table], columns=cols))
+            con.execute(f"INSERT INTO dbo.{table} ({', '.join(cols)}) SELECT {', '.join(cols)} FROM generated_rows;")
+            con.unregister("generated_rows")
+        raw.commit()
+    finally:
+        raw.close()
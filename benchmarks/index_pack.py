@@ -0,0 +1,174 @@
+# benchmarks/index_pack.py
+"""Before/after plans for the covering index pack (migrations 6 and 7).
+
+Seeds an EMPTY scratch database with deterministic stand-in data, migrates it
+to version 5 (no index pack), captures the actual plan of each data-helper
+query, applies the remaining migrations and captures them again:
+
+    python -m benchmarks.index_pack --url "mssql+pyodbc://..." [--scale 1.0] [--json out.json]
+
+Never point it at the app database: it refuses to run if dbo.category exists.
+"""
+import argparse
+import json
+import random
+import time
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Tuple
+
+from sqlalchemy import create_engine, text
+
+from benchmarks.generator import generate, load, resolve_sizes, source_name, user_name
+from helpers.migrations import migrate
+
+PLAN_NS = {"p": "http://schemas.microsoft.com/sqlserver/2004/07/showplan"}
+
+# (name, statement with ? markers, params) — the statements the data helpers issue
+def app_queries(rng: random.Random, sizes: Dict[str, int]) -> List[Tuple[str, str, tuple]]:
+    cat = rng.randint(1, sizes["categories"])
+    sub = rng.randint(1, sizes["subcategories"])
+    node = rng.randint(1, sizes["nodes"])
+    user = user_name(rng.randint(1, sizes["users"]))
+    return [
+        ("subcategories of category",
+         "SELECT id, subCategory, dateAdded FROM dbo.subCategory WHERE category_id = ? ORDER BY subCategory;", (cat,)),
+        ("nodes of subcategory",
+         "SELECT id, pillarNode, pillarNodeDescription, dateAdded FROM dbo.pillarNode "
+         "WHERE subCategory_id = ? ORDER BY pillarNode;", (sub,)),
+        ("category exists",
+         "SELECT 1 FROM dbo.category WHERE LTRIM(RTRIM(category)) = LTRIM(RTRIM(?));", ("Category 0007",)),
+        ("category exists (trimmed column)",
+         "SELECT 1 FROM dbo.category WHERE categoryTrimmed = LTRIM(RTRIM(?));", ("Category 0007",)),
+        ("value exists",
+         "SELECT 1 FROM dbo.pillarNodeValue WHERE LTRIM(RTRIM(pillarNodeValue)) = LTRIM(RTRIM(?));", ("value 004242",)),
+        ("value exists (trimmed column)",
+         "SELECT 1 FROM dbo.pillarNodeValue WHERE pillarNodeValueTrimmed = LTRIM(RTRIM(?));", ("value 004242",)),
+        ("node exists (trimmed column)",
+         "SELECT 1 FROM dbo.pillarNode WHERE subCategory_id = ? AND pillarNodeTrimmed = LTRIM(RTRIM(?));", (sub, "Node 00001")),
+        ("values page (keyset)",
+         "SELECT TOP (51) v.id, v.pillarNodeValue, v.pillarNodeValueDescription, v.dateAdded, v.mappingCount "
+         "FROM dbo.pillarNodeValue v WHERE (v.pillarNodeValue > ? OR (v.pillarNodeValue = ? AND v.id > ?)) "
+         "ORDER BY v.pillarNodeValue, v.id;", ("value 05", "value 05", 0)),
+        ("mapped values page",
+         "SELECT TOP (51) v.id, v.pillarNodeValue, v.pillarNodeValueDescription, m.dateAdded "
+         "FROM dbo.pillarNodeValueMapping m JOIN dbo.pillarNodeValue v ON v.id = m.pillarNodeValue_id "
+         "WHERE m.pillarNode_id = ? ORDER BY v.pillarNodeValue, v.id;", (node,)),
+        ("available values page",
+         "SELECT TOP (51) v.id, v.pillarNodeValue, v.pillarNodeValueDescription FROM dbo.pillarNodeValue v "
+         "LEFT JOIN dbo.pillarNodeValueMapping m ON m.pillarNodeValue_id = v.id AND m.pillarNode_id = ? "
+         "WHERE m.pillarNode_id IS NULL ORDER BY v.pillarNodeValue, v.id;", (node,)),
+        ("mappings of value",
+         "SELECT COUNT(*) FROM dbo.pillarNodeValueMapping WHERE pillarNodeValue_id = ?;", (rng.randint(1, sizes["values"]),)),
+        ("compile rules",
+         "SELECT id, name, message, severity, isActive, dataSourceFilter FROM dbo.warningRule "
+         "ORDER BY dateAdded DESC, id DESC;", ()),
+        ("compile conditions",
+         "SELECT rule_id, pillarNode_id, operator, pillarNodeValue_id FROM dbo.warningRuleCondition "
+         "ORDER BY rule_id, id;", ()),
+        ("conditions of rule",
+         "SELECT id, pillarNode_id, operator, pillarNodeValue_id FROM dbo.warningRuleCondition "
+         "WHERE rule_id = ? ORDER BY id;", (rng.randint(1, sizes["rules"]),)),
+        ("profile pref map",
+         "SELECT pillarNode_id, pillarNodeValue_id FROM dbo.userNodePreference "
+         "WHERE userName = ? AND dataSource = ?;", (user, source_name(1))),
+        ("user sources",
+         "SELECT DISTINCT dataSource FROM dbo.userNodePreference WHERE userName = ? ORDER BY dataSource;", (user,)),
+        ("rule-node preference rows",
+         "SELECT COUNT_BIG(*) FROM dbo.userNodePreference "
+         "WHERE pillarNode_id IN (SELECT DISTINCT pillarNode_id FROM dbo.warningRuleCondition);", ()),
+    ]
+
+
+# -----------------------------
+# Plan capture
+# -----------------------------
+def _summarize(plan_xml: str) -> dict:
+    root = ET.fromstring(plan_xml)
+    ops, reads = [], 0
+    for relop in root.iter(f"{{{PLAN_NS['p']}}}RelOp"):
+        op = relop.get("PhysicalOp")
+        obj = relop.find("./*/p:Object", PLAN_NS)
+        if op in ("Index Seek", "Index Scan", "Clustered Index Seek", "Clustered Index Scan", "Table Scan", "Key Lookup"):
+            index = obj.get("Index", "").strip("[]") if obj is not None else ""
+            ops.append(f"{op}({index})" if index else op)
+        for rt in relop.findall("./p:RunTimeInformation/p:RunTimeCountersPerThread", PLAN_NS):
+            reads += int(rt.get("ActualLogicalReads", 0) or 0)
+    return {"access": ops, "logicalReads": reads}
+
+
+def capture(engine, queries, repeat: int = 5) -> List[dict]:
+    raw = engine.raw_connection()
+    out = []
+    try:
+        cur = raw.cursor()
+        for name, sql, params in queries:
+            try:
+                cur.execute("SET STATISTICS XML ON;")
+                cur.execute(sql, params)
+                cur.fetchall()
+                plan = None
+                while cur.nextset():
+                    row = cur.fetchone()
+                    if row and isinstance(row[0], str) and row[0].startswith("<ShowPlanXML"):
+                        plan = row[0]
+                cur.execute("SET STATISTICS XML OFF;")
+                timings = []
+                for _ in range(repeat):
+                    t = time.perf_counter()
+                    cur.execute(sql, params)
+                    cur.fetchall()
+                    timings.append((time.perf_counter() - t) * 1000)
+                entry = {"query": name, "medianMs": round(sorted(timings)[len(timings) // 2], 2)}
+                entry.update(_summarize(plan) if plan else {"access": [], "logicalReads": None})
+            except Exception as e:  # e.g. trimmed columns before migration 7
+                raw.rollback()
+                cur = raw.cursor()
+                entry = {"query": name, "error": str(e).splitlines()[0]}
+            out.append(entry)
+    finally:
+        raw.close()
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Before/after plans for the covering index pack.")
+    parser.add_argument("--url", required=True, help="SQLAlchemy URL of an EMPTY scratch database")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies value/user counts")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="write the full report here")
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.url, fast_executemany=True)
+    if engine.dialect.name != "mssql":
+        raise SystemExit("index_pack compares SQL Server plans; time SQLite/DuckDB with benchmarks.suite.")
+    with engine.connect() as cx:
+        if cx.execute(text("SELECT OBJECT_ID('dbo.category');")).scalar() is not None:
+            raise SystemExit("dbo.category already exists; use an empty scratch database.")
+
+    migrate(engine, target=5)
+    sizes = resolve_sizes("small", {
+        "categories": 20, "subcategories": 200, "nodes": 2000, "values": int(100_000 * args.scale),
+        "mappings_per_node": 100, "users": int(2000 * args.scale), "sources": 3, "rules": 500,
+    })
+    load(engine, generate(sizes, args.seed))
+    queries = app_queries(random.Random(args.seed + 1), sizes)
+    before = capture(engine, queries)
+    migrate(engine, include_held=True)
+    with engine.begin() as cx:
+        cx.execute(text("EXEC sp_updatestats;"))
+    after = capture(engine, queries)
+
+    for b, a in zip(before, after):
+        print(f"{b['query']}")
+        for label, r in (("before", b), ("after ", a)):
+            if "error" in r:
+                print(f"  {label}: n/a ({r['error']})")
+            else:
+                print(f"  {label}: {r['medianMs']:>8} ms  reads={r['logicalReads']}  {', '.join(r['access'])}")
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump({"sizes": sizes, "before": before, "after": after}, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+# benchmarks/suite.py
+"""Times every data helper against a seeded stand-in database.
+
+    python -m benchmarks.suite --url "mssql+pyodbc://..." [--scale small|prod] [--set values=200000]
+                               [--repeat 20] [--only fetch_] [--json results.json] [--compare baseline.json]
+    python -m benchmarks.suite --url sqlite:///bench.db        # or duckdb:///bench.duckdb, sqlite:// (memory)
+
+The database must be empty (it is migrated and seeded with benchmarks.generator)
+unless --reuse is given, in which case it must hold data seeded with the same
+--scale/--set/--seed. Page-local helpers (fetch_values, duplicate_context,
+evaluate_rules, …) are loaded from the page scripts without running their UI
+code. Results are written as JSON; --compare prints the ratio to a previous
+run and exits non-zero when a case got slower than --tolerance.
+"""
+import argparse
+import ast
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import event, inspect, text
+
+from benchmarks.generator import generate, load, resolve_sizes, source_name, user_name
+from helpers.dialect import create_engine_for_url
+from helpers.mapping_counts import reconcile_mapping_counts
+from helpers.mappings import add_mappings, remove_mappings
+from helpers.migrations import migrate
+from helpers.preferences import clear_pref, save_prefs, upsert_pref
+from helpers.rule_analysis import analyze_rules
+from helpers.rule_batch import evaluate_all_profiles, evaluate_rules_sql
+from helpers.rules import get_compiled_rules, load_compiled_rules
+from helpers.taxonomy import get_taxonomy, load_taxonomy_snapshot
+from helpers.value_search import TrigramIndex, get_value_index
+from helpers.warning_hits import refresh_warning_hits
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = ["1_SubCategories.py", "2_Nodes.py", "3_Values.py", "4_Mappings.py", "5_UserMappings.py", "6_Warnings.py"]
+
+
+# -----------------------------
+# Page-local helpers
+# -----------------------------
+def load_page_helpers(path: str, engine) -> dict:
+    """Namespace with a page's imports, functions and CONSTANTS, bound to `engine`; UI code is skipped."""
+    with open(path, encoding="utf-8") as fh:
+        tree = ast.parse(fh.read(), filename=path)
+    keep = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom, ast.FunctionDef, ast.ClassDef)):
+            keep.append(node)
+        elif (isinstance(node, ast.Assign) and all(isinstance(t, ast.Name) and t.id.isupper() for t in node.targets)):
+            keep.append(node)
+    namespace = {"__name__": f"page_{os.path.splitext(os.path.basename(path))[0]}", "engine": engine}
+    exec(compile(ast.Module(body=keep, type_ignores=[]), path, "exec"), namespace)
+    return namespace
+
+
+# -----------------------------
+# Cases
+# -----------------------------
+class Case(NamedTuple):
+    name: str
+    group: str
+    run: Callable                       # run(state) -> anything
+    setup: Optional[Callable] = None    # untimed, per iteration; returns state
+    teardown: Optional[Callable] = None # untimed, per iteration; teardown(state), or teardown(run's result) without setup
+    repeat: Optional[int] = None        # overrides --repeat (expensive, whole-database cases)
+
+
+def build_cases(engine, sizes: Dict[str, int], seed: int) -> List[Case]:
+    rng = random.Random(seed + 7)
+    p1, p2, p3, p4, p5, p6 = (load_page_helpers(os.path.join(ROOT, "pages", p), engine) for p in PAGES)
+    names = itertools.count(1)
+
+    taxonomy = get_taxonomy(engine)
+    node = max(taxonomy.node_by_id.values(), key=lambda n: len(taxonomy.values_for_node(n.id)))
+    sub = taxonomy.subcategory_by_id[node.subCategory_id]
+    cat = taxonomy.category_by_id[sub.category_id]
+    user, ds = user_name(rng.randint(1, sizes["users"])), source_name(1)
+    mapped = {v.id for v in taxonomy.values_for_node(node.id)}
+    unmapped = [vid for vid in rng.sample(range(1, sizes["values"] + 1), min(500, sizes["values"])) if vid not in mapped][:50]
+    mid = sizes["values"] // 2
+    deep_cursor = (f"value {mid:06d}", mid)
+    search = "0042"
+    pref_map = p5["fetch_user_pref_map"](user, ds)
+    pref_nodes = sorted(pref_map)[:30]
+    rule_id = 1
+
+    def scratch_sql(sql: str, **params):
+        with engine.begin() as cx:
+            return cx.execute(text(sql), params).scalar()
+
+    def new_subcategory(_=None):
+        name = f"bench sub {next(names)}"
+        p1["insert_subcategory"](cat.id, name)
+        return scratch_sql("SELECT id FROM dbo.subCategory WHERE subCategory = :n;", n=name)
+
+    def new_node(_=None):
+        name = f"bench node {next(names)}"
+        p2["insert_pillar_node"](sub.id, name, "benchmark")
+        return scratch_sql("SELECT id FROM dbo.pillarNode WHERE pillarNode = :n;", n=name)
+
+    def new_value(_=None):
+        name = f"bench value {next(names)}"
+        p3["insert_value"](name, "benchmark")
+        return scratch_sql("SELECT id FROM dbo.pillarNodeValue WHERE pillarNodeValue = :n;", n=name)
+
+    def new_rule(_=None):
+        return p6["insert_rule"](f"bench rule {next(names)}", "benchmark", "Warning", True, None,
+                                 [{"node_id": node.id, "operator": "=", "value_id": min(mapped)}])
+
+    def new_context(_=None):
+        dest = f"bench ctx {next(names)}"
+        p5["duplicate_context"](user, ds, dest)
+        return dest
+
+    def changed_prefs(_=None):
+        return {nid: rng.choice([v.id for v in taxonomy.values_for_node(nid)] or [None]) for nid in pref_nodes}
+
+    return [
+        # taxonomy + lookups
+        Case("load_taxonomy_snapshot", "taxonomy", lambda s: load_taxonomy_snapshot(engine)),
+        Case("get_taxonomy (warm)", "taxonomy", lambda s: get_taxonomy(engine)),
+        Case("fetch_categories", "taxonomy", lambda s: p1["fetch_categories"]()),
+        Case("fetch_subcategories", "taxonomy", lambda s: p1["fetch_subcategories"](cat.id)),
+        Case("fetch_pillar_nodes", "taxonomy", lambda s: p2["fetch_pillar_nodes"](sub.id)),
+        Case("fetch_values_for_node", "taxonomy", lambda s: p6["fetch_values_for_node"](node.id)),
+        Case("category_exists", "taxonomy", lambda s: p1["category_exists"](cat.category)),
+        Case("subcategory_exists", "taxonomy", lambda s: p1["subcategory_exists"](cat.id, sub.subCategory)),
+        Case("pillar_node_exists", "taxonomy", lambda s: p2["pillar_node_exists"](sub.id, node.pillarNode)),
+        Case("value_exists", "taxonomy", lambda s: p3["value_exists"](f"value {mid:06d}")),
+        # taxonomy writes
+        Case("insert_subcategory", "taxonomy writes", lambda s: new_subcategory(), teardown=lambda sid: p1["delete_subcategory"](sid)),
+        Case("delete_subcategory", "taxonomy writes", lambda sid: p1["delete_subcategory"](sid), setup=new_subcategory),
+        Case("insert_pillar_node", "taxonomy writes", lambda s: new_node(), teardown=lambda nid: p2["delete_pillar_node"](nid)),
+        Case("update_pillar_node", "taxonomy writes", lambda nid: p2["update_pillar_node"](nid, f"bench node {next(names)}", None),
+             setup=new_node, teardown=lambda nid: p2["delete_pillar_node"](nid)),
+        Case("delete_pillar_node", "taxonomy writes", lambda nid: p2["delete_pillar_node"](nid), setup=new_node),
+        Case("insert_value", "taxonomy writes", lambda s: new_value(), teardown=lambda vid: p3["delete_value"](vid)),
+        Case("update_value", "taxonomy writes", lambda vid: p3["update_value"](vid, f"bench value {next(names)}", None),
+             setup=new_value, teardown=lambda vid: p3["delete_value"](vid)),
+        Case("delete_value", "taxonomy writes", lambda vid: p3["delete_value"](vid), setup=new_value),
+        # value listings + search
+        Case("fetch_values (first page)", "values", lambda s: p3["fetch_values"](None, None)),
+        Case("fetch_values (deep page)", "values", lambda s: p3["fetch_values"](None, deep_cursor)),
+        Case("fetch_values (search)", "values", lambda s: p3["fetch_values"](search, None)),
+        Case("value_count_estimate (search)", "values", lambda s: p3["value_count_estimate"](search)),
+        Case("TrigramIndex build", "values", lambda s: TrigramIndex(get_taxonomy(engine).values), repeat=3),
+        Case("value index search", "values", lambda s: get_value_index(engine).search(search)),
+        Case("value index fuzzy", "values", lambda s: get_value_index(engine).fuzzy("valeu 0042")),
+        # mapping panes + writes
+        Case("fetch_mapped_values", "mappings", lambda s: p4["fetch_mapped_values"](node.id, None, None)),
+        Case("fetch_available_values", "mappings", lambda s: p4["fetch_available_values"](node.id, None, None)),
+        Case("fetch_available_values (search)", "mappings", lambda s: p4["fetch_available_values"](node.id, search, None)),
+        Case("filtered_value_count", "mappings", lambda s: p4["filtered_value_count"](node.id, None, False)),
+        Case("filtered_value_count (search)", "mappings", lambda s: p4["filtered_value_count"](node.id, search, False)),
+        Case("filtered_value_ids", "mappings", lambda s: p4["filtered_value_ids"](node.id, None, False)),
+        Case("add_mappings (50)", "mappings", lambda s: add_mappings(engine, node.id, unmapped),
+             teardown=lambda s: remove_mappings(engine, node.id, unmapped)),
+        Case("remove_mappings (50)", "mappings", lambda s: remove_mappings(engine, node.id, unmapped),
+             setup=lambda s=None: add_mappings(engine, node.id, unmapped)),
+        Case("reconcile_mapping_counts", "mappings", lambda s: reconcile_mapping_counts(engine), repeat=3),
+        # preferences
+        Case("fetch_user_contexts", "preferences", lambda s: p5["fetch_user_contexts"](user)),
+        Case("fetch_user_pref_map", "preferences", lambda s: p5["fetch_user_pref_map"](user, ds)),
+        Case("fetch_current_prefs_table", "preferences", lambda s: p5["fetch_current_prefs_table"](user, ds)),
+        Case("upsert_pref", "preferences", lambda s: upsert_pref(engine, user, ds, node.id, min(mapped))),
+        Case("clear_pref", "preferences", lambda s: clear_pref(engine, user, ds, node.id),
+             setup=lambda s=None: upsert_pref(engine, user, ds, node.id, min(mapped))),
+        Case("save_prefs (30 changes)", "preferences", lambda changed: save_prefs(engine, user, ds, changed),
+             setup=changed_prefs),
+        Case("duplicate_context", "preferences", lambda dest: p5["duplicate_context"](user, ds, dest),
+             setup=lambda s=None: f"bench ctx {next(names)}", teardown=lambda dest: p5["clear_all_prefs"](user, dest)),
+        Case("rename_context", "preferences", lambda src: p5["rename_context"](user, src, src + " renamed"),
+             setup=new_context, teardown=lambda src: p5["clear_all_prefs"](user, src + " renamed")),
+        Case("clear_all_prefs", "preferences", lambda dest: p5["clear_all_prefs"](user, dest), setup=new_context),
+        # rules
+        Case("load_compiled_rules", "rules", lambda s: load_compiled_rules(engine), repeat=5),
+        Case("load_compiled_rules (unpruned)", "rules", lambda s: load_compiled_rules(engine, prune=False), repeat=5),
+        Case("get_compiled_rules (warm)", "rules", lambda s: get_compiled_rules(engine)),
+        Case("analyze_rules", "rules", lambda compiled: analyze_rules(compiled),
+             setup=lambda s=None: load_compiled_rules(engine, prune=False), repeat=5),
+        Case("list_rules", "rules", lambda s: p6["list_rules"]()),
+        Case("fetch_rule_conditions", "rules", lambda s: p6["fetch_rule_conditions"](rule_id)),
+        Case("insert_rule", "rules", lambda s: new_rule(), teardown=lambda rid: p6["delete_rule"](rid)),
+        Case("delete_rule", "rules", lambda rid: p6["delete_rule"](rid), setup=new_rule),
+        Case("evaluate_rules (one profile)", "rules", lambda s: p6["evaluate_rules"](user, ds)),
+        Case("evaluate_rules_sql (one profile)", "rules", lambda s: evaluate_rules_sql(engine, user, ds)),
+        Case("evaluate_all_profiles", "rules", lambda s: evaluate_all_profiles(engine), repeat=3),
+        Case("evaluate_rules_sql (all profiles)", "rules", lambda s: evaluate_rules_sql(engine), repeat=3),
+        Case("refresh_warning_hits (full)", "rules", lambda s: refresh_warning_hits(engine, full=True), repeat=1),
+    ]
+
+
+# -----------------------------
+# Runner
+# -----------------------------
+def _statement_counter(engine) -> list:
+    count = [0]
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        count[0] += 1
+
+    return count
+
+
+def time_case(case: Case, repeat: int, statements: list) -> dict:
+    repeat = case.repeat or repeat
+    timings, executed = [], 0
+    for i in range(repeat + (1 if repeat > 1 else 0)):  # one untimed warm-up
+        state = case.setup() if case.setup else None
+        before = statements[0]
+        started = time.perf_counter()
+        result = case.run(state)
+        elapsed = (time.perf_counter() - started) * 1000
+        if i or repeat == 1:
+            timings.append(elapsed)
+            executed += statements[0] - before
+        if case.teardown:
+            case.teardown(state if case.setup else result)
+    ordered = sorted(timings)
+    return {
+        "name": case.name,
+        "group": case.group,
+        "repeat": len(timings),
+        "minMs": round(ordered[0], 3),
+        "medianMs": round(statistics.median(ordered), 3),
+        "p95Ms": round(ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))], 3),
+        "meanMs": round(statistics.fmean(ordered), 3),
+        "statements": round(executed / len(timings), 2),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[dict], baseline_path: str, tolerance: float) -> int:
+    with open(baseline_path, encoding="utf-8") as fh:
+        baseline = {r["name"]: r for r in json.load(fh)["results"]}
+    regressions = 0
+    print(f"\n{'case':<40} {'baseline':>10} {'now':>10} {'ratio':>7}")
+    for r in results:
+        old = baseline.get(r["name"])
+        if old is None or not old["medianMs"]:
+            continue
+        ratio = r["medianMs"] / old["medianMs"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag, regressions = "  ← slower", regressions + 1
+        print(f"{r['name']:<40} {old['medianMs']:>10.2f} {r['medianMs']:>10.2f} {ratio:>7.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the data helpers against a seeded stand-in database.")
+    parser.add_argument("--url", required=True, help="SQLAlchemy URL of a scratch database")
+    parser.add_argument("--scale", default="small", choices=["small", "prod"])
+    parser.add_argument("--set", action="append", default=[], metavar="SIZE=N",
+                        help="override one generator size, e.g. --set values=200000")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--only", help="run cases whose name contains this text")
+    parser.add_argument("--reuse", action="store_true", help="the database is already seeded with these settings")
+    parser.add_argument("--json", help="write results here")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed median slowdown for --compare")
+    args = parser.parse_args(argv)
+
+    sizes = resolve_sizes(args.scale, dict(s.split("=", 1) for s in args.set))
+    engine = create_engine_for_url(args.url)
+
+    seeded_in = None
+    if not args.reuse:
+        if inspect(engine).has_table("category", schema="dbo"):
+            raise SystemExit("dbo.category already exists; use an empty scratch database or --reuse.")
+        migrate(engine)
+        started = time.perf_counter()
+        load(engine, generate(sizes, args.seed))
+        seeded_in = round(time.perf_counter() - started, 1)
+        print(f"seeded {args.scale} {sizes} in {seeded_in}s")
+
+    statements = _statement_counter(engine)
+    results = []
+    for case in build_cases(engine, sizes, args.seed):
+        if args.only and args.only not in case.name:
+            continue
+        result = time_case(case, args.repeat, statements)
+        results.append(result)
+        print(f"{result['group']:<16} {result['name']:<40} median {result['medianMs']:>9.2f} ms  "
+              f"p95 {result['p95Ms']:>9.2f} ms  stmts {result['statements']:>6}")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "dialect": engine.dialect.name,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "scale": args.scale,
+            "sizes": sizes,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "seededSeconds": seeded_in,
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+# helpers/db.py
+import os
+import threading
+import time
+import urllib.parse
+
+import streamlit as st
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+from helpers.dialect import create_engine_for_url
+from helpers.migrations import migrate
+from helpers.query_stats import diagnostics_settings, install_query_stats
+
+# -----------------------------
+# Connection (Windows Auth-friendly)
+# -----------------------------
+def _build_sqlalchemy_url():
+    cfg = st.secrets["sqlserver"]
+    driver = cfg.get("driver", "ODBC Driver 18 for SQL Server")
+    parts = [
+        f"DRIVER={{{driver}}}",
+        f"SERVER={cfg['server']}",
+        f"DATABASE={cfg['database']}",
+        f"Encrypt={cfg.get('encrypt','no')}",
+        f"TrustServerCertificate={cfg.get('trust_server_certificate','yes')}",
+    ]
+    if cfg.get("windows_auth", True):
+        parts.append("Trusted_Connection=yes")  # Integrated Security
+    else:
+        parts += [f"UID={cfg['username']}", f"PWD={cfg['password']}"]
+    odbc = ";".join(parts) + ";"
+    return "mssql+pyodbc:///?odbc_connect=" + urllib.parse.quote_plus(odbc)
+
+
+def _db_settings():
+    # [embedded] (SQLite/DuckDB file, see helpers/dialect.py) wins over [sqlserver]
+    return st.secrets["embedded"] if "embedded" in st.secrets else st.secrets["sqlserver"]
+
+
+def _database_url() -> str:
+    return st.secrets["embedded"]["url"] if "embedded" in st.secrets else _build_sqlalchemy_url()
+
+
+def database_label() -> str:
+    """Database name shown in page footers."""
+    if "embedded" in st.secrets:
+        return os.path.basename(make_url(st.secrets["embedded"]["url"]).database or "") or ":memory:"
+    return st.secrets["sqlserver"]["database"]
+
+
+def _pool_settings() -> dict:
+    # All optional, under [sqlserver] (or [embedded]) in secrets.toml
+    cfg = _db_settings()
+    pool_size = int(cfg.get("pool_size", 10))
+    return {
+        "pool_size": pool_size,
+        "max_overflow": int(cfg.get("max_overflow", 20)),
+        "pool_timeout": float(cfg.get("pool_timeout", 30)),
+        "pool_recycle": int(cfg.get("pool_recycle", 1800)),
+        "validate_idle_seconds": float(cfg.get("validate_idle_seconds", 300)),
+        "warm_connections": int(cfg.get("warm_connections", pool_size)),
+    }
+
+# -----------------------------
+# Pool instrumentation
+# -----------------------------
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def reset_pool_stats():
+    with _stats_lock:
+        _stats.update(
+            checkouts=0,
+            wait_seconds_total=0.0,
+            wait_seconds_max=0.0,
+            saturated_checkouts=0,  # requested while every pooled connection was busy
+            timeouts=0,
+            peak_checked_out=0,
+            idle_validations=0,
+            stale_discarded=0,
+        )
+
+
+reset_pool_stats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait for a connection."""
+
+    def connect(self):
+        saturated = self.checkedout() >= self.size()
+        start = time.perf_counter()
+        try:
+            conn = super().connect()
+        except exc.TimeoutError:
+            with _stats_lock:
+                _stats["timeouts"] += 1
+            raise
+        waited = time.perf_counter() - start
+        checked_out = self.checkedout()
+        with _stats_lock:
+            _stats["checkouts"] += 1
+            _stats["wait_seconds_total"] += waited
+            _stats["wait_seconds_max"] = max(_stats["wait_seconds_max"], waited)
+            _stats["peak_checked_out"] = max(_stats["peak_checked_out"], checked_out)
+            if saturated:
+                _stats["saturated_checkouts"] += 1
+        return conn
+
+
+def _install_idle_validation(pool, idle_seconds: float):
+    # Replaces pool_pre_ping: only connections that sat idle past the threshold
+    # are pinged; raising DisconnectionError makes the pool retry with a new one.
+    @event.listens_for(pool, "connect")
+    def _on_connect(dbapi_conn, record):
+        record.info["last_used"] = time.monotonic()
+
+    @event.listens_for(pool, "checkin")
+    def _on_checkin(dbapi_conn, record):
+        if record is not None:
+            record.info["last_used"] = time.monotonic()
+
+    @event.listens_for(pool, "checkout")
+    def _on_checkout(dbapi_conn, record, proxy):
+        last = record.info.get("last_used")
+        if last is None or time.monotonic() - last < idle_seconds:
+            return
+        with _stats_lock:
+            _stats["idle_validations"] += 1
+        cur = dbapi_conn.cursor()
+        try:
+            cur.execute("SELECT 1")
+            cur.fetchall()
+        except Exception:
+            with _stats_lock:
+                _stats["stale_discarded"] += 1
+            raise exc.DisconnectionError("idle connection failed validation")
+        finally:
+            try:
+                cur.close()
+            except Exception:
+                pass
+
+
+def _warm(engine, count: int):
+    conns = []
+    try:
+        for _ in range(count):
+            conns.append(engine.raw_connection())
+    except exc.DBAPIError:
+        pass  # the first real query will surface the error
+    finally:
+        for c in conns:
+            c.close()
+
+
+def create_app_engine():
+    """A new pooled engine; pages use get_engine(), the command-line jobs use this."""
+    settings = _pool_settings()
+    engine = create_engine_for_url(
+        _database_url(),
+        poolclass=InstrumentedQueuePool,
+        pool_size=settings["pool_size"],
+        max_overflow=settings["max_overflow"],
+        pool_timeout=settings["pool_timeout"],
+        pool_recycle=settings["pool_recycle"],
+    )
+    _install_idle_validation(engine.pool, settings["validate_idle_seconds"])
+    if isinstance(engine.pool, QueuePool):  # in-memory embedded databases share one connection
+        _warm(engine, min(settings["warm_connections"], settings["pool_size"]))
+    reset_pool_stats()
+    return engine
+
+
+@st.cache_resource(show_spinner=False)
+def get_engine():
+    """The one engine (and pool) shared by every page and session in this process.
+
+    Pending schema migrations are applied here, once per process, so no page
+    runs DDL on its render path. Statement instrumentation (helpers/query_stats.py)
+    is installed after migrating, so only page traffic is recorded.
+    """
+    engine = create_app_engine()
+    if str(_db_settings().get("auto_migrate", True)).lower() not in ("false", "0", "no"):
+        migrate(engine)
+    if diagnostics_settings()["query_stats"]:
+        install_query_stats(engine)
+    return engine
+
+
+def pool_stats() -> dict:
+    pool = get_engine().pool
+    with _stats_lock:
+        stats = dict(_stats)
+    queued = isinstance(pool, QueuePool)
+    stats.update(
+        pool_size=pool.size() if queued else 1,
+        checked_out=pool.checkedout() if queued else 0,
+        checked_in=pool.checkedin() if queued else 1,
+        overflow=pool.overflow() if queued else 0,
+        avg_wait_ms=(1000.0 * stats["wait_seconds_total"] / stats["checkouts"]) if stats["checkouts"] else 0.0,
+    )
+    return stats
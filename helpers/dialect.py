@@ -0,0 +1,390 @@
+# helpers/dialect.py
+"""SQL that SQL Server, SQLite and DuckDB spell differently.
+
+Helpers and pages keep one query text each and ask dialect_for(engine) for the
+fragments that differ: row limits, JSON id lists, RETURNING, upserts, ordered
+string aggregation, checksums, temp tables and statistics. The embedded
+engines address tables as dbo.<table> like SQL Server does: SQLite attaches its
+file under the schema name dbo, DuckDB creates a dbo schema.
+
+    [embedded]                                  # in secrets.toml, instead of [sqlserver]
+    url = "sqlite:///data/pillars.db"           # or "duckdb:///data/pillars.duckdb"
+
+Writes whose SQL Server form depends on MERGE ... OUTPUT $action or table
+variables keep that form there; on the embedded engines the helpers run the
+same change as a few set-based statements in one transaction.
+"""
+import abc
+import os
+import zlib
+from typing import List, Sequence
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import StaticPool
+
+SCHEMA = "dbo"
+
+
+class Dialect:
+    """SQL Server (T-SQL); the reference every other dialect matches."""
+
+    name = "mssql"
+    embedded = False
+    now = "GETDATE()"
+    count_big = "COUNT_BIG(*)"
+    update_statistics = "EXEC sp_updatestats;"
+
+    # -- queries --------------------------------------------------------------
+    def top(self, n="(:limit)") -> str:
+        """Row limit after SELECT (empty where the limit goes at the end)."""
+        return f"TOP {n}"
+
+    def limit(self, n=":limit") -> str:
+        """Row limit after ORDER BY (empty where it goes after SELECT)."""
+        return ""
+
+    def id_list(self, param: str = "ids") -> str:
+        """Subquery over the ints of a JSON array parameter ('[1,2,3]')."""
+        return f"SELECT CAST(value AS int) FROM OPENJSON(:{param})"
+
+    def int_div(self, a: str, b: str) -> str:
+        return f"({a}) / {b}"
+
+    def trimmed_name(self, column: str) -> str:
+        """column without surrounding spaces, for name lookups.
+
+        The expression, not the trimmed column: SQL Server matches it to the
+        columnTrimmed index once migration 7 is applied and works without it.
+        """
+        return f"LTRIM(RTRIM({column}))"
+
+    def seconds_before(self, expr: str, seconds: int) -> str:
+        """Timestamp expr moved back by a whole number of seconds."""
+        return f"DATEADD(second, -{int(seconds)}, {expr})"
+
+    def fold(self, expr: str) -> str:
+        """expr as compared under SQL Server's case-insensitive collation."""
+        return expr
+
+    def concat(self, *parts: str) -> str:
+        """String concatenation treating NULL as '' (T-SQL CONCAT semantics)."""
+        return f"CONCAT({', '.join(parts)})"
+
+    def string_agg(self, expr: str, sep: str, order_by: str) -> str:
+        """Ordered string aggregate; NULL inputs are skipped, no rows gives NULL."""
+        return f"STRING_AGG({expr}, {sep}) WITHIN GROUP (ORDER BY {order_by})"
+
+    def checksum_agg(self, columns: str) -> str:
+        """Order-independent integer checksum over the rows' columns."""
+        return f"CHECKSUM_AGG(BINARY_CHECKSUM({columns}))"
+
+    def rowcount(self, result) -> int:
+        """Rows affected by an INSERT/UPDATE/DELETE result."""
+        return max(result.rowcount, 0)
+
+    # -- writes ---------------------------------------------------------------
+    def insert_returning(self, table: str, columns: str, values: str, returning: str = "id") -> str:
+        return f"INSERT INTO {table} ({columns}) OUTPUT INSERTED.{returning} VALUES ({values});"
+
+    def upsert(self, table: str, keys: Sequence[str], columns: Sequence[str], source: str,
+               touch: Sequence[str] = ("dateAdded",)) -> str:
+        """Insert source rows, updating non-key columns (and stamping touch) where the keys exist.
+
+        source is a SELECT yielding every name in columns.
+        """
+        on = " AND ".join(f"tgt.{k} = src.{k}" for k in keys)
+        sets = [f"{c} = src.{c}" for c in columns if c not in keys] + [f"{c} = {self.now}" for c in touch]
+        return f"""
+            MERGE {table} AS tgt
+            USING ({source}) AS src
+            ON ({on})
+            WHEN MATCHED THEN UPDATE
+                SET {', '.join(sets)}
+            WHEN NOT MATCHED THEN
+                INSERT ({', '.join(columns)})
+                VALUES ({', '.join(f'src.{c}' for c in columns)});
+        """
+
+    # -- temp tables ----------------------------------------------------------
+    # Declared on temp text columns joined to dbo columns: they would otherwise take
+    # tempdb's collation, which need not match the database's
+    temp_collate = " COLLATE DATABASE_DEFAULT"
+
+    def temp(self, name: str) -> str:
+        return f"#{name}"
+
+    def create_temp(self, name: str, columns: str) -> List[str]:
+        """(Re)create a connection-scoped temp table; one statement per entry."""
+        return [f"IF OBJECT_ID('tempdb..#{name}') IS NOT NULL DROP TABLE #{name};",
+                f"CREATE TABLE #{name} ({columns});"]
+
+    def drop_temp(self, name: str) -> str:
+        return f"DROP TABLE #{name};"
+
+    # -- bulk loads -----------------------------------------------------------
+    def sync_identity(self, table: str, max_id: int) -> List[str]:
+        """Statements that move a table's id generator past explicitly inserted ids."""
+        return []
+
+
+class EmbeddedDialect(Dialect, abc.ABC):
+    """What SQLite and DuckDB share."""
+
+    embedded = True
+    count_big = "COUNT(*)"
+    update_statistics = "ANALYZE;"
+    create_schema: Sequence[str] = ()
+    # Declared on name, userName and dataSource columns: SQL Server's default collation
+    # is case-insensitive, the embedded engines' is not
+    nocase = " COLLATE NOCASE"
+    temp_collate = ""
+
+    def top(self, n="(:limit)") -> str:
+        return ""
+
+    def limit(self, n=":limit") -> str:
+        return f"LIMIT {n}"
+
+    def trimmed_name(self, column: str) -> str:
+        # The generated column is declared with the table, not by migration 7
+        return f"{column}Trimmed"
+
+    def insert_returning(self, table: str, columns: str, values: str, returning: str = "id") -> str:
+        return f"INSERT INTO {table} ({columns}) VALUES ({values}) RETURNING {returning};"
+
+    def upsert(self, table: str, keys: Sequence[str], columns: Sequence[str], source: str,
+               touch: Sequence[str] = ("dateAdded",)) -> str:
+        sets = [f"{c} = excluded.{c}" for c in columns if c not in keys] + [f"{c} = {self.now}" for c in touch]
+        # WHERE true: SQLite would otherwise read ON CONFLICT as a join constraint
+        return f"""
+            INSERT INTO {table} ({', '.join(columns)})
+            SELECT {', '.join(columns)} FROM ({source}) AS src WHERE true
+            ON CONFLICT ({', '.join(keys)}) DO UPDATE
+                SET {', '.join(sets)};
+        """
+
+    def temp(self, name: str) -> str:
+        return f"temp.{name}"
+
+    def create_temp(self, name: str, columns: str) -> List[str]:
+        return [f"DROP TABLE IF EXISTS temp.{name};", f"CREATE TEMP TABLE {name} ({columns});"]
+
+    def drop_temp(self, name: str) -> str:
+        return f"DROP TABLE IF EXISTS temp.{name};"
+
+    # -- DDL (migrations) -----------------------------------------------------
+    @abc.abstractmethod
+    def identity(self, table: str) -> str:
+        """Column type and constraints of an auto-assigned int primary key."""
+
+    def sequence(self, table: str) -> List[str]:
+        """Statements creating what identity() draws ids from, if anything."""
+        return []
+
+    @abc.abstractmethod
+    def references(self, table: str, column: str = "id", cascade: bool = False) -> str:
+        """Foreign key clause to dbo.table(column)."""
+
+    def trimmed(self, column: str, source: str, sql_type: str) -> str:
+        """Generated LTRIM(RTRIM(source)) column (SQL Server: PERSISTED computed column)."""
+        return f"{column} {sql_type} GENERATED ALWAYS AS (LTRIM(RTRIM({source}))) VIRTUAL"
+
+    @abc.abstractmethod
+    def create_index(self, name: str, table: str, columns: str, unique: bool = False) -> str:
+        """CREATE [UNIQUE] INDEX IF NOT EXISTS on dbo.table; columns may be expressions."""
+
+
+class SQLiteDialect(EmbeddedDialect):
+    name = "sqlite"
+    now = "CURRENT_TIMESTAMP"
+
+    def id_list(self, param: str = "ids") -> str:
+        return f"SELECT CAST(value AS INTEGER) FROM json_each(:{param})"
+
+    def seconds_before(self, expr: str, seconds: int) -> str:
+        # Same 'YYYY-MM-DD HH:MM:SS' text as CURRENT_TIMESTAMP, so comparisons stay lexical
+        return f"datetime({expr}, '-{int(seconds)} seconds')"
+
+    def concat(self, *parts: str) -> str:
+        return " || ".join(f"IFNULL({p}, '')" for p in parts)
+
+    def string_agg(self, expr: str, sep: str, order_by: str) -> str:
+        # group_concat() has no ORDER BY before SQLite 3.44; see _OrderedGroupConcat
+        return f"ordered_group_concat({expr}, {sep}, {order_by})"
+
+    def checksum_agg(self, columns: str) -> str:
+        return f"checksum_agg({columns})"
+
+    def identity(self, table: str) -> str:
+        return "INTEGER PRIMARY KEY"  # rowid alias: ids are assigned max(id) + 1
+
+    def trimmed(self, column: str, source: str, sql_type: str) -> str:
+        # A generated column does not inherit its source's collation
+        return f"{column} {sql_type}{self.nocase} GENERATED ALWAYS AS (LTRIM(RTRIM({source}))) VIRTUAL"
+
+    def references(self, table: str, column: str = "id", cascade: bool = False) -> str:
+        # Unqualified: FKs cannot cross attached databases
+        return f"REFERENCES {table}({column}){' ON DELETE CASCADE' if cascade else ''}"
+
+    def create_index(self, name: str, table: str, columns: str, unique: bool = False) -> str:
+        return f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {SCHEMA}.{name} ON {table}({columns});"
+
+
+class DuckDBDialect(EmbeddedDialect):
+    name = "duckdb"
+    # CURRENT_TIMESTAMP is rejected inside ON CONFLICT DO UPDATE; the cast keeps
+    # values naive like the TIMESTAMP columns (TIMESTAMPTZ needs pytz to fetch)
+    now = "CAST(now() AS TIMESTAMP)"
+    create_schema = (f"CREATE SCHEMA IF NOT EXISTS {SCHEMA};",)
+
+    def id_list(self, param: str = "ids") -> str:
+        return f"SELECT unnest(CAST(:{param} AS INTEGER[]))"
+
+    def int_div(self, a: str, b: str) -> str:
+        return f"({a}) // {b}"
+
+    def seconds_before(self, expr: str, seconds: int) -> str:
+        return f"CAST({expr} AS TIMESTAMP) - INTERVAL {int(seconds)} SECOND"
+
+    def fold(self, expr: str) -> str:
+        # NOCASE columns compare case-insensitively, but generated columns cannot be
+        # declared NOCASE and indexes (unique ones included) ignore the collation
+        return f"lower({expr})"
+
+    def concat(self, *parts: str) -> str:
+        return f"concat({', '.join(parts)})"
+
+    def string_agg(self, expr: str, sep: str, order_by: str) -> str:
+        return f"string_agg({expr}, {sep} ORDER BY {order_by})"
+
+    def checksum_agg(self, columns: str) -> str:
+        return f"bit_xor(hash({columns}))"
+
+    def rowcount(self, result) -> int:
+        # duckdb_engine reports -1; DuckDB returns the count as a one-row result
+        row = result.fetchone() if result.returns_rows else None
+        return int(row[0]) if row else 0
+
+    def identity(self, table: str) -> str:
+        return f"INTEGER PRIMARY KEY DEFAULT nextval('{SCHEMA}.seq_{table}')"
+
+    def sequence(self, table: str) -> List[str]:
+        return [f"CREATE SEQUENCE IF NOT EXISTS {SCHEMA}.seq_{table};"]
+
+    def references(self, table: str, column: str = "id", cascade: bool = False) -> str:
+        # No ON DELETE CASCADE in DuckDB: deletes remove children explicitly
+        return f"REFERENCES {SCHEMA}.{table}({column})"
+
+    def create_index(self, name: str, table: str, columns: str, unique: bool = False) -> str:
+        return f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {SCHEMA}.{table}({columns});"
+
+    def sync_identity(self, table: str, max_id: int) -> List[str]:
+        return [f"SELECT max(nextval('{SCHEMA}.seq_{table}')) FROM range({int(max_id)});"] if max_id > 0 else []
+
+
+_DIALECTS = {d.name: d for d in (Dialect(), SQLiteDialect(), DuckDBDialect())}
+
+
+def dialect_for(engine) -> Dialect:
+    """The Dialect of an Engine or Connection."""
+    name = engine.dialect.name
+    if name not in _DIALECTS:
+        raise ValueError(f"unsupported database dialect '{name}' (expected one of {', '.join(_DIALECTS)})")
+    return _DIALECTS[name]
+
+
+# -----------------------------
+# SQLite functions (T-SQL aggregates the helpers rely on)
+# -----------------------------
+class _OrderedGroupConcat:
+    """ordered_group_concat(expr, sep, order_key): STRING_AGG ... WITHIN GROUP (ORDER BY order_key)."""
+
+    def __init__(self):
+        self.items, self.sep = [], ","
+
+    def step(self, value, sep, key):
+        self.sep = sep
+        if value is not None:
+            self.items.append((key is None, key, value))
+
+    def finalize(self):
+        return self.sep.join(str(v) for _, _, v in sorted(self.items, key=lambda t: t[:2])) if self.items else None
+
+
+class _ChecksumAgg:
+    """checksum_agg(col, ...): XOR of per-row CRC32s, like CHECKSUM_AGG(BINARY_CHECKSUM(...))."""
+
+    def __init__(self):
+        self.value = 0
+
+    def step(self, *columns):
+        self.value ^= zlib.crc32(repr(columns).encode("utf-8"))
+
+    def finalize(self):
+        return self.value
+
+
+def _register_sqlite_functions(dbapi_conn):
+    dbapi_conn.create_aggregate("ordered_group_concat", 3, _OrderedGroupConcat)
+    dbapi_conn.create_aggregate("checksum_agg", -1, _ChecksumAgg)
+
+
+# -----------------------------
+# Engines
+# -----------------------------
+_POOL_ARGS = ("poolclass", "pool_size", "max_overflow", "pool_timeout", "pool_recycle")
+
+
+def _sqlite_engine(url, **kwargs):
+    path = url.database or ":memory:"
+    if path == ":memory:":
+        # One shared connection; the pool arguments do not apply
+        kwargs = {k: v for k, v in kwargs.items() if k not in _POOL_ARGS}
+        kwargs["poolclass"] = StaticPool
+    else:
+        path = os.path.abspath(path)
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, **kwargs)
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, record):
+        # Autocommit at the driver; SQLAlchemy's begin below makes transactions
+        # explicit, so DDL and multi-statement writes roll back as on SQL Server.
+        dbapi_conn.isolation_level = None
+        dbapi_conn.execute(f"ATTACH DATABASE ? AS {SCHEMA}", (path,))
+        dbapi_conn.execute("PRAGMA foreign_keys = ON")
+        _register_sqlite_functions(dbapi_conn)
+
+    @event.listens_for(engine, "begin")
+    def _on_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    return engine
+
+
+def _duckdb_engine(url, **kwargs):
+    if (url.database or ":memory:") == ":memory:":
+        kwargs = {k: v for k, v in kwargs.items() if k not in _POOL_ARGS}
+        kwargs["poolclass"] = StaticPool
+    engine = create_engine(url, **kwargs)
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, record):
+        for stmt in DuckDBDialect.create_schema:
+            dbapi_conn.execute(stmt)
+
+    return engine
+
+
+def create_engine_for_url(url: str, **kwargs):
+    """create_engine() plus what each dialect needs (SQLite attach/functions, DuckDB schema)."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "sqlite":
+        return _sqlite_engine(parsed, **kwargs)
+    if backend == "duckdb":
+        return _duckdb_engine(parsed, **kwargs)
+    if backend == "mssql":
+        kwargs.setdefault("fast_executemany", True)
+    return create_engine(parsed, **kwargs)
+
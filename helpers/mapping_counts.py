@@ -0,0 +1,105 @@
+# helpers/mapping_counts.py
+"""Maintained mapping counters (pillarNode.mappingCount, pillarNodeValue.mappingCount).
+
+add_mappings()/remove_mappings() adjust the counters in the same transaction
+as the mapping write, so listings and delete guards read one column instead of
+counting dbo.pillarNodeValueMapping. Writes that bypass those helpers cause
+drift; the reconciliation job recounts and fixes only the rows that differ.
+
+    python -m helpers.mapping_counts            # reconcile
+"""
+import argparse
+import json
+import time
+
+from sqlalchemy import text
+
+from helpers.dialect import dialect_for
+
+# -----------------------------
+# Reconciliation
+# -----------------------------
+RECONCILE_VALUES_SQL = """
+    UPDATE v
+    SET mappingCount = COALESCE(c.cnt, 0)
+    FROM dbo.pillarNodeValue v
+    LEFT JOIN (
+        SELECT pillarNodeValue_id, COUNT(*) AS cnt
+        FROM dbo.pillarNodeValueMapping
+        GROUP BY pillarNodeValue_id
+    ) c ON c.pillarNodeValue_id = v.id
+    WHERE v.mappingCount <> COALESCE(c.cnt, 0);
+"""
+
+RECONCILE_NODES_SQL = """
+    UPDATE n
+    SET mappingCount = COALESCE(c.cnt, 0)
+    FROM dbo.pillarNode n
+    LEFT JOIN (
+        SELECT pillarNode_id, COUNT(*) AS cnt
+        FROM dbo.pillarNodeValueMapping
+        GROUP BY pillarNode_id
+    ) c ON c.pillarNode_id = n.id
+    WHERE n.mappingCount <> COALESCE(c.cnt, 0);
+"""
+
+# SQLite/DuckDB: UPDATE ... FROM names the target table, not an alias
+RECONCILE_PORTABLE_SQL = """
+    UPDATE dbo.{table}
+    SET mappingCount = c.cnt
+    FROM (
+        SELECT t.id, COUNT(m.{fk}) AS cnt
+        FROM dbo.{table} t
+        LEFT JOIN dbo.pillarNodeValueMapping m ON m.{fk} = t.id
+        GROUP BY t.id
+    ) c
+    WHERE c.id = dbo.{table}.id AND dbo.{table}.mappingCount <> c.cnt;
+"""
+
+
+def reconcile_mapping_counts(engine) -> dict:
+    """Recount both counters from dbo.pillarNodeValueMapping. Returns rows fixed per table."""
+    started = time.perf_counter()
+    d = dialect_for(engine)
+    if d.embedded:
+        values_sql = RECONCILE_PORTABLE_SQL.format(table="pillarNodeValue", fk="pillarNodeValue_id")
+        nodes_sql = RECONCILE_PORTABLE_SQL.format(table="pillarNode", fk="pillarNode_id")
+    else:
+        values_sql, nodes_sql = RECONCILE_VALUES_SQL, RECONCILE_NODES_SQL
+    with engine.begin() as cx:
+        values_fixed = d.rowcount(cx.execute(text(values_sql)))
+        nodes_fixed = d.rowcount(cx.execute(text(nodes_sql)))
+    return {
+        "valuesFixed": values_fixed,
+        "nodesFixed": nodes_fixed,
+        "durationMs": int((time.perf_counter() - started) * 1000),
+    }
+
+
+# -----------------------------
+# Point lookups
+# -----------------------------
+def mapping_count_for_node(engine, node_id: int) -> int:
+    with engine.begin() as cx:
+        row = cx.execute(text("SELECT mappingCount FROM dbo.pillarNode WHERE id = :id;"), {"id": int(node_id)}).fetchone()
+    return int(row[0]) if row else 0
+
+
+def mapping_count_for_value(engine, value_id: int) -> int:
+    with engine.begin() as cx:
+        row = cx.execute(text("SELECT mappingCount FROM dbo.pillarNodeValue WHERE id = :id;"), {"id": int(value_id)}).fetchone()
+    return int(row[0]) if row else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reconcile the maintained mapping counters.")
+    parser.parse_args(argv)
+
+    from helpers.db import create_app_engine
+
+    engine = create_app_engine()
+    print(json.dumps(reconcile_mapping_counts(engine)))
+
+
+if __name__ == "__main__":
+    main()
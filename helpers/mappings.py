@@ -0,0 +1,171 @@
+# helpers/mappings.py
+from typing import Iterable, Tuple
+
+from sqlalchemy import bindparam, text
+
+from helpers.dialect import dialect_for
+from helpers.taxonomy import invalidate_taxonomy
+
+
+# -----------------------------
+# Bulk mapping writes (pillarNode ↔ pillarNodeValue)
+# -----------------------------
+# Each DELETE touches at most this many rows, which keeps it under SQL Server's
+# 5,000-lock escalation threshold (and the 2,100-parameter limit of the IN list).
+REMOVE_CHUNK_SIZE = 2000
+
+
+def _distinct_ids(value_ids: Iterable[int]) -> list:
+    return sorted({int(v) for v in value_ids})
+
+
+def add_mappings(engine, node_id: int, value_ids: Iterable[int]) -> Tuple[int, int]:
+    """Map all value ids to the node in one set-based insert.
+
+    Ids are staged in a temp table with a single fast_executemany batch, then
+    one anti-join INSERT adds the missing pairs. Returns (inserted, already_mapped),
+    both counted exactly from OUTPUT (RETURNING on SQLite/DuckDB). Ids that no
+    longer exist in dbo.pillarNodeValue are ignored.
+    """
+    ids = _distinct_ids(value_ids)
+    if not ids:
+        return 0, 0
+    d = dialect_for(engine)
+    with engine.begin() as cx:
+        for stmt in d.create_temp("mapIds", "pillarNodeValue_id int NOT NULL PRIMARY KEY"):
+            cx.execute(text(stmt))
+        cx.execute(
+            text(f"INSERT INTO {d.temp('mapIds')} (pillarNodeValue_id) VALUES (:vid);"),
+            [{"vid": v} for v in ids],
+        )
+        if d.embedded:
+            inserted, already = _add_staged_portable(cx, d, int(node_id))
+        else:
+            inserted, already = _add_staged_mssql(cx, int(node_id))
+        cx.execute(text(d.drop_temp("mapIds")))
+    if inserted:
+        invalidate_taxonomy()
+    return inserted, already
+
+
+def _add_staged_mssql(cx, node_id: int) -> Tuple[int, int]:
+    row = cx.execute(
+        text("""
+            SET NOCOUNT ON;
+            DECLARE @inserted TABLE (pillarNodeValue_id int NOT NULL);
+
+            INSERT INTO dbo.pillarNodeValueMapping (pillarNode_id, pillarNodeValue_id)
+            OUTPUT INSERTED.pillarNodeValue_id INTO @inserted
+            SELECT :nid, t.pillarNodeValue_id
+            FROM #mapIds t
+            JOIN dbo.pillarNodeValue v ON v.id = t.pillarNodeValue_id
+            WHERE NOT EXISTS (
+                SELECT 1 FROM dbo.pillarNodeValueMapping m WITH (UPDLOCK, HOLDLOCK)
+                WHERE m.pillarNode_id = :nid AND m.pillarNodeValue_id = t.pillarNodeValue_id
+            );
+
+            -- Maintained counters move with the rows (see helpers/mapping_counts.py)
+            UPDATE dbo.pillarNode
+            SET mappingCount = mappingCount + (SELECT COUNT(*) FROM @inserted)
+            WHERE id = :nid;
+            UPDATE v
+            SET mappingCount = v.mappingCount + 1
+            FROM dbo.pillarNodeValue v
+            JOIN @inserted i ON i.pillarNodeValue_id = v.id;
+
+            SELECT (SELECT COUNT(*) FROM @inserted) AS inserted,
+                   (SELECT COUNT(*)
+                    FROM #mapIds t
+                    JOIN dbo.pillarNodeValueMapping m
+                      ON m.pillarNode_id = :nid AND m.pillarNodeValue_id = t.pillarNodeValue_id
+                    WHERE NOT EXISTS (SELECT 1 FROM @inserted i
+                                      WHERE i.pillarNodeValue_id = t.pillarNodeValue_id)) AS alreadyMapped;
+        """),
+        {"nid": node_id},
+    ).fetchone()
+    return int(row[0]), int(row[1])
+
+
+def _add_staged_portable(cx, d, node_id: int) -> Tuple[int, int]:
+    # Same statement sequence as the T-SQL batch, with RETURNING in place of OUTPUT INTO
+    inserted = [int(r[0]) for r in cx.execute(text(f"""
+        INSERT INTO dbo.pillarNodeValueMapping (pillarNode_id, pillarNodeValue_id)
+        SELECT :nid, t.pillarNodeValue_id
+        FROM {d.temp('mapIds')} t
+        JOIN dbo.pillarNodeValue v ON v.id = t.pillarNodeValue_id
+        WHERE NOT EXISTS (
+            SELECT 1 FROM dbo.pillarNodeValueMapping m
+            WHERE m.pillarNode_id = :nid AND m.pillarNodeValue_id = t.pillarNodeValue_id
+        )
+        RETURNING pillarNodeValue_id;
+    """), {"nid": node_id}).fetchall()]
+    _move_counters(cx, node_id, inserted, +1)
+    mapped = int(cx.execute(text(f"""
+        SELECT COUNT(*)
+        FROM {d.temp('mapIds')} t
+        JOIN dbo.pillarNodeValueMapping m
+          ON m.pillarNode_id = :nid AND m.pillarNodeValue_id = t.pillarNodeValue_id;
+    """), {"nid": node_id}).scalar())
+    return len(inserted), mapped - len(inserted)
+
+
+def _move_counters(cx, node_id: int, value_ids: list, delta: int):
+    """Maintained counters move with the rows (see helpers/mapping_counts.py)."""
+    if not value_ids:
+        return
+    cx.execute(text("UPDATE dbo.pillarNode SET mappingCount = mappingCount + :n WHERE id = :nid;"),
+               {"n": delta * len(value_ids), "nid": node_id})
+    stmt = text("UPDATE dbo.pillarNodeValue SET mappingCount = mappingCount + :d WHERE id IN :vids;"
+                ).bindparams(bindparam("vids", expanding=True))
+    for i in range(0, len(value_ids), REMOVE_CHUNK_SIZE):
+        cx.execute(stmt, {"d": delta, "vids": value_ids[i:i + REMOVE_CHUNK_SIZE]})
+
+
+def remove_mappings(engine, node_id: int, value_ids: Iterable[int]) -> int:
+    """Delete the node's mappings for the given value ids. Returns rows actually deleted."""
+    ids = _distinct_ids(value_ids)
+    if not ids:
+        return 0
+    if dialect_for(engine).embedded:
+        return _remove_portable(engine, int(node_id), ids)
+    stmt = text("""
+        SET NOCOUNT ON;
+        DECLARE @deleted TABLE (pillarNodeValue_id int NOT NULL);
+
+        DELETE FROM dbo.pillarNodeValueMapping
+        OUTPUT DELETED.pillarNodeValue_id INTO @deleted
+        WHERE pillarNode_id = :nid AND pillarNodeValue_id IN :vids;
+
+        UPDATE dbo.pillarNode
+        SET mappingCount = mappingCount - (SELECT COUNT(*) FROM @deleted)
+        WHERE id = :nid;
+        UPDATE v
+        SET mappingCount = v.mappingCount - 1
+        FROM dbo.pillarNodeValue v
+        JOIN @deleted d ON d.pillarNodeValue_id = v.id;
+
+        SELECT COUNT(*) FROM @deleted;
+    """).bindparams(bindparam("vids", expanding=True))
+    deleted = 0
+    with engine.begin() as cx:
+        for i in range(0, len(ids), REMOVE_CHUNK_SIZE):
+            deleted += int(cx.execute(stmt, {"nid": int(node_id), "vids": ids[i:i + REMOVE_CHUNK_SIZE]}).scalar())
+    if deleted:
+        invalidate_taxonomy()
+    return deleted
+
+
+def _remove_portable(engine, node_id: int, ids: list) -> int:
+    stmt = text("""
+        DELETE FROM dbo.pillarNodeValueMapping
+        WHERE pillarNode_id = :nid AND pillarNodeValue_id IN :vids
+        RETURNING pillarNodeValue_id;
+    """).bindparams(bindparam("vids", expanding=True))
+    deleted = []
+    with engine.begin() as cx:
+        for i in range(0, len(ids), REMOVE_CHUNK_SIZE):
+            deleted += [int(r[0]) for r in cx.execute(stmt, {"nid": node_id, "vids": ids[i:i + REMOVE_CHUNK_SIZE]})]
+        _move_counters(cx, node_id, deleted, -1)
+    if deleted:
+        invalidate_taxonomy()
+    return len(deleted)
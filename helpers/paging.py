@@ -0,0 +1,59 @@
+# helpers/paging.py
+"""Keyset pagination for the listing panes.
+
+A page is "the next N rows after cursor (sort value, id)" in (sort, id) order,
+so its cost is one index seek + N rows however deep the user pages. The pager
+keeps the stack of page-start cursors in session state; Previous pops it.
+"""
+from typing import Optional, Tuple
+
+import pandas as pd
+import streamlit as st
+from sqlalchemy import text
+
+PAGE_SIZE = 50
+
+
+def keyset_clause(sort_col: str, id_col: str, after: Optional[tuple]) -> Tuple[str, dict]:
+    """WHERE fragment for rows after the cursor (SQL Server has no row-value comparison)."""
+    if after is None:
+        return "1 = 1", {}
+    return (f"({sort_col} > :k_sort OR ({sort_col} = :k_sort AND {id_col} > :k_id))",
+            {"k_sort": after[0], "k_id": int(after[1])})
+
+
+def fetch_page(engine, sql: str, params: dict, page_size: int = PAGE_SIZE) -> Tuple[pd.DataFrame, bool]:
+    """Run a query limited to :limit rows (dialect.top()/limit()); returns (rows of this page, whether more follow)."""
+    with engine.begin() as cx:
+        df = pd.read_sql(text(sql), cx, params={**params, "limit": page_size + 1})
+    return df.iloc[:page_size], len(df) > page_size
+
+
+# -----------------------------
+# Pager state + controls
+# -----------------------------
+def page_cursor(key: str, scope) -> Optional[tuple]:
+    """The 'after' cursor of the current page; paging restarts whenever scope (node, filter…) changes."""
+    state = st.session_state.get(key)
+    if state is None or state["scope"] != scope:
+        state = {"scope": scope, "stack": [None]}
+        st.session_state[key] = state
+    return state["stack"][-1]
+
+
+def pager_controls(key: str, page: pd.DataFrame, has_next: bool, total_estimate: int,
+                   sort_col: str, id_col: str = "id", page_size: int = PAGE_SIZE):
+    # Buttons move the cursor in on_click, ahead of the rerun they trigger, so a pager
+    # inside an st.fragment reruns only that fragment
+    state = st.session_state[key]
+    page_no = len(state["stack"])
+    first = (page_no - 1) * page_size + 1 if len(page) else 0
+    last = (page_no - 1) * page_size + len(page)
+    tail = (page.iloc[-1][sort_col], int(page.iloc[-1][id_col])) if len(page) else None
+
+    c1, c2, c3 = st.columns([1, 3, 1])
+    c1.button("◀ Prev", key=f"{key}_prev", disabled=page_no == 1, use_container_width=True,
+              on_click=state["stack"].pop)
+    c2.caption(f"Page {page_no} · rows {first:,}–{last:,} of ~{total_estimate:,}")
+    c3.button("Next ▶", key=f"{key}_next", disabled=not has_next, use_container_width=True,
+              on_click=state["stack"].append, args=(tail,))
@@ -0,0 +1,153 @@
+# helpers/preferences.py
+from typing import Dict, Mapping, Optional, Tuple
+
+from sqlalchemy import text
+
+from helpers.dialect import dialect_for
+
+PREF_KEYS = ("userName", "pillarNode_id", "dataSource")
+PREF_COLUMNS = ("userName", "pillarNode_id", "pillarNodeValue_id", "dataSource")
+
+
+# -----------------------------
+# Change stamps
+# -----------------------------
+PROFILE_ROWS_SQL = """
+    SELECT DISTINCT userName, dataSource
+    FROM dbo.userNodePreference
+    WHERE userName = :u AND dataSource = :ds {nodes}
+"""
+
+
+def stamp_profile_change(cx, d, params: dict, nodes: str = ""):
+    """Stamp dbo.userNodePreferenceChange for a profile about to lose rows; call before the DELETE.
+
+    A deleted row leaves no dateAdded behind, so this stamp is what brings the
+    profile into the next incremental warning-hit refresh. nodes narrows the
+    rows (an AND clause); nothing is stamped when none match.
+    """
+    sql = d.upsert("dbo.userNodePreferenceChange", ("userName", "dataSource"), ("userName", "dataSource"),
+                   PROFILE_ROWS_SQL.format(nodes=nodes), touch=("changedAt",))
+    cx.execute(text(sql), params)
+
+
+# -----------------------------
+# Single-row writes
+# -----------------------------
+def upsert_pref(engine, user_name: str, data_source: str, node_id: int, value_id: int):
+    sql = dialect_for(engine).upsert(
+        "dbo.userNodePreference", PREF_KEYS, PREF_COLUMNS,
+        "SELECT :u AS userName, :nid AS pillarNode_id, :vid AS pillarNodeValue_id, :ds AS dataSource",
+    )
+    with engine.begin() as cx:
+        cx.execute(
+            text(sql),
+            {"u": user_name, "ds": data_source, "nid": int(node_id), "vid": int(value_id)}
+        )
+
+
+def clear_pref(engine, user_name: str, data_source: str, node_id: int):
+    params = {"u": user_name, "ds": data_source, "nid": int(node_id)}
+    with engine.begin() as cx:
+        stamp_profile_change(cx, dialect_for(engine), params, "AND pillarNode_id = :nid")
+        cx.execute(
+            text("""DELETE FROM dbo.userNodePreference
+                    WHERE userName = :u AND dataSource = :ds AND pillarNode_id = :nid;"""),
+            params
+        )
+
+
+# -----------------------------
+# Batch save
+# -----------------------------
+def diff_prefs(selections: Mapping[int, Optional[int]], pref_map: Mapping[int, int]) -> Dict[int, Optional[int]]:
+    """Rows that differ from the stored profile: node_id -> new value_id (None = clear)."""
+    changed: Dict[int, Optional[int]] = {}
+    for nid, vid in selections.items():
+        if vid is None:
+            if pref_map.get(nid) is not None:
+                changed[int(nid)] = None
+        elif pref_map.get(nid) != vid:
+            changed[int(nid)] = int(vid)
+    return changed
+
+
+SAVE_PREFS_MERGE_SQL = """
+    SET NOCOUNT ON;
+    DECLARE @actions TABLE (action nvarchar(10) NOT NULL);
+
+    MERGE dbo.userNodePreference AS tgt
+    USING #prefChanges AS src
+    ON (tgt.userName = :u AND tgt.dataSource = :ds AND tgt.pillarNode_id = src.pillarNode_id)
+    WHEN MATCHED AND src.pillarNodeValue_id IS NULL THEN DELETE
+    WHEN MATCHED AND tgt.pillarNodeValue_id <> src.pillarNodeValue_id THEN UPDATE
+        SET pillarNodeValue_id = src.pillarNodeValue_id, dateAdded = GETDATE()
+    WHEN NOT MATCHED BY TARGET AND src.pillarNodeValue_id IS NOT NULL THEN
+        INSERT (userName, pillarNode_id, pillarNodeValue_id, dataSource)
+        VALUES (:u, src.pillarNode_id, src.pillarNodeValue_id, :ds)
+    OUTPUT $action INTO @actions;
+
+    SELECT COALESCE(SUM(CASE WHEN action = 'UPDATE' THEN 1 ELSE 0 END), 0),
+           COALESCE(SUM(CASE WHEN action = 'INSERT' THEN 1 ELSE 0 END), 0),
+           COALESCE(SUM(CASE WHEN action = 'DELETE' THEN 1 ELSE 0 END), 0)
+    FROM @actions;
+"""
+
+
+def save_prefs(engine, user_name: str, data_source: str, changed: Mapping[int, Optional[int]]) -> Tuple[int, int, int]:
+    """Apply changed rows with one MERGE (three statements off SQL Server) in one transaction.
+
+    Returns (updated, inserted, cleared).
+    """
+    if not changed:
+        return 0, 0, 0
+    d = dialect_for(engine)
+    params = {"u": user_name, "ds": data_source}
+    with engine.begin() as cx:
+        for stmt in d.create_temp("prefChanges", "pillarNode_id int NOT NULL PRIMARY KEY, pillarNodeValue_id int NULL"):
+            cx.execute(text(stmt))
+        cx.execute(
+            text(f"INSERT INTO {d.temp('prefChanges')} (pillarNode_id, pillarNodeValue_id) VALUES (:nid, :vid);"),
+            [{"nid": int(nid), "vid": vid} for nid, vid in changed.items()],
+        )
+        if any(vid is None for vid in changed.values()):
+            stamp_profile_change(cx, d, params, f"""
+                AND pillarNode_id IN (SELECT pillarNode_id FROM {d.temp('prefChanges')}
+                                      WHERE pillarNodeValue_id IS NULL)""")
+        if d.embedded:
+            counts = _apply_staged_portable(cx, d, params)
+        else:
+            row = cx.execute(text(SAVE_PREFS_MERGE_SQL), params).fetchone()
+            counts = (int(row[0]), int(row[1]), int(row[2]))
+        cx.execute(text(d.drop_temp("prefChanges")))
+    return counts
+
+
+def _apply_staged_portable(cx, d, params: dict) -> Tuple[int, int, int]:
+    # The MERGE's three branches as separate statements over the same staged rows
+    staged = d.temp("prefChanges")
+    cleared = d.rowcount(cx.execute(text(f"""
+        DELETE FROM dbo.userNodePreference
+        WHERE userName = :u AND dataSource = :ds
+          AND pillarNode_id IN (SELECT pillarNode_id FROM {staged} WHERE pillarNodeValue_id IS NULL);
+    """), params))
+    updated = d.rowcount(cx.execute(text(f"""
+        UPDATE dbo.userNodePreference
+        SET pillarNodeValue_id = (SELECT s.pillarNodeValue_id FROM {staged} s
+                                  WHERE s.pillarNode_id = dbo.userNodePreference.pillarNode_id),
+            dateAdded = {d.now}
+        WHERE userName = :u AND dataSource = :ds
+          AND EXISTS (SELECT 1 FROM {staged} s
+                      WHERE s.pillarNode_id = dbo.userNodePreference.pillarNode_id
+                        AND s.pillarNodeValue_id IS NOT NULL
+                        AND s.pillarNodeValue_id <> dbo.userNodePreference.pillarNodeValue_id);
+    """), params))
+    inserted = d.rowcount(cx.execute(text(f"""
+        INSERT INTO dbo.userNodePreference (userName, pillarNode_id, pillarNodeValue_id, dataSource)
+        SELECT :u, s.pillarNode_id, s.pillarNodeValue_id, :ds
+        FROM {staged} s
+        WHERE s.pillarNodeValue_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM dbo.userNodePreference p
+                          WHERE p.userName = :u AND p.dataSource = :ds AND p.pillarNode_id = s.pillarNode_id);
+    """), params))
+    return updated, inserted, cleared
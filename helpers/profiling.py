@@ -0,0 +1,247 @@
+# helpers/profiling.py
+"""Opt-in per-rerun page profiler.
+
+start_rerun_profile() at the top of a page and finish_rerun_profile() at the
+bottom bracket one script run; fragments declared with @profiled_fragment
+bracket their own solo reruns. While it runs, a sampler thread reads the
+script thread's stack every few milliseconds and files each sample under
+data access (SQLAlchemy/pyodbc anywhere on the stack), DataFrame work
+(pandas/numpy/pyarrow innermost), widgets & rendering (streamlit innermost)
+or app code. The samples double as flame data in collapsed-stack format
+(flamegraph.pl / speedscope). Optionally a cProfile .prof or a pyinstrument
+.html of the run is written to profile_dir.
+
+Off unless enabled, under [diagnostics] in secrets.toml or the environment:
+
+    profile = true                   # or PILLARS_PROFILE=1
+    profile_capture = "cprofile"     # "", "cprofile" or "pyinstrument"
+    profile_dir = ".profiles"
+    sample_interval_ms = 5
+"""
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Deque, Dict, List, Optional
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from helpers.query_stats import current_rerun, query_panel
+
+HISTORY = 200  # profiled reruns kept process-wide
+MAX_STACK_DEPTH = 60
+
+DATA, FRAMES, WIDGETS, APP = "data access", "DataFrame work", "widgets & rendering", "app code"
+CATEGORIES = (DATA, FRAMES, WIDGETS, APP)
+_DATA_PACKAGES = {"sqlalchemy", "pyodbc"}
+_LIBRARY_CATEGORY = {"pandas": FRAMES, "numpy": FRAMES, "pyarrow": FRAMES, "streamlit": WIDGETS, "altair": WIDGETS}
+
+
+def profiling_settings() -> dict:
+    cfg = st.secrets.get("diagnostics", {})
+    env = os.environ.get("PILLARS_PROFILE")
+    enabled = env if env is not None else cfg.get("profile", False)
+    return {
+        "enabled": str(enabled).lower() in ("true", "1", "yes"),
+        "capture": str(cfg.get("profile_capture", "")).lower(),
+        "profile_dir": str(cfg.get("profile_dir", ".profiles")),
+        "sample_interval_ms": float(cfg.get("sample_interval_ms", 5)),
+    }
+
+
+# -----------------------------
+# Results
+# -----------------------------
+class RerunProfile:
+    """Timing breakdown (and flame data) of one profiled script run."""
+
+    def __init__(self, page: str, session_id: str, fragment: Optional[str] = None):
+        self.page = page
+        self.session_id = session_id
+        self.fragment = fragment                # function name when a fragment reran alone
+        self.started = time.time()
+        self.wall_ms = 0.0
+        self.samples: Counter = Counter()       # category -> samples
+        self.stacks: Counter = Counter()        # "page;module:func;..." -> samples
+        self.db_statements = 0
+        self.db_ms = 0.0
+        self.capture_path: Optional[str] = None
+        self.interrupted = False                # st.rerun()/exception before finish_rerun_profile()
+
+    def breakdown_ms(self) -> Dict[str, float]:
+        """Wall time split by category, in proportion to the samples."""
+        total = sum(self.samples.values())
+        if not total:
+            return {c: 0.0 for c in CATEGORIES}
+        return {c: self.wall_ms * self.samples[c] / total for c in CATEGORIES}
+
+    def folded(self) -> str:
+        return "\n".join(f"{stack} {n}" for stack, n in self.stacks.most_common())
+
+
+_lock = threading.Lock()
+_recent: Deque[RerunProfile] = deque(maxlen=HISTORY)
+_active: Dict[str, "_Session"] = {}  # session id -> run being profiled
+
+
+def recent_profiles(page: Optional[str] = None) -> List[RerunProfile]:
+    with _lock:
+        runs = list(_recent)
+    if page:
+        runs = [r for r in runs if r.page == page]
+    return sorted(runs, key=lambda r: r.started, reverse=True)
+
+
+# -----------------------------
+# Sampler
+# -----------------------------
+def _classify(frame, stop_code) -> tuple:
+    """(category, collapsed stack) of one sample; stops at the page script's own frame."""
+    names, category, data = [], None, False
+    depth = 0
+    while frame is not None and frame.f_code is not stop_code and depth < MAX_STACK_DEPTH:
+        module = frame.f_globals.get("__name__", "?")
+        package = module.partition(".")[0]
+        if package in _DATA_PACKAGES:
+            data = True
+        if category is None:
+            category = _LIBRARY_CATEGORY.get(package)
+        names.append(f"{'page' if module == '__main__' else module}:{frame.f_code.co_name}")
+        frame = frame.f_back
+        depth += 1
+    if frame is None:
+        return None, None  # the page has already returned
+    names.append("<page>")
+    return (DATA if data else category or APP), ";".join(reversed(names))
+
+
+class _Session:
+    def __init__(self, profile: RerunProfile, page_code, interval_s: float, capture: str, profile_dir: str):
+        self.profile = profile
+        self.page_code = page_code
+        self.interval_s = interval_s
+        self.thread_id = threading.get_ident()
+        self.stopped = threading.Event()
+        self.t0 = time.perf_counter()
+        self.capture = capture
+        self.profile_dir = profile_dir
+        self.profiler = None
+        self.sampler = threading.Thread(target=self._sample, name="rerun-profiler", daemon=True)
+
+    def start(self):
+        if self.capture == "cprofile":
+            import cProfile
+
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        elif self.capture == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                self.capture = ""  # optional dependency; the sampler still runs
+            else:
+                self.profiler = Profiler()
+                self.profiler.start()
+        self.sampler.start()
+
+    def _sample(self):
+        while not self.stopped.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            category, stack = _classify(frame, self.page_code)
+            if category is not None:
+                self.profile.samples[category] += 1
+                self.profile.stacks[stack] += 1
+
+    def stop(self, interrupted: bool = False):
+        self.stopped.set()
+        self.sampler.join()
+        self.profile.wall_ms = (time.perf_counter() - self.t0) * 1000
+        self.profile.interrupted = interrupted
+        if self.profiler is not None:
+            self.profile.capture_path = self._write_capture()
+
+    def _write_capture(self) -> str:
+        os.makedirs(self.profile_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.profile.started))
+        base = os.path.join(self.profile_dir, f"{os.path.splitext(self.profile.page)[0]}-{stamp}-{id(self) & 0xffff:04x}")
+        if self.capture == "cprofile":
+            self.profiler.disable()
+            path = base + ".prof"
+            self.profiler.dump_stats(path)
+        else:
+            self.profiler.stop()
+            path = base + ".html"
+            with open(path, "w", encoding="utf-8") as fh:
+                fh.write(self.profiler.output_html())
+        return path
+
+
+# -----------------------------
+# Page API
+# -----------------------------
+def start_rerun_profile():
+    """Begin profiling this script run if profiling is enabled; call at the top of a page."""
+    caller = sys._getframe(1)
+    _start(os.path.basename(caller.f_code.co_filename), caller.f_code)
+
+
+def _start(page: str, stop_code, fragment: Optional[str] = None):
+    settings = profiling_settings()
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if not settings["enabled"] or ctx is None:
+        return
+    with _lock:
+        previous = _active.pop(ctx.session_id, None)
+    if previous is not None:
+        _finish(previous, interrupted=True)
+    session = _Session(RerunProfile(page, ctx.session_id, fragment), stop_code,
+                       settings["sample_interval_ms"] / 1000, settings["capture"], settings["profile_dir"])
+    with _lock:
+        _active[ctx.session_id] = session
+    session.start()
+
+
+def finish_rerun_profile():
+    """Stop profiling this script run and keep its breakdown; call at the bottom of a page."""
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None:
+        return
+    with _lock:
+        session = _active.pop(ctx.session_id, None)
+    if session is not None:
+        _finish(session)
+
+
+def _finish(session: _Session, interrupted: bool = False):
+    session.stop(interrupted)
+    stats = current_rerun() if not interrupted else None
+    if stats is not None:
+        session.profile.db_statements = stats.statements
+        session.profile.db_ms = stats.duration_ms
+    with _lock:
+        _recent.append(session.profile)
+
+
+def profiled_fragment(func):
+    """st.fragment whose solo reruns are profiled and get their own query panel.
+
+    Inside a full page run the body runs as is, within the page's own bracket.
+    When only the fragment reruns, the page's top and bottom never execute, so
+    the fragment brackets itself and shows its statements in its own body
+    (a fragment cannot write to the sidebar).
+    """
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        ctx = get_script_run_ctx(suppress_warning=True)
+        if ctx is None or not ctx.fragment_ids_this_run:
+            return func(*args, **kwargs)
+        _start(os.path.basename(func.__code__.co_filename), func.__code__, fragment=func.__name__)
+        result = func(*args, **kwargs)
+        query_panel(fragment=True)
+        finish_rerun_profile()
+        return result
+
+    return st.fragment(run)
@@ -0,0 +1,248 @@
+# helpers/query_stats.py
+"""Per-rerun statement instrumentation on the shared engine.
+
+before/after_cursor_execute record every statement's fingerprint (the SQL with
+literals and IN-lists collapsed), the helper that issued it, its row count and
+its duration. Records are grouped per Streamlit script run, so a page can show
+how many statements its rerun cost and flag fingerprints executed more than N
+times in one rerun (an N+1 loop). Statements issued outside a script run
+(CLI jobs, background threads) are not recorded.
+
+Settings, all optional, under [diagnostics] in secrets.toml:
+
+    query_stats = true            # install the listeners
+    n_plus_one_threshold = 5      # flag fingerprints executed more than this per rerun
+"""
+import hashlib
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+import streamlit as st
+from sqlalchemy import event
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES_DIR = os.path.join(APP_ROOT, "pages")
+# Frames in these files are plumbing, never reported as the calling helper
+_SKIP_FILES = {os.path.abspath(__file__), os.path.join(APP_ROOT, "helpers", "db.py")}
+HISTORY = 200  # finished reruns kept process-wide, across sessions
+MAX_SESSIONS = 200  # sessions with a run in progress; the stalest retire to the history
+DEFAULT_N_PLUS_ONE = 5
+
+
+def diagnostics_settings() -> dict:
+    cfg = st.secrets.get("diagnostics", {})
+    return {
+        "query_stats": str(cfg.get("query_stats", True)).lower() not in ("false", "0", "no"),
+        "n_plus_one_threshold": int(cfg.get("n_plus_one_threshold", DEFAULT_N_PLUS_ONE)),
+    }
+
+
+# -----------------------------
+# Records
+# -----------------------------
+class QueryRecord(NamedTuple):
+    fingerprint: str
+    statement: str
+    caller: str
+    rowcount: Optional[int]  # None when the driver does not report it (most SELECTs)
+    durationMs: float
+    executemany: bool
+
+
+class RerunStats:
+    """The statements of one script run of one session."""
+
+    def __init__(self, session_id: str, token: int, page: str, fragment: bool = False):
+        self.session_id = session_id
+        self.token = token
+        self.page = page
+        self.fragment = fragment  # a fragment rerunning alone, not the whole page
+        self.started = time.time()
+        self.queries: List[QueryRecord] = []
+
+    @property
+    def statements(self) -> int:
+        return len(self.queries)
+
+    @property
+    def duration_ms(self) -> float:
+        return sum(q.durationMs for q in self.queries)
+
+    def by_fingerprint(self) -> pd.DataFrame:
+        cols = ["fingerprint", "caller", "executions", "totalMs", "maxMs", "rows", "statement"]
+        if not self.queries:
+            return pd.DataFrame(columns=cols)
+        df = pd.DataFrame(self.queries, columns=QueryRecord._fields)
+        out = (df.groupby("fingerprint", sort=False)
+                 .agg(caller=("caller", "first"),
+                      executions=("fingerprint", "size"),
+                      totalMs=("durationMs", "sum"),
+                      maxMs=("durationMs", "max"),
+                      rows=("rowcount", "sum"),
+                      statement=("statement", "first"))
+                 .reset_index())
+        return out.sort_values("totalMs", ascending=False)[cols]
+
+    def n_plus_one(self, threshold: int) -> pd.DataFrame:
+        df = self.by_fingerprint()
+        return df[df["executions"] > threshold]
+
+
+_lock = threading.Lock()
+_current: Dict[str, RerunStats] = {}           # session id -> run in progress
+_recent: Deque[RerunStats] = deque(maxlen=HISTORY)
+
+
+# -----------------------------
+# Fingerprints + callers
+# -----------------------------
+_STRING = re.compile(r"N?'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w@:])-?\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_statement(sql: str) -> str:
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("(?…)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:10]
+
+
+@lru_cache(maxsize=None)
+def _abspath(path: str) -> str:
+    return os.path.abspath(path)
+
+
+def _callers() -> Tuple[str, str]:
+    """(innermost app function that issued the statement, page script), from the stack."""
+    caller, origin, page = None, None, ""
+    frame = sys._getframe(2)
+    while frame is not None:
+        path = _abspath(frame.f_code.co_filename)
+        if path.startswith(APP_ROOT) and path not in _SKIP_FILES:
+            name = frame.f_code.co_name
+            if path.startswith(PAGES_DIR) or os.path.dirname(path) == APP_ROOT:
+                page = os.path.basename(path)
+                if origin is None and name != "<module>":
+                    origin = name
+            if caller is None:
+                module = os.path.splitext(os.path.basename(path))[0]
+                caller = name if path.startswith(PAGES_DIR) else f"{module}.{name}"
+        frame = frame.f_back
+    if caller is None:
+        caller = "?"
+    elif origin and not caller.endswith(origin):
+        caller = f"{caller} ← {origin}"
+    return caller, page
+
+
+def _run_token(ctx) -> int:
+    # Streamlit replaces ctx.cursors with a new dict at the start of every
+    # script (or fragment) run, so its identity tells consecutive runs apart.
+    return id(ctx.cursors)
+
+
+def _bucket(ctx, page: str) -> RerunStats:
+    token = _run_token(ctx)
+    stats = _current.get(ctx.session_id)
+    if stats is None or stats.token != token:
+        if stats is not None:
+            _recent.append(stats)
+        stats = RerunStats(ctx.session_id, token, page, bool(ctx.fragment_ids_this_run))
+        _current[ctx.session_id] = stats
+        if len(_current) > MAX_SESSIONS:
+            # A closed session's last run would otherwise stay here for good
+            stale = min(_current.values(), key=lambda r: r.started)
+            _recent.append(_current.pop(stale.session_id))
+    elif not stats.page:
+        stats.page = page
+    return stats
+
+
+# -----------------------------
+# Engine listeners
+# -----------------------------
+def install_query_stats(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_stats_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_stats_start"].pop()
+        elapsed = (time.perf_counter() - started) * 1000
+        ctx = get_script_run_ctx(suppress_warning=True)
+        if ctx is None:
+            return
+        normalized = normalize_statement(statement)
+        caller, page = _callers()
+        rowcount = getattr(cursor, "rowcount", -1)
+        record = QueryRecord(fingerprint(normalized), normalized, caller,
+                             rowcount if rowcount is not None and rowcount >= 0 else None,
+                             elapsed, bool(executemany))
+        with _lock:
+            _bucket(ctx, page).queries.append(record)
+
+    @event.listens_for(engine, "handle_error")
+    def _on_error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_stats_start"):
+            conn.info["query_stats_start"].pop()
+
+
+def current_rerun() -> Optional[RerunStats]:
+    """The statements recorded so far in this session's current script run."""
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None:
+        return None
+    with _lock:
+        stats = _current.get(ctx.session_id)
+    return stats if stats is not None and stats.token == _run_token(ctx) else None
+
+
+def recent_reruns(page: Optional[str] = None) -> List[RerunStats]:
+    """Finished and in-progress reruns of every session, newest first."""
+    with _lock:
+        runs = list(_recent) + list(_current.values())
+    if page:
+        runs = [r for r in runs if r.page == page]
+    return sorted(runs, key=lambda r: r.started, reverse=True)
+
+
+# -----------------------------
+# Panel
+# -----------------------------
+def query_panel(fragment: bool = False):
+    """Sidebar summary of this rerun's statements; call at the end of a page.
+
+    With fragment=True (see profiling.profiled_fragment) the summary covers a
+    fragment's solo rerun and is drawn in the fragment's own body.
+    """
+    threshold = diagnostics_settings()["n_plus_one_threshold"]
+    stats = current_rerun()
+    where = st if fragment else st.sidebar
+    with where.expander("🩺 Queries this fragment rerun" if fragment else "🩺 Queries this rerun", expanded=False):
+        if stats is None or not stats.queries:
+            st.caption("No statements recorded in this rerun.")
+            return
+        c1, c2 = st.columns(2)
+        c1.metric("Statements", stats.statements)
+        c2.metric("DB time", f"{stats.duration_ms:,.0f} ms")
+        suspects = stats.n_plus_one(threshold)
+        for r in suspects.itertuples():
+            st.warning(f"Possible N+1: `{r.caller}` ran one statement {r.executions}× "
+                       f"({r.totalMs:,.0f} ms).")
+        st.dataframe(stats.by_fingerprint(), use_container_width=True, hide_index=True)
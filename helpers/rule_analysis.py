@@ -0,0 +1,159 @@
+# helpers/rule_analysis.py
+"""Static analysis of the warning rule set: unsatisfiable, duplicate and subsumed rules.
+
+Each rule is reduced to the set of profiles it matches: per node, the values
+the node may take, written as IN {...} or NOT IN {...} over value ids plus
+None (node not set). Conditions on the same node intersect, so the form is
+canonical and rules with equal forms match exactly the same profiles.
+"""
+import hashlib
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple
+
+import pandas as pd
+
+from helpers.rules import OP_EQ, OP_IS_NULL, OP_NE, OP_NOT_NULL, CompiledRules
+
+# (is_in, values): is_in=True → node value ∈ values, False → node value ∉ values.
+# Values are value ids or None for "not set".
+NodeSet = Tuple[bool, FrozenSet[Optional[int]]]
+ANY: NodeSet = (False, frozenset())
+
+
+class RuleFinding(NamedTuple):
+    rule_id: int
+    kind: str               # unsatisfiable | duplicate | subsumed
+    other_rule_id: Optional[int]
+    detail: str
+
+
+def condition_set(op: int, target: Optional[int]) -> NodeSet:
+    """Values for which one condition holds (mirrors condition_holds)."""
+    if op == OP_EQ:
+        return True, frozenset([target])
+    if op == OP_NE:
+        return (False, frozenset()) if target is None else (False, frozenset([target]))
+    if op == OP_IS_NULL:
+        return True, frozenset([None])
+    if op == OP_NOT_NULL:
+        return False, frozenset([None])
+    return True, frozenset()  # unknown operator never holds
+
+
+def intersect(a: NodeSet, b: NodeSet) -> NodeSet:
+    (a_in, a_vals), (b_in, b_vals) = a, b
+    if a_in and b_in:
+        return True, a_vals & b_vals
+    if a_in:
+        return True, a_vals - b_vals
+    if b_in:
+        return True, b_vals - a_vals
+    return False, a_vals | b_vals
+
+
+def is_subset(a: NodeSet, b: NodeSet) -> bool:
+    """a ⊆ b. The value domain is open-ended, so a NOT IN set never fits inside an IN set."""
+    (a_in, a_vals), (b_in, b_vals) = a, b
+    if a_in and b_in:
+        return a_vals <= b_vals
+    if a_in:
+        return not (a_vals & b_vals)
+    if b_in:
+        return False
+    return b_vals <= a_vals
+
+
+def canonical_form(compiled: CompiledRules, ri: int) -> Optional[Dict[int, NodeSet]]:
+    """node_id → allowed values for rule ri; None if the rule can never fire."""
+    form: Dict[int, NodeSet] = {}
+    for ci in compiled.conds_by_rule[ri]:
+        nid = compiled.cond_node[ci]
+        form[nid] = intersect(form.get(nid, ANY), condition_set(compiled.cond_op[ci], compiled.cond_value[ci]))
+        if form[nid] == (True, frozenset()):
+            return None
+    return {nid: s for nid, s in form.items() if s != ANY}
+
+
+def signature(form: Dict[int, NodeSet]) -> str:
+    """Stable hash of a canonical form."""
+    parts = []
+    for nid in sorted(form):
+        is_in, vals = form[nid]
+        ids = ",".join("null" if v is None else str(v) for v in sorted(vals, key=lambda v: (v is not None, v or 0)))
+        parts.append(f"{nid}:{'in' if is_in else 'notin'}:{ids}")
+    return hashlib.sha1(";".join(parts).encode("utf-8")).hexdigest()
+
+
+def _covers(outer: Dict[int, NodeSet], inner: Dict[int, NodeSet]) -> bool:
+    """Every profile matching inner also matches outer."""
+    return all(nid in inner and is_subset(inner[nid], s) for nid, s in outer.items())
+
+
+# -----------------------------
+# Analysis
+# -----------------------------
+class RuleAnalysis:
+    """Findings for the active rules plus the rule indexes an evaluator can skip.
+
+    Inactive rules never fire and are left out. A duplicate or subsumed rule is
+    only skipped when the rule that covers it has the same severity and message
+    and applies to at least the same data sources, so the set of messages a
+    profile gets is unchanged.
+    """
+
+    def __init__(self, compiled: CompiledRules):
+        self.findings: List[RuleFinding] = []
+        self.signatures: Dict[int, str] = {}
+        self.skip: Set[int] = set()
+
+        forms: Dict[int, Dict[int, NodeSet]] = {}
+        for ri in range(len(compiled)):
+            if not compiled.active[ri]:
+                continue
+            form = canonical_form(compiled, ri)
+            if form is None:
+                self.skip.add(ri)
+                self.findings.append(RuleFinding(compiled.rule_ids[ri], "unsatisfiable", None,
+                                                 "conditions on the same node can never all hold"))
+                continue
+            forms[ri] = form
+            self.signatures[ri] = signature(form)
+
+        # Only rules sharing severity and message can stand in for each other
+        groups: Dict[Tuple[str, str], List[int]] = {}
+        for ri in forms:
+            groups.setdefault((compiled.severities[ri], compiled.messages[ri]), []).append(ri)
+
+        for members in groups.values():
+            members.sort(key=lambda ri: compiled.rule_ids[ri])
+            kept: List[int] = []
+            for ri in members:
+                twin = next((k for k in kept if self.signatures[k] == self.signatures[ri]
+                             and compiled.scope[k] == compiled.scope[ri]), None)
+                if twin is not None:
+                    self.skip.add(ri)
+                    self.findings.append(RuleFinding(compiled.rule_ids[ri], "duplicate", compiled.rule_ids[twin],
+                                                     "same conditions, scope, severity and message"))
+                else:
+                    kept.append(ri)
+
+            for ri in kept:
+                for other in kept:
+                    if other == ri:
+                        continue
+                    if compiled.scope[other] not in (None, compiled.scope[ri]):
+                        continue
+                    if _covers(forms[other], forms[ri]):
+                        self.skip.add(ri)
+                        self.findings.append(RuleFinding(compiled.rule_ids[ri], "subsumed", compiled.rule_ids[other],
+                                                         "fires only when the other rule fires too"))
+                        break
+
+    def skipped_rule_ids(self, compiled: CompiledRules) -> List[int]:
+        return sorted(compiled.rule_ids[ri] for ri in self.skip)
+
+    def findings_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.findings, columns=list(RuleFinding._fields))
+
+
+def analyze_rules(compiled: CompiledRules) -> RuleAnalysis:
+    return RuleAnalysis(compiled)
@@ -0,0 +1,289 @@
+# helpers/rule_batch.py
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from helpers.dialect import dialect_for
+from helpers.rules import OP_EQ, OP_IS_NULL, OP_NE, OP_NOT_NULL, CompiledRules, get_compiled_rules
+
+NULL = -1  # "node not set" in the profile matrix and "NULL value" in a condition
+
+
+# -----------------------------
+# Vectorised evaluation over every (userName, dataSource) profile
+# -----------------------------
+class ConditionArrays:
+    """Active rules' conditions as NumPy arrays, grouped by rule for reduceat."""
+
+    def __init__(self, compiled: CompiledRules):
+        rules = np.array([ri for ri in range(len(compiled)) if compiled.active[ri]], dtype=np.int64)
+        keep = np.zeros(len(compiled), dtype=bool)
+        keep[rules] = True
+        cond_rule = np.asarray(compiled.cond_rule, dtype=np.int64)
+        cond_mask = keep[cond_rule] if len(cond_rule) else np.zeros(0, dtype=bool)
+
+        # Sort conditions by rule so each rule's conditions are one contiguous run
+        order = np.argsort(cond_rule[cond_mask], kind="stable")
+        self.cond_rule = cond_rule[cond_mask][order]
+        self.cond_node = np.asarray(compiled.cond_node, dtype=np.int64)[cond_mask][order]
+        self.cond_op = np.asarray(compiled.cond_op, dtype=np.int8)[cond_mask][order]
+        self.cond_value = np.array(
+            [NULL if v is None else v for v in compiled.cond_value], dtype=np.int32
+        )[cond_mask][order]
+
+        self.rules = rules
+        self.n_conds = np.asarray(compiled.n_conds, dtype=np.int64)[rules] if len(rules) else np.zeros(0, np.int64)
+        # Column of each condition in the profile matrix (one column per referenced node)
+        self.nodes, self.cond_col = np.unique(self.cond_node, return_inverse=True)
+        # Position of each rule's first condition within the sorted condition arrays
+        self.rule_pos = np.searchsorted(self.cond_rule, rules)
+        self.scope = [compiled.scope[ri] for ri in rules]
+
+
+def _holds(values: np.ndarray, op: np.ndarray, target: np.ndarray) -> np.ndarray:
+    """values: profiles × conditions matrix of value ids (NULL = not set)."""
+    out = np.zeros(values.shape, dtype=bool)
+    for code in (OP_EQ, OP_NE, OP_IS_NULL, OP_NOT_NULL):
+        cols = np.flatnonzero(op == code)
+        if not len(cols):
+            continue
+        v = values[:, cols]
+        if code == OP_EQ:
+            # a NULL target only equals an unset node, as in evaluate_rules()
+            out[:, cols] = v == target[cols]
+        elif code == OP_NE:
+            out[:, cols] = (v == NULL) | (v != target[cols])
+        elif code == OP_IS_NULL:
+            out[:, cols] = v == NULL
+        else:
+            out[:, cols] = v != NULL
+    return out
+
+
+def evaluate_matrix(arrays: ConditionArrays, matrix: np.ndarray, profile_sources: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Evaluate one block of profiles.
+
+    matrix is profiles × arrays.nodes (value ids, NULL where unset) and
+    profile_sources the dataSource of each row. Returns (profile_row, rule_index)
+    pairs for every hit, rule_index being the compiled rule index.
+    """
+    n_profiles, n_rules = matrix.shape[0], len(arrays.rules)
+    if n_rules == 0 or n_profiles == 0:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64)
+
+    fires = np.ones((n_profiles, n_rules), dtype=bool)  # rules without conditions always fire
+    has_conds = arrays.n_conds > 0
+    if len(arrays.cond_rule):
+        holds = _holds(matrix[:, arrays.cond_col], arrays.cond_op, arrays.cond_value)
+        fires[:, has_conds] = np.logical_and.reduceat(holds, arrays.rule_pos[has_conds], axis=1)
+
+    # dataSourceFilter scoping
+    for j, scope in enumerate(arrays.scope):
+        if scope is not None:
+            fires[:, j] &= profile_sources == scope
+
+    prow, rcol = np.nonzero(fires)
+    return prow, arrays.rules[rcol]
+
+
+PREFS_FOR_RULES_SQL = """
+    SELECT p.userName, p.dataSource, p.pillarNode_id, p.pillarNodeValue_id
+    FROM dbo.userNodePreference p
+    WHERE p.pillarNode_id IN (SELECT DISTINCT pillarNode_id FROM dbo.warningRuleCondition)
+    ORDER BY p.userName, p.dataSource;
+"""
+
+PROFILES_SQL = """
+    SELECT DISTINCT userName, dataSource
+    FROM dbo.userNodePreference
+    ORDER BY userName, dataSource;
+"""
+
+
+def evaluate_prefs_frame(compiled: CompiledRules, profiles: pd.DataFrame, prefs: pd.DataFrame,
+                         chunk_size: int = 2000) -> pd.DataFrame:
+    """Hits for every profile.
+
+    profiles has userName/dataSource; prefs has userName/dataSource/
+    pillarNode_id/pillarNodeValue_id (rows on nodes without conditions may be
+    omitted). Returns userName, dataSource, rule_id, name, severity, message.
+    """
+    arrays = ConditionArrays(compiled)
+    columns = ["userName", "dataSource", "rule_id", "name", "severity", "message"]
+    if profiles.empty or len(arrays.rules) == 0:
+        return pd.DataFrame(columns=columns)
+
+    profiles = profiles[["userName", "dataSource"]].reset_index(drop=True)
+    key = pd.MultiIndex.from_frame(profiles)
+    row_profile = key.get_indexer(pd.MultiIndex.from_frame(prefs[["userName", "dataSource"]]))
+    row_col = pd.Index(arrays.nodes).get_indexer(prefs["pillarNode_id"].to_numpy(dtype=np.int64))
+    known = (row_profile >= 0) & (row_col >= 0)
+    row_profile, row_col = row_profile[known], row_col[known]
+    row_value = prefs["pillarNodeValue_id"].to_numpy(dtype=np.int32)[known]
+
+    order = np.argsort(row_profile, kind="stable")
+    row_profile, row_col, row_value = row_profile[order], row_col[order], row_value[order]
+    sources = profiles["dataSource"].to_numpy(dtype=object)
+
+    hit_profiles, hit_rules = [], []
+    for start in range(0, len(profiles), chunk_size):
+        stop = min(start + chunk_size, len(profiles))
+        lo, hi = np.searchsorted(row_profile, [start, stop])
+        block = np.full((stop - start, len(arrays.nodes)), NULL, dtype=np.int32)
+        block[row_profile[lo:hi] - start, row_col[lo:hi]] = row_value[lo:hi]
+        prow, ridx = evaluate_matrix(arrays, block, sources[start:stop])
+        hit_profiles.append(prow + start)
+        hit_rules.append(ridx)
+
+    prow = np.concatenate(hit_profiles)
+    ridx = np.concatenate(hit_rules)
+    return pd.DataFrame({
+        "userName": profiles["userName"].to_numpy(dtype=object)[prow],
+        "dataSource": sources[prow],
+        "rule_id": np.asarray(compiled.rule_ids, dtype=np.int64)[ridx],
+        "name": np.asarray(compiled.names, dtype=object)[ridx],
+        "severity": np.asarray(compiled.severities, dtype=object)[ridx],
+        "message": np.asarray(compiled.messages, dtype=object)[ridx],
+    }, columns=columns)
+
+
+def evaluate_all_profiles(engine, chunk_size: int = 2000) -> pd.DataFrame:
+    """Which (userName, dataSource) profiles trigger which active rules."""
+    compiled = get_compiled_rules(engine)
+    with engine.begin() as cx:
+        profiles = pd.read_sql(text(PROFILES_SQL), cx)
+        prefs = pd.read_sql(text(PREFS_FOR_RULES_SQL), cx)
+    return evaluate_prefs_frame(compiled, profiles, prefs, chunk_size=chunk_size)
+
+
+# -----------------------------
+# SQL pushdown (relational division on the server)
+# -----------------------------
+# A rule fires for a profile when (1) no preference the profile *has* breaks one
+# of its conditions, and (2) the profile sets every node the rule needs, i.e.
+# nodes of '= value' / 'IS NOT NULL' conditions (the ones that cannot hold on an
+# unset node). (2) is a counting division; rules that need no node are checked
+# against every profile. Operator semantics match evaluate_rules().
+_PUSHDOWN_SQL = """
+    WITH prof AS (
+        {profiles}
+    ),
+    cond AS (
+        SELECT c.rule_id, c.pillarNode_id, c.pillarNodeValue_id AS target,
+               CASE WHEN UPPER(LTRIM(RTRIM(c.operator))) = '<>' THEN '!='
+                    ELSE UPPER(LTRIM(RTRIM(c.operator))) END AS op
+        FROM dbo.warningRuleCondition c
+        JOIN dbo.warningRule r ON r.id = c.rule_id AND r.isActive = 1
+    ),
+    req AS (
+        SELECT rule_id, COUNT(DISTINCT pillarNode_id) AS nReq
+        FROM cond
+        WHERE op = 'IS NOT NULL' OR (op = '=' AND target IS NOT NULL)
+        GROUP BY rule_id
+    ),
+    pref AS (
+        SELECT p.userName, p.dataSource, p.pillarNode_id, p.pillarNodeValue_id
+        FROM dbo.userNodePreference p
+        JOIN prof ON prof.userName = p.userName AND prof.dataSource = p.dataSource
+    ),
+    broken AS (
+        SELECT DISTINCT p.userName, p.dataSource, c.rule_id
+        FROM pref p
+        JOIN cond c ON c.pillarNode_id = p.pillarNode_id
+        WHERE CASE c.op
+                WHEN '=' THEN CASE WHEN p.pillarNodeValue_id = c.target THEN 1 ELSE 0 END
+                WHEN '!=' THEN CASE WHEN c.target IS NULL OR p.pillarNodeValue_id <> c.target THEN 1 ELSE 0 END
+                WHEN 'IS NULL' THEN 0
+                WHEN 'IS NOT NULL' THEN 1
+                ELSE 0
+              END = 0
+    ),
+    covered AS (
+        SELECT p.userName, p.dataSource, c.rule_id
+        FROM pref p
+        JOIN cond c ON c.pillarNode_id = p.pillarNode_id
+        JOIN req ON req.rule_id = c.rule_id
+        WHERE c.op = 'IS NOT NULL' OR (c.op = '=' AND c.target IS NOT NULL)
+        GROUP BY p.userName, p.dataSource, c.rule_id, req.nReq
+        HAVING COUNT(DISTINCT p.pillarNode_id) = req.nReq
+    ),
+    candidates AS (
+        SELECT userName, dataSource, rule_id FROM covered
+        UNION ALL
+        SELECT prof.userName, prof.dataSource, r.id
+        FROM prof
+        CROSS JOIN dbo.warningRule r
+        WHERE r.isActive = 1
+          AND NOT EXISTS (SELECT 1 FROM req WHERE req.rule_id = r.id)
+    )
+    {select}
+    FROM candidates k
+    JOIN dbo.warningRule r ON r.id = k.rule_id
+    WHERE (NULLIF(r.dataSourceFilter, '') IS NULL OR r.dataSourceFilter = k.dataSource){skip}
+      AND NOT EXISTS (SELECT 1 FROM cond c
+                      WHERE c.rule_id = r.id AND c.op NOT IN ('=', '!=', 'IS NULL', 'IS NOT NULL'))
+      AND NOT EXISTS (SELECT 1 FROM broken b
+                      WHERE b.userName = k.userName AND b.dataSource = k.dataSource AND b.rule_id = k.rule_id)
+    {order};
+"""
+
+
+def pushdown_sql(single_profile: bool, into: Optional[str] = None, skip_rule_ids: Iterable[int] = ()) -> str:
+    """The pushdown statement; with into, hits are inserted as (userName, dataSource, rule_id) rows.
+
+    skip_rule_ids (e.g. CompiledRules.pruned_rule_ids) are excluded from the result.
+    """
+    if single_profile:
+        profiles = "SELECT CAST(:u AS varchar(200)) AS userName, CAST(:ds AS varchar(100)) AS dataSource"
+    else:
+        profiles = "SELECT DISTINCT userName, dataSource FROM dbo.userNodePreference"
+    if into:
+        select = f"INSERT INTO {into} (userName, dataSource, rule_id)\n    SELECT k.userName, k.dataSource, r.id"
+        order = ""
+    else:
+        select = "SELECT k.userName, k.dataSource, r.id AS rule_id, r.name, r.severity, r.message"
+        order = "ORDER BY k.userName, k.dataSource, r.id"
+    ids = sorted({int(r) for r in skip_rule_ids})
+    skip = f"\n      AND r.id NOT IN ({', '.join(map(str, ids))})" if ids else ""
+    return _PUSHDOWN_SQL.format(profiles=profiles, select=select, order=order, skip=skip)
+
+
+def evaluate_rules_sql(engine, user_name: Optional[str] = None, data_source: Optional[str] = None) -> pd.DataFrame:
+    """Hits computed entirely on the server; pass user_name/data_source for one profile."""
+    single = user_name is not None
+    params = {"u": user_name, "ds": data_source} if single else {}
+    skip = get_compiled_rules(engine).pruned_rule_ids
+    with engine.begin() as cx:
+        return pd.read_sql(text(pushdown_sql(single, skip_rule_ids=skip)), cx, params=params)
+
+
+# -----------------------------
+# Strategy selection
+# -----------------------------
+# Above this many preference rows on rule nodes, moving them to Python costs
+# more than letting the server do the division.
+PUSHDOWN_ROW_THRESHOLD = 250_000
+
+RULE_PREF_ROWS_SQL = """
+    SELECT {count}
+    FROM dbo.userNodePreference
+    WHERE pillarNode_id IN (SELECT DISTINCT pillarNode_id FROM dbo.warningRuleCondition);
+"""
+
+
+def choose_strategy(engine, strategy: str = "auto") -> str:
+    if strategy != "auto":
+        return strategy
+    with engine.begin() as cx:
+        rows = int(cx.execute(text(RULE_PREF_ROWS_SQL.format(count=dialect_for(engine).count_big))).scalar() or 0)
+    return "sql" if rows > PUSHDOWN_ROW_THRESHOLD else "memory"
+
+
+def evaluate_profiles(engine, strategy: str = "auto") -> Tuple[pd.DataFrame, str]:
+    """All-profile hits via 'memory', 'sql' or 'auto'. Returns (hits, strategy used)."""
+    strategy = choose_strategy(engine, strategy)
+    if strategy == "sql":
+        return evaluate_rules_sql(engine), strategy
+    return evaluate_all_profiles(engine), strategy
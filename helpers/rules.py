@@ -0,0 +1,326 @@
+# helpers/rules.py
+import threading
+import time
+from typing import Dict, Iterable, List, Mapping, Optional
+
+import pandas as pd
+from sqlalchemy import text
+
+from helpers.dialect import dialect_for
+
+
+# -----------------------------
+# Operators (same semantics as the original row-by-row evaluator)
+# -----------------------------
+OP_EQ, OP_NE, OP_IS_NULL, OP_NOT_NULL, OP_NEVER = range(5)
+OP_CODES = {"=": OP_EQ, "!=": OP_NE, "<>": OP_NE, "IS NULL": OP_IS_NULL, "IS NOT NULL": OP_NOT_NULL}
+
+
+def op_code(operator: str) -> int:
+    return OP_CODES.get((operator or "").strip().upper(), OP_NEVER)
+
+
+def condition_holds(op: int, target: Optional[int], val: Optional[int]) -> bool:
+    """val/target are value ids or None (node not set / NULL in the rule)."""
+    if op == OP_EQ:
+        return val == target
+    if op == OP_NE:
+        return val is None or val != target
+    if op == OP_IS_NULL:
+        return val is None
+    if op == OP_NOT_NULL:
+        return val is not None
+    return False  # unknown operator never matches
+
+
+# -----------------------------
+# Compiled rule set
+# -----------------------------
+RULES_SQL = """
+    SELECT id, name, message, severity, isActive, dataSourceFilter
+    FROM dbo.warningRule
+    ORDER BY dateAdded DESC, id DESC;
+"""
+
+CONDITIONS_SQL = """
+    SELECT rule_id, pillarNode_id, operator, pillarNodeValue_id
+    FROM dbo.warningRuleCondition
+    ORDER BY rule_id, id;
+"""
+
+
+class CompiledRules:
+    """Rules flattened into parallel arrays, with a node_id → conditions index.
+
+    Rule i owns conditions whose cond_rule[c] == i; each condition is a
+    (cond_node, cond_op, cond_value) predicate. base_satisfied[i] is how many of
+    rule i's conditions hold for an empty profile, so evaluating a profile only
+    has to adjust the counters of conditions on nodes the profile sets.
+    """
+
+    def __init__(self, rule_rows, cond_rows):
+        self.rule_ids: List[int] = []
+        self.names: List[str] = []
+        self.messages: List[str] = []
+        self.severities: List[str] = []
+        self.active: List[bool] = []
+        self.scope: List[Optional[str]] = []
+        self.index_of: Dict[int, int] = {}
+        self.pruned_rule_ids: List[int] = []  # left out by load_compiled_rules(prune=True)
+        for rid, name, message, severity, is_active, ds_filter in rule_rows:
+            self.index_of[int(rid)] = len(self.rule_ids)
+            self.rule_ids.append(int(rid))
+            self.names.append(name)
+            self.messages.append(message)
+            self.severities.append(severity)
+            self.active.append(bool(is_active))
+            self.scope.append(ds_filter or None)
+
+        n = len(self.rule_ids)
+        self.cond_rule: List[int] = []
+        self.cond_node: List[int] = []
+        self.cond_op: List[int] = []
+        self.cond_value: List[Optional[int]] = []
+        self.n_conds: List[int] = [0] * n
+        self.base_satisfied: List[int] = [0] * n
+        self.conds_by_rule: List[List[int]] = [[] for _ in range(n)]
+        self.conds_by_node: Dict[int, List[int]] = {}
+        self.rules_by_node: Dict[int, List[int]] = {}
+        for rid, nid, operator, vid in cond_rows:
+            ri = self.index_of.get(int(rid))
+            if ri is None:
+                continue
+            ci = len(self.cond_rule)
+            op = op_code(operator)
+            target = int(vid) if vid is not None and not pd.isna(vid) else None
+            self.cond_rule.append(ri)
+            self.cond_node.append(int(nid))
+            self.cond_op.append(op)
+            self.cond_value.append(target)
+            self.n_conds[ri] += 1
+            self.base_satisfied[ri] += condition_holds(op, target, None)
+            self.conds_by_rule[ri].append(ci)
+            self.conds_by_node.setdefault(int(nid), []).append(ci)
+            by_node = self.rules_by_node.setdefault(int(nid), [])
+            if not by_node or by_node[-1] != ri:
+                by_node.append(ri)
+
+        # Rules that already fire on an empty profile (e.g. only IS NULL / != conditions)
+        self.fire_when_empty: List[int] = [i for i in range(n) if self.base_satisfied[i] == self.n_conds[i]]
+
+    def __len__(self):
+        return len(self.rule_ids)
+
+    def applies(self, ri: int, data_source: str) -> bool:
+        return self.active[ri] and (self.scope[ri] is None or self.scope[ri] == data_source)
+
+    def satisfied_counts(self, prefs: Mapping[int, Optional[int]]) -> Dict[int, int]:
+        """Satisfied-condition counts for every rule touched by the profile."""
+        counts: Dict[int, int] = {}
+        for nid, vid in prefs.items():
+            cond_ids = self.conds_by_node.get(nid)
+            if not cond_ids:
+                continue
+            for ci in cond_ids:
+                op, target = self.cond_op[ci], self.cond_value[ci]
+                delta = condition_holds(op, target, vid) - condition_holds(op, target, None)
+                if delta:
+                    ri = self.cond_rule[ci]
+                    counts[ri] = counts.get(ri, self.base_satisfied[ri]) + delta
+        return counts
+
+    def evaluate(self, prefs: Mapping[int, Optional[int]], data_source: str) -> List[int]:
+        """Indexes of rules triggered by a node_id → value_id profile (no DB access)."""
+        counts = self.satisfied_counts(prefs)
+        candidates = set(self.fire_when_empty).union(counts)
+        return sorted(
+            ri for ri in candidates
+            if self.applies(ri, data_source)
+            and counts.get(ri, self.base_satisfied[ri]) == self.n_conds[ri]
+        )
+
+    def hits_frame(self, rule_indexes: Iterable[int]) -> pd.DataFrame:
+        return pd.DataFrame(
+            [{"id": self.rule_ids[ri], "name": self.names[ri], "severity": self.severities[ri],
+              "message": self.messages[ri]} for ri in rule_indexes],
+            columns=["id", "name", "severity", "message"],
+        )
+
+
+class ProfileEvaluator:
+    """One (user, source) profile's hit set, kept current as node values change.
+
+    Holds the per-rule satisfied-condition counters, so update() only visits the
+    conditions on the changed nodes: O(affected rules), not O(all rules).
+    """
+
+    def __init__(self, compiled: CompiledRules, prefs: Mapping[int, Optional[int]], data_source: str):
+        self.compiled = compiled
+        self.data_source = data_source
+        self.prefs: Dict[int, int] = {int(n): int(v) for n, v in prefs.items() if v is not None}
+        self.satisfied: List[int] = list(compiled.base_satisfied)
+        for ri, count in compiled.satisfied_counts(self.prefs).items():
+            self.satisfied[ri] = count
+        self.hits = set(compiled.evaluate(self.prefs, data_source))
+
+    def _fires(self, ri: int) -> bool:
+        c = self.compiled
+        return c.applies(ri, self.data_source) and self.satisfied[ri] == c.n_conds[ri]
+
+    def update(self, changes: Mapping[int, Optional[int]]):
+        """Apply node_id → value_id changes (None clears). Returns (added, removed) rule indexes."""
+        c = self.compiled
+        touched = set()
+        for nid, vid in changes.items():
+            nid = int(nid)
+            vid = int(vid) if vid is not None else None
+            old = self.prefs.get(nid)
+            if old == vid:
+                continue
+            for ci in c.conds_by_node.get(nid, ()):
+                op, target = c.cond_op[ci], c.cond_value[ci]
+                delta = condition_holds(op, target, vid) - condition_holds(op, target, old)
+                if delta:
+                    self.satisfied[c.cond_rule[ci]] += delta
+                    touched.add(c.cond_rule[ci])
+            if vid is None:
+                self.prefs.pop(nid, None)
+            else:
+                self.prefs[nid] = vid
+
+        added, removed = [], []
+        for ri in touched:
+            now = self._fires(ri)
+            if now and ri not in self.hits:
+                self.hits.add(ri)
+                added.append(ri)
+            elif not now and ri in self.hits:
+                self.hits.discard(ri)
+                removed.append(ri)
+        return sorted(added), sorted(removed)
+
+    def hit_indexes(self) -> List[int]:
+        return sorted(self.hits)
+
+    def option_hits(self, node_id: int, value_ids: Iterable[int],
+                    severities: Optional[Iterable[str]] = None) -> Dict[int, List[int]]:
+        """For each candidate value of a node: rules on that node that would fire if it were chosen.
+
+        Uses the profile's counters: for every rule touching the node, the
+        conditions elsewhere are already counted, so only the ones on this node
+        are resolved, per target value rather than per option × rule.
+        """
+        c = self.compiled
+        nid = int(node_id)
+        current = self.prefs.get(nid)
+        wanted = set(int(v) for v in value_ids)
+        sev = set(severities) if severities is not None else None
+
+        # rule -> [satisfied elsewhere, holds for any value, {target: adjustment}]
+        per_rule: Dict[int, list] = {}
+        for ci in c.conds_by_node.get(nid, ()):
+            ri = c.cond_rule[ci]
+            if not c.applies(ri, self.data_source) or (sev is not None and c.severities[ri] not in sev):
+                continue
+            op, target = c.cond_op[ci], c.cond_value[ci]
+            entry = per_rule.setdefault(ri, [self.satisfied[ri], 0, {}])
+            entry[0] -= condition_holds(op, target, current)
+            if op == OP_NOT_NULL or (op == OP_NE and target is None):
+                entry[1] += 1
+            elif op == OP_NE:
+                entry[1] += 1
+                entry[2][target] = entry[2].get(target, 0) - 1
+            elif op == OP_EQ and target is not None:
+                entry[2][target] = entry[2].get(target, 0) + 1
+            # IS NULL, '= NULL' and unknown operators never hold for a chosen value
+
+        out: Dict[int, List[int]] = {}
+        for ri, (elsewhere, generic, adjust) in per_rule.items():
+            need = c.n_conds[ri] - elsewhere
+            if generic == need:
+                for v in wanted:
+                    if not adjust.get(v):
+                        out.setdefault(v, []).append(ri)
+            for target, delta in adjust.items():
+                if delta and target in wanted and generic + delta == need:
+                    out.setdefault(target, []).append(ri)
+        return out
+
+
+def load_compiled_rules(engine, prune: bool = True) -> CompiledRules:
+    """Compile the rule tables. With prune, rules the analyzer finds unsatisfiable,
+    duplicated or subsumed are left out (their ids land in pruned_rule_ids)."""
+    with engine.begin() as cx:
+        rule_rows = cx.execute(text(RULES_SQL)).fetchall()
+        cond_rows = cx.execute(text(CONDITIONS_SQL)).fetchall()
+    compiled = CompiledRules(rule_rows, cond_rows)
+    if not prune:
+        return compiled
+
+    from helpers.rule_analysis import analyze_rules  # builds on this module
+
+    skipped = set(analyze_rules(compiled).skipped_rule_ids(compiled))
+    if skipped:
+        compiled = CompiledRules([r for r in rule_rows if int(r[0]) not in skipped],
+                                 [c for c in cond_rows if int(c[0]) not in skipped])
+        compiled.pruned_rule_ids = sorted(skipped)
+    return compiled
+
+
+# -----------------------------
+# Process-wide cache (rebuilt only when the rule tables change)
+# -----------------------------
+# Rule tables are small, so the probe can afford a checksum over the columns the
+# compiled form depends on; that also catches edits made by other processes.
+RULES_FINGERPRINT_SQL = """
+    SELECT (SELECT {count} FROM dbo.warningRule),
+           (SELECT {rule_checksum} FROM dbo.warningRule),
+           (SELECT {count} FROM dbo.warningRuleCondition),
+           (SELECT {condition_checksum} FROM dbo.warningRuleCondition);
+"""
+
+PROBE_INTERVAL_SECONDS = 2.0
+
+_lock = threading.Lock()
+_cache = {"generation": 0, "compiled": None, "fingerprint": None, "probed_at": 0.0}
+
+
+def invalidate_rules():
+    """Drop the compiled rule set; call after any warningRule/warningRuleCondition write."""
+    with _lock:
+        _cache["generation"] += 1
+        _cache["compiled"] = None
+        _cache["fingerprint"] = None
+
+
+def rules_fingerprint(engine) -> tuple:
+    d = dialect_for(engine)
+    sql = RULES_FINGERPRINT_SQL.format(
+        count=d.count_big,
+        rule_checksum=d.checksum_agg("id, name, message, severity, isActive, dataSourceFilter"),
+        condition_checksum=d.checksum_agg("id, rule_id, pillarNode_id, operator, pillarNodeValue_id"),
+    )
+    with engine.begin() as cx:
+        return tuple(cx.execute(text(sql)).fetchone())
+
+
+def get_compiled_rules(engine) -> CompiledRules:
+    now = time.monotonic()
+    with _lock:
+        compiled = _cache["compiled"]
+        if compiled is not None and now - _cache["probed_at"] < PROBE_INTERVAL_SECONDS:
+            return compiled
+        generation = _cache["generation"]
+        cached_fp = _cache["fingerprint"]
+
+    fp = rules_fingerprint(engine)
+    if compiled is not None and fp == cached_fp:
+        with _lock:
+            _cache["probed_at"] = now
+        return compiled
+
+    compiled = load_compiled_rules(engine)
+    with _lock:
+        if _cache["generation"] == generation:
+            _cache.update(compiled=compiled, fingerprint=fp, probed_at=now)
+    return compiled
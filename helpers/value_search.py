@@ -0,0 +1,293 @@
+# helpers/value_search.py
+"""In-process trigram index over pillarNodeValue names and descriptions.
+
+Replaces LIKE '%term%' filters (which always scan on SQL Server) with an
+inverted index: substring queries intersect the posting lists of the query's
+trigrams and verify the few candidates; fuzzy queries rank values by trigram
+similarity. The index is built from the cached taxonomy and kept current by
+index_value()/unindex_value() from the value admin page.
+"""
+import json
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from helpers.dialect import dialect_for
+from helpers.taxonomy import PillarNodeValue, get_taxonomy
+
+# Incremental edits live in a small overlay until this many values are touched,
+# then the packed postings are rebuilt.
+COMPACT_AFTER = 2000
+
+# Searches matching more values than this (typically 1-2 character terms) are not
+# shipped as an id list; the query filters with LIKE instead, since it would scan
+# most of the table anyway.
+MAX_ID_LIST = 2000
+
+# Every field is indexed with two trailing pad characters, so any 1-2 character
+# substring starts some indexed trigram and short queries become a key range.
+PAD = "\x01\x01"
+
+
+def _normalize(s: Optional[str]) -> str:
+    return (s or "").lower()
+
+
+def _codes(chars: np.ndarray) -> np.ndarray:
+    """Trigram codes of a code-point array (21 bits per character)."""
+    a = chars.astype(np.int64)
+    return (a[:-2] << 42) | (a[1:-1] << 21) | a[2:]
+
+
+def _text_codes(s: str) -> np.ndarray:
+    if len(s) < 3:
+        return np.empty(0, dtype=np.int64)
+    return np.unique(_codes(np.frombuffer(s.encode("utf-32-le"), dtype=np.uint32)))
+
+
+def _doc_codes(doc: Tuple[str, str]) -> np.ndarray:
+    return np.unique(np.concatenate([_text_codes(doc[0] + PAD), _text_codes(doc[1] + PAD)]))
+
+
+class TrigramIndex:
+    """Trigram postings over value name + description (case-insensitive).
+
+    Packed postings: _keys (sorted trigram codes) and _starts index into _ids,
+    which holds the value ids for each trigram in ascending order. Values added
+    or changed since the last pack are indexed in _delta and their packed
+    entries are ignored (_stale).
+    """
+
+    def __init__(self, values: Iterable[PillarNodeValue] = ()):
+        self._lock = threading.RLock()
+        self._docs: Dict[int, Tuple[str, str]] = {
+            int(v.id): (_normalize(v.pillarNodeValue), _normalize(v.pillarNodeValueDescription)) for v in values
+        }
+        self._pack()
+
+    def __len__(self):
+        return len(self._docs)
+
+    # -----------------------------
+    # Build / maintenance
+    # -----------------------------
+    def _pack(self):
+        ids = np.fromiter(self._docs.keys(), dtype=np.int64, count=len(self._docs))
+        texts = [f"{name}{PAD}\x00{desc}{PAD}" for name, desc in self._docs.values()]
+        # NUL separates fields and values, so no trigram spans two of them
+        chars = np.frombuffer("\x00".join(texts).encode("utf-32-le") + b"\x00\x00\x00\x00", dtype=np.uint32)
+        owner = np.repeat(ids, [len(t) + 1 for t in texts])
+        if len(chars) >= 3:
+            codes = _codes(chars)
+            keep = (chars[:-2] != 0) & (chars[1:-1] != 0) & (chars[2:] != 0)
+            codes, owner = codes[keep], owner[:-2][keep]
+        else:
+            codes, owner = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        order = np.lexsort((owner, codes))
+        codes, owner = codes[order], owner[order]
+        first = np.ones(len(codes), dtype=bool)
+        first[1:] = (codes[1:] != codes[:-1]) | (owner[1:] != owner[:-1])
+        codes, owner = codes[first], owner[first]
+
+        self._keys, self._starts = np.unique(codes, return_index=True)
+        self._starts = np.append(self._starts, len(codes))
+        self._ids = owner
+        counted, counts = np.unique(owner, return_counts=True)
+        self._n_trigrams: Dict[int, int] = dict(zip(counted.tolist(), counts.tolist()))
+        self._packed_ids: Set[int] = set(self._docs)
+        self._stale: Set[int] = set()
+        self._delta: Dict[int, Set[int]] = {}
+        self._delta_ids: Set[int] = set()
+        self._edits = 0
+
+    def _unindex_delta(self, value_id: int):
+        old = self._docs.get(value_id)
+        if old is None:
+            return
+        for code in _doc_codes(old).tolist():
+            ids = self._delta.get(code)
+            if ids is not None:
+                ids.discard(value_id)
+
+    def add(self, value_id: int, name: Optional[str], description: Optional[str]):
+        """Index a new value or re-index a changed one."""
+        value_id = int(value_id)
+        doc = (_normalize(name), _normalize(description))
+        with self._lock:
+            if self._docs.get(value_id) == doc:
+                return
+            self._unindex_delta(value_id)
+            if value_id in self._packed_ids:
+                self._stale.add(value_id)
+            self._docs[value_id] = doc
+            self._delta_ids.add(value_id)
+            codes = _doc_codes(doc)
+            for code in codes.tolist():
+                self._delta.setdefault(code, set()).add(value_id)
+            self._n_trigrams[value_id] = len(codes)
+            self._maybe_compact()
+
+    def remove(self, value_id: int):
+        value_id = int(value_id)
+        with self._lock:
+            if value_id not in self._docs:
+                return
+            self._unindex_delta(value_id)
+            if value_id in self._packed_ids:
+                self._stale.add(value_id)
+            del self._docs[value_id]
+            self._delta_ids.discard(value_id)
+            self._n_trigrams.pop(value_id, None)
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        self._edits += 1
+        if self._edits > COMPACT_AFTER:
+            self._pack()
+
+    def sync(self, values: Iterable[PillarNodeValue]):
+        """Bring the index in line with a taxonomy snapshot (only differing values are touched)."""
+        with self._lock:
+            seen = set()
+            for v in values:
+                seen.add(int(v.id))
+                self.add(v.id, v.pillarNodeValue, v.pillarNodeValueDescription)
+            for value_id in [i for i in self._docs if i not in seen]:
+                self.remove(value_id)
+
+    # -----------------------------
+    # Queries
+    # -----------------------------
+    def _packed(self, code: int) -> np.ndarray:
+        i = np.searchsorted(self._keys, code)
+        if i == len(self._keys) or self._keys[i] != code:
+            return self._ids[:0]
+        return self._ids[self._starts[i]:self._starts[i + 1]]
+
+    def _postings(self, code: int) -> np.ndarray:
+        packed = self._packed(code)
+        extra = self._delta.get(code)
+        if not extra:
+            return packed
+        return np.union1d(packed, np.fromiter(extra, dtype=np.int64, count=len(extra)))
+
+    def search(self, query: str) -> Set[int]:
+        """Ids of values whose name or description contains query (case-insensitive)."""
+        q = _normalize(query)
+        with self._lock:
+            if not q:
+                return set(self._docs)
+            if len(q) < 3:
+                return self._search_short(q)
+
+            lists = sorted((self._postings(c) for c in _text_codes(q).tolist()), key=len)
+            candidates = lists[0]
+            for ids in lists[1:]:
+                if not len(candidates):
+                    break
+                candidates = np.intersect1d(candidates, ids, assume_unique=True)
+
+            out = set()
+            exact = len(q) == 3  # a single trigram hit is already a substring match
+            for value_id in candidates.tolist():
+                doc = self._docs.get(value_id)
+                if doc is None:
+                    continue
+                if (exact and value_id not in self._stale) or q in doc[0] or q in doc[1]:
+                    out.add(value_id)
+            return out
+
+    def _search_short(self, q: str) -> Set[int]:
+        # Trigrams starting with q form one contiguous run of _keys, hence of _ids
+        chars = [ord(ch) for ch in q]
+        lo = chars[0] << 42 if len(q) == 1 else (chars[0] << 42) | (chars[1] << 21)
+        hi = lo + (1 << 42 if len(q) == 1 else 1 << 21)
+        a, b = np.searchsorted(self._keys, [lo, hi])
+        hits = self._ids[self._starts[a]:self._starts[b]]
+        out = set()
+        if len(hits):
+            mask = np.zeros(int(hits.max()) + 1, dtype=bool)
+            mask[hits] = True
+            out = set(np.flatnonzero(mask).tolist())
+        out -= self._stale
+        out.update(i for i in self._delta_ids if q in self._docs[i][0] or q in self._docs[i][1])
+        return out
+
+    def fuzzy(self, query: str, limit: int = 10, min_score: float = 0.2) -> List[Tuple[int, float]]:
+        """Best (value_id, score) matches by trigram Jaccard similarity, highest first."""
+        codes = _text_codes(_normalize(query) + PAD)
+        if not len(codes):
+            return []
+        with self._lock:
+            ids, shared = np.unique(np.concatenate([self._packed(c) for c in codes.tolist()]), return_counts=True)
+            scores: Dict[int, int] = {i: n for i, n in zip(ids.tolist(), shared.tolist()) if i not in self._stale}
+            for c in codes.tolist():
+                for value_id in self._delta.get(c, ()):
+                    scores[value_id] = scores.get(value_id, 0) + 1
+
+            ranked = []
+            for value_id, n in scores.items():
+                if value_id not in self._docs:
+                    continue
+                score = n / (len(codes) + self._n_trigrams.get(value_id, 0) - n)
+                if score >= min_score:
+                    ranked.append((value_id, score))
+        ranked.sort(key=lambda t: (-t[1], t[0]))
+        return ranked[:limit]
+
+
+# -----------------------------
+# Process-wide index (follows the taxonomy cache)
+# -----------------------------
+_lock = threading.Lock()
+_cache = {"index": None, "snapshot": None}
+
+
+def get_value_index(engine) -> TrigramIndex:
+    """The shared index; a new taxonomy snapshot only re-indexes values that changed."""
+    snap = get_taxonomy(engine)
+    with _lock:
+        index = _cache["index"]
+        if index is None:
+            index = TrigramIndex(snap.values)
+        elif _cache["snapshot"] is not snap:
+            index.sync(snap.values)
+        _cache.update(index=index, snapshot=snap)
+        return index
+
+
+def _like_pattern(search: str) -> str:
+    # '!' escapes LIKE wildcards, and SQL Server's [ character classes
+    escaped = "".join("!" + ch if ch in "!%_[" else ch for ch in search)
+    return f"%{escaped}%"
+
+
+def value_search_filter(engine, search: str, alias: str = "v") -> Tuple[str, dict]:
+    """SQL predicate (and its params) keeping the alias rows that match a substring search.
+
+    Up to MAX_ID_LIST hits from the index become `id IN (dialect.id_list())`;
+    broader terms fall back to a case-insensitive LIKE over name and description.
+    """
+    d = dialect_for(engine)
+    ids = get_value_index(engine).search(search)
+    if len(ids) <= MAX_ID_LIST:
+        return f"{alias}.id IN ({d.id_list()})", {"ids": json.dumps(sorted(ids))}
+    like = f"LIKE {d.fold(':like')} ESCAPE '!'"
+    sql = (f"({d.fold(f'{alias}.pillarNodeValue')} {like}"
+           f" OR {d.fold(f'{alias}.pillarNodeValueDescription')} {like})")
+    return sql, {"like": _like_pattern(search)}
+
+
+def index_value(value_id: int, name: Optional[str], description: Optional[str]):
+    """Reflect an insert/update in the shared index (no-op before the first search)."""
+    index = _cache["index"]
+    if index is not None:
+        index.add(value_id, name, description)
+
+
+def unindex_value(value_id: int):
+    index = _cache["index"]
+    if index is not None:
+        index.remove(value_id)
@@ -0,0 +1,240 @@
+# helpers/warning_hits.py
+"""Materialised warning hits (dbo.warningHit) and the headless job that maintains them.
+
+    python -m helpers.warning_hits                  # incremental refresh
+    python -m helpers.warning_hits --full           # full rebuild
+"""
+import argparse
+import json
+import time
+
+import pandas as pd
+from sqlalchemy import text
+
+from helpers.dialect import dialect_for
+from helpers.rule_batch import choose_strategy, evaluate_prefs_frame, pushdown_sql
+from helpers.rules import load_compiled_rules, rules_fingerprint
+
+# -----------------------------
+# Refresh
+# -----------------------------
+# A writer can stamp dateAdded before a run reads its watermark and commit after the
+# run has staged; incremental runs therefore re-read this far behind the watermark.
+# Keep it above the longest transaction that writes preferences.
+WATERMARK_OVERLAP_SECONDS = 300
+
+LAST_RUN_SQL = """
+    SELECT {top} watermark, rulesFingerprint
+    FROM dbo.warningHitRun
+    ORDER BY id DESC {limit};
+"""
+
+HIT_PROFILES_COLUMNS = """
+    userName    varchar(200){collate} NOT NULL,
+    dataSource  varchar(100){collate} NOT NULL,
+    bucket      int NOT NULL,
+    PRIMARY KEY (userName, dataSource)
+"""
+
+HIT_STAGE_COLUMNS = """
+    userName    varchar(200){collate} NOT NULL,
+    dataSource  varchar(100){collate} NOT NULL,
+    rule_id     int NOT NULL,
+    PRIMARY KEY (userName, dataSource, rule_id)
+"""
+
+# Profiles to (re)evaluate, numbered into MERGE batches
+STAGE_PROFILES_SQL = """
+    INSERT INTO {profiles} (userName, dataSource, bucket)
+    SELECT userName, dataSource, {bucket}
+    FROM (
+        SELECT DISTINCT userName, dataSource
+        FROM dbo.userNodePreference
+        {where}
+        {changed}
+    ) p;
+"""
+
+# Incremental runs also take profiles that lost rows (stamped by helpers/preferences.py)
+CHANGED_PROFILES_SQL = """
+        UNION
+        SELECT userName, dataSource
+        FROM dbo.userNodePreferenceChange
+        WHERE changedAt >= {since}
+"""
+
+STAGED_PREFS_SQL = """
+    SELECT p.userName, p.dataSource, p.pillarNode_id, p.pillarNodeValue_id
+    FROM dbo.userNodePreference p
+    JOIN {profiles} h ON h.userName = p.userName AND h.dataSource = p.dataSource
+    WHERE p.pillarNode_id IN (SELECT DISTINCT pillarNode_id FROM dbo.warningRuleCondition);
+"""
+
+MERGE_BUCKET_SQL = """
+    SET NOCOUNT ON;
+    DECLARE @actions TABLE (action nvarchar(10) NOT NULL);
+
+    WITH tgt AS (
+        SELECT h.userName, h.dataSource, h.rule_id
+        FROM dbo.warningHit h
+        WHERE EXISTS (SELECT 1 FROM #hitProfiles p
+                      WHERE p.bucket = :b AND p.userName = h.userName AND p.dataSource = h.dataSource)
+    ),
+    src AS (
+        SELECT s.userName, s.dataSource, s.rule_id
+        FROM #hitStage s
+        JOIN #hitProfiles p ON p.userName = s.userName AND p.dataSource = s.dataSource AND p.bucket = :b
+    )
+    MERGE tgt
+    USING src ON (tgt.userName = src.userName AND tgt.dataSource = src.dataSource AND tgt.rule_id = src.rule_id)
+    WHEN NOT MATCHED BY TARGET THEN
+        INSERT (userName, dataSource, rule_id) VALUES (src.userName, src.dataSource, src.rule_id)
+    WHEN NOT MATCHED BY SOURCE THEN DELETE
+    OUTPUT $action INTO @actions;
+
+    SELECT COALESCE(SUM(CASE WHEN action = 'INSERT' THEN 1 ELSE 0 END), 0),
+           COALESCE(SUM(CASE WHEN action = 'DELETE' THEN 1 ELSE 0 END), 0)
+    FROM @actions;
+"""
+
+# SQLite/DuckDB: the MERGE's two branches (the sets are disjoint, so order does not matter)
+INSERT_BUCKET_SQL = """
+    INSERT INTO dbo.warningHit (userName, dataSource, rule_id)
+    SELECT s.userName, s.dataSource, s.rule_id
+    FROM {stage} s
+    JOIN {profiles} p ON p.userName = s.userName AND p.dataSource = s.dataSource AND p.bucket = :b
+    WHERE NOT EXISTS (SELECT 1 FROM dbo.warningHit h
+                      WHERE h.userName = s.userName AND h.dataSource = s.dataSource AND h.rule_id = s.rule_id);
+"""
+
+DELETE_BUCKET_SQL = """
+    DELETE FROM dbo.warningHit
+    WHERE EXISTS (SELECT 1 FROM {profiles} p
+                  WHERE p.bucket = :b AND p.userName = warningHit.userName AND p.dataSource = warningHit.dataSource)
+      AND NOT EXISTS (SELECT 1 FROM {stage} s
+                      WHERE s.userName = warningHit.userName AND s.dataSource = warningHit.dataSource
+                        AND s.rule_id = warningHit.rule_id);
+"""
+
+# Profiles whose preferences were all removed keep no hits
+DELETE_ORPHANS_SQL = """
+    DELETE FROM dbo.warningHit
+    WHERE NOT EXISTS (SELECT 1 FROM dbo.userNodePreference p
+                      WHERE p.userName = warningHit.userName AND p.dataSource = warningHit.dataSource);
+"""
+
+
+def refresh_warning_hits(engine, full: bool = False, batch_size: int = 2000, strategy: str = "auto",
+                         overlap_seconds: int = WATERMARK_OVERLAP_SECONDS) -> dict:
+    """Bring dbo.warningHit up to date and log the run in dbo.warningHitRun.
+
+    Incremental runs re-evaluate profiles with a preference written, or one
+    cleared (dbo.userNodePreferenceChange), since the last run's watermark,
+    less overlap_seconds (re-evaluating is idempotent). A change to the rule
+    tables (detected through the rules fingerprint) always forces a full
+    rebuild. Change stamps no later run can reach are pruned.
+    """
+    started = time.perf_counter()
+    d = dialect_for(engine)
+    hit_profiles, hit_stage = d.temp("hitProfiles"), d.temp("hitStage")
+    fingerprint = json.dumps([None if v is None else int(v) for v in rules_fingerprint(engine)])
+    with engine.begin() as cx:
+        watermark = cx.execute(text(f"SELECT {d.now};")).scalar()
+        last = cx.execute(text(LAST_RUN_SQL.format(top=d.top("1"), limit=d.limit("1")))).fetchone()
+    full = full or last is None or last[1] != fingerprint
+    strategy = choose_strategy(engine, strategy) if full else "memory"
+    # Loaded before the staging connection opens: an in-memory embedded database
+    # has a single shared connection, so nothing may nest inside its transaction.
+    compiled = load_compiled_rules(engine)
+
+    inserted = deleted = 0
+    with engine.connect() as cx:
+        for stmt in (d.create_temp("hitProfiles", HIT_PROFILES_COLUMNS.format(collate=d.temp_collate))
+                     + d.create_temp("hitStage", HIT_STAGE_COLUMNS.format(collate=d.temp_collate))):
+            cx.execute(text(stmt))
+        since = d.seconds_before(":wm", overlap_seconds)
+        where = "" if full else f"WHERE dateAdded >= {since}"
+        changed = "" if full else CHANGED_PROFILES_SQL.format(since=since)
+        params = {"bs": int(batch_size)} if full else {"bs": int(batch_size), "wm": last[0]}
+        bucket = d.int_div("ROW_NUMBER() OVER (ORDER BY userName, dataSource) - 1", ":bs")
+        cx.execute(text(STAGE_PROFILES_SQL.format(profiles=hit_profiles, bucket=bucket, where=where,
+                                                  changed=changed)), params)
+        n_profiles = int(cx.execute(text(f"SELECT COUNT(*) FROM {hit_profiles};")).scalar())
+
+        if strategy == "sql":
+            cx.execute(text(pushdown_sql(False, into=hit_stage, skip_rule_ids=compiled.pruned_rule_ids)))
+        else:
+            profiles = pd.read_sql(
+                text(f"SELECT userName, dataSource FROM {hit_profiles} ORDER BY userName, dataSource;"), cx)
+            prefs = pd.read_sql(text(STAGED_PREFS_SQL.format(profiles=hit_profiles)), cx)
+            hits = evaluate_prefs_frame(compiled, profiles, prefs)
+            if not hits.empty:
+                cx.execute(
+                    text(f"INSERT INTO {hit_stage} (userName, dataSource, rule_id) VALUES (:u, :ds, :rid);"),
+                    [{"u": u, "ds": ds, "rid": int(rid)}
+                     for u, ds, rid in hits[["userName", "dataSource", "rule_id"]].itertuples(index=False)],
+                )
+        cx.commit()
+
+        # One short transaction per bucket keeps locks brief under load
+        n_buckets = (n_profiles + batch_size - 1) // batch_size
+        for b in range(n_buckets):
+            if d.embedded:
+                temps = {"profiles": hit_profiles, "stage": hit_stage}
+                inserted += d.rowcount(cx.execute(text(INSERT_BUCKET_SQL.format(**temps)), {"b": b}))
+                deleted += d.rowcount(cx.execute(text(DELETE_BUCKET_SQL.format(**temps)), {"b": b}))
+            else:
+                row = cx.execute(text(MERGE_BUCKET_SQL), {"b": b}).fetchone()
+                inserted += int(row[0])
+                deleted += int(row[1])
+            cx.commit()
+
+        deleted += d.rowcount(cx.execute(text(DELETE_ORPHANS_SQL)))
+        cx.execute(text(d.drop_temp("hitProfiles")))
+        cx.execute(text(d.drop_temp("hitStage")))
+        cx.commit()
+
+    stats = {
+        "mode": "full" if full else "incremental",
+        "strategy": strategy,
+        "watermark": watermark,
+        "rulesFingerprint": fingerprint,
+        "profilesEvaluated": n_profiles,
+        "hitsInserted": inserted,
+        "hitsDeleted": deleted,
+        "durationMs": int((time.perf_counter() - started) * 1000),
+    }
+    with engine.begin() as cx:
+        cx.execute(
+            text("""INSERT INTO dbo.warningHitRun
+                        (mode, strategy, watermark, rulesFingerprint, profilesEvaluated, hitsInserted, hitsDeleted, durationMs)
+                    VALUES (:mode, :strategy, :watermark, :rulesFingerprint, :profilesEvaluated, :hitsInserted, :hitsDeleted, :durationMs);"""),
+            stats,
+        )
+        # The next run reads from this run's watermark less the overlap, never earlier
+        cx.execute(text(f"DELETE FROM dbo.userNodePreferenceChange "
+                        f"WHERE changedAt < {d.seconds_before(':wm', overlap_seconds)};"),
+                   {"wm": watermark})
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Refresh dbo.warningHit from the warning rules.")
+    parser.add_argument("--full", action="store_true", help="re-evaluate every profile")
+    parser.add_argument("--batch-size", type=int, default=2000, help="profiles per MERGE transaction")
+    parser.add_argument("--strategy", choices=["auto", "sql", "memory"], default="auto",
+                        help="where full rebuilds evaluate rules")
+    parser.add_argument("--overlap-seconds", type=int, default=WATERMARK_OVERLAP_SECONDS,
+                        help="how far behind the last watermark incremental runs re-read")
+    args = parser.parse_args(argv)
+
+    from helpers.db import create_app_engine
+
+    engine = create_app_engine()
+    stats = refresh_warning_hits(engine, full=args.full, batch_size=args.batch_size, strategy=args.strategy,
+                                 overlap_seconds=args.overlap_seconds)
+    print(json.dumps(stats, default=str))
+
+
+if __name__ == "__main__":
+    main()
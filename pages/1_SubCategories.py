@@ -1,37 +1,16 @@
-import urllib.parse
 from datetime import datetime
-import pandas as pd
 import streamlit as st
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
 
-st.set_page_config(page_title="Subcategories Admin", layout="wide")
-
-# -----------------------------
-# Connection helpers (SQL Server)
-# -----------------------------
-def _build_sqlalchemy_url():
-    cfg = st.secrets["sqlserver"]
-    driver = cfg.get("driver", "ODBC Driver 18 for SQL Server")
-
-    parts = [
-        f"DRIVER={{{driver}}}",
-        f"SERVER={cfg['server']}",
-        f"DATABASE={cfg['database']}",
-        f"Encrypt={cfg.get('encrypt','no')}",
-        f"TrustServerCertificate={cfg.get('trust_server_certificate','yes')}",
-    ]
-
-    if cfg.get("windows_auth", True):
-        parts.append("Trusted_Connection=yes")   # or: Integrated Security=SSPI
-    else:
-        parts += [f"UID={cfg['username']}", f"PWD={cfg['password']}"]
-
-    odbc = ";".join(parts) + ";"
-    return "mssql+pyodbc:///?odbc_connect=" + urllib.parse.quote_plus(odbc)
+from helpers.db import database_label, get_engine
+from helpers.dialect import dialect_for
+from helpers.profiling import finish_rerun_profile, start_rerun_profile
+from helpers.query_stats import query_panel
+from helpers.taxonomy import Category, SubCategory, get_taxonomy, invalidate_taxonomy, to_frame
 
-@st.cache_resource(show_spinner=False)
-def get_engine():
-    return create_engine(_build_sqlalchemy_url(), pool_pre_ping=True, fast_executemany=True)
+st.set_page_config(page_title="Subcategories Admin", layout="wide")
+start_rerun_profile()
 
 engine = get_engine()
 
@@ -39,67 +18,71 @@ engine = get_engine()
 # Data access
 # -----------------------------
 def fetch_categories():
-    sql = text("""
-        SELECT id, category, dateAdded
-        FROM dbo.category
-        ORDER BY category
-    """)
-    with engine.begin() as cx:
-        return pd.read_sql(sql, cx)
+    taxonomy = get_taxonomy(engine)
+    return to_frame(taxonomy.categories, Category, ["id", "category", "dateAdded"])
 
 def fetch_subcategories(category_id: int):
-    sql = text("""
-        SELECT id, subCategory, dateAdded
-        FROM dbo.subCategory
-        WHERE category_id = :cid
-        ORDER BY subCategory
-    """)
-    with engine.begin() as cx:
-        return pd.read_sql(sql, cx, params={"cid": category_id})
+    taxonomy = get_taxonomy(engine)
+    return to_frame(taxonomy.subcategories(category_id), SubCategory, ["id", "subCategory", "dateAdded"])
 
 def category_exists(name: str) -> bool:
-    sql = text("""
+    d = dialect_for(engine)
+    sql = text(f"""
         SELECT 1
         FROM dbo.category
-        WHERE LTRIM(RTRIM(category)) = LTRIM(RTRIM(:name))
+        WHERE {d.fold(d.trimmed_name("category"))} = {d.fold("LTRIM(RTRIM(:name))")}
     """)
     with engine.begin() as cx:
         row = cx.execute(sql, {"name": name}).fetchone()
         return row is not None
 
-def insert_category(name: str):
+def insert_category(name: str) -> bool:
+    # False when a concurrent insert of the same name reached the unique index first
     sql = text("INSERT INTO dbo.category (category) VALUES (:name)")
-    with engine.begin() as cx:
-        cx.execute(sql, {"name": name})
+    try:
+        with engine.begin() as cx:
+            cx.execute(sql, {"name": name})
+    except IntegrityError:
+        return False
+    invalidate_taxonomy()
+    return True
 
 def subcategory_exists(category_id: int, name: str) -> bool:
-    sql = text("""
+    d = dialect_for(engine)
+    sql = text(f"""
         SELECT 1
         FROM dbo.subCategory
         WHERE category_id = :cid
-          AND LTRIM(RTRIM(subCategory)) = LTRIM(RTRIM(:name))
+          AND {d.fold(d.trimmed_name("subCategory"))} = {d.fold("LTRIM(RTRIM(:name))")}
     """)
     with engine.begin() as cx:
         row = cx.execute(sql, {"cid": category_id, "name": name}).fetchone()
         return row is not None
 
-def insert_subcategory(category_id: int, name: str):
+def insert_subcategory(category_id: int, name: str) -> bool:
+    # False when a concurrent insert of the same name reached the unique index first
     sql = text("""
         INSERT INTO dbo.subCategory (category_id, subCategory)
         VALUES (:cid, :name)
     """)
-    with engine.begin() as cx:
-        cx.execute(sql, {"cid": category_id, "name": name})
+    try:
+        with engine.begin() as cx:
+            cx.execute(sql, {"cid": category_id, "name": name})
+    except IntegrityError:
+        return False
+    invalidate_taxonomy()
+    return True
 
 def delete_subcategory(subcat_id: int):
     sql = text("DELETE FROM dbo.subCategory WHERE id = :id")
     with engine.begin() as cx:
         cx.execute(sql, {"id": subcat_id})
+    invalidate_taxonomy()
 
 # -----------------------------
 # UI
 # -----------------------------
-st.title("🧱 Subcategories Admin (SQL Server)")
+st.title("🧱 Subcategories Admin")
 st.caption("Add new **subCategory** rows keyed to existing **category** values in the `pillars` database.")
 
 with st.sidebar:
@@ -113,10 +96,9 @@ with st.sidebar:
             if not name:
                 st.error("Category name is required.")
             else:
-                if category_exists(name):
+                if category_exists(name) or not insert_category(name):
                     st.warning(f"Category '{name}' already exists.")
                 else:
-                    insert_category(name)
                     st.success(f"Category '{name}' added.")
                     st.rerun()
 
@@ -146,10 +128,9 @@ with left:
             if not subname:
                 st.error("Subcategory name is required.")
             else:
-                if subcategory_exists(selected_category_id, subname):
+                if subcategory_exists(selected_category_id, subname) or not insert_subcategory(selected_category_id, subname):
                     st.warning(f"'{subname}' already exists for this category.")
                 else:
-                    insert_subcategory(selected_category_id, subname)
                     st.success(f"Subcategory '{subname}' added to {selected_label}.")
                     st.rerun()
 
@@ -175,5 +156,6 @@ with right:
 
 # Footer
 st.markdown("---")
-st.caption(f"Connected to **{st.secrets['sqlserver']['database']}** · {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
-
+st.caption(f"Connected to **{database_label()}** · {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
+query_panel()
+finish_rerun_profile()
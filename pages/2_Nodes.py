@@ -1,36 +1,18 @@
 # pages/02_PillarNodes.py
-import urllib.parse
 from datetime import datetime
-import pandas as pd
 import streamlit as st
-from sqlalchemy import create_engine, text
-from sqlalchemy.exc import DBAPIError
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, IntegrityError
 
-st.set_page_config(page_title="Pillar Nodes Admin", layout="wide")
-
-# -----------------------------
-# Connection (Windows Auth-friendly)
-# -----------------------------
-def _build_sqlalchemy_url():
-    cfg = st.secrets["sqlserver"]
-    driver = cfg.get("driver", "ODBC Driver 18 for SQL Server")
-    parts = [
-        f"DRIVER={{{driver}}}",
-        f"SERVER={cfg['server']}",
-        f"DATABASE={cfg['database']}",
-        f"Encrypt={cfg.get('encrypt','no')}",
-        f"TrustServerCertificate={cfg.get('trust_server_certificate','yes')}",
-    ]
-    if cfg.get("windows_auth", True):
-        parts.append("Trusted_Connection=yes")  # Integrated Security
-    else:
-        parts += [f"UID={cfg['username']}", f"PWD={cfg['password']}"]
-    odbc = ";".join(parts) + ";"
-    return "mssql+pyodbc:///?odbc_connect=" + urllib.parse.quote_plus(odbc)
+from helpers.db import database_label, get_engine
+from helpers.dialect import dialect_for
+from helpers.mapping_counts import mapping_count_for_node
+from helpers.profiling import finish_rerun_profile, profiled_fragment, start_rerun_profile
+from helpers.query_stats import query_panel
+from helpers.taxonomy import Category, PillarNode, SubCategory, get_taxonomy, invalidate_taxonomy, to_frame
 
-@st.cache_resource(show_spinner=False)
-def get_engine():
-    return create_engine(_build_sqlalchemy_url(), pool_pre_ping=True, fast_executemany=True)
+st.set_page_config(page_title="Pillar Nodes Admin", layout="wide")
+start_rerun_profile()
 
 engine = get_engine()
 
@@ -38,109 +20,79 @@ engine = get_engine()
 # Data access helpers
 # -----------------------------
 def fetch_categories():
-    sql = text("SELECT id, category FROM dbo.category ORDER BY category;")
-    with engine.begin() as cx:
-        return pd.read_sql(sql, cx)
+    taxonomy = get_taxonomy(engine)
+    return to_frame(taxonomy.categories, Category, ["id", "category"])
 
 def fetch_subcategories(category_id: int):
-    sql = text("""
-        SELECT id, subCategory
-        FROM dbo.subCategory
-        WHERE category_id = :cid
-        ORDER BY subCategory;
-    """)
-    with engine.begin() as cx:
-        return pd.read_sql(sql, cx, params={"cid": category_id})
+    taxonomy = get_taxonomy(engine)
+    return to_frame(taxonomy.subcategories(category_id), SubCategory, ["id", "subCategory"])
 
 def fetch_pillar_nodes(subcat_id: int):
-    sql = text("""
-        SELECT id, pillarNode, pillarNodeDescription, dateAdded
-        FROM dbo.pillarNode
-        WHERE subCategory_id = :sid
-        ORDER BY pillarNode;
-    """)
-    with engine.begin() as cx:
-        return pd.read_sql(sql, cx, params={"sid": subcat_id})
+    taxonomy = get_taxonomy(engine)
+    return to_frame(taxonomy.nodes(subcat_id), PillarNode, ["id", "pillarNode", "pillarNodeDescription", "dateAdded"])
 
 def pillar_node_exists(subcat_id: int, name: str) -> bool:
-    sql = text("""
+    d = dialect_for(engine)
+    sql = text(f"""
         SELECT 1
         FROM dbo.pillarNode
         WHERE subCategory_id = :sid
-          AND LTRIM(RTRIM(pillarNode)) = LTRIM(RTRIM(:name));
+          AND {d.fold(d.trimmed_name("pillarNode"))} = {d.fold("LTRIM(RTRIM(:name))")};
     """)
     with engine.begin() as cx:
         row = cx.execute(sql, {"sid": subcat_id, "name": name}).fetchone()
         return row is not None
 
-def insert_pillar_node(subcat_id: int, name: str, desc: str | None):
+def insert_pillar_node(subcat_id: int, name: str, desc: str | None) -> bool:
+    # False when a concurrent insert of the same name reached the unique index first
     sql = text("""
         INSERT INTO dbo.pillarNode (subCategory_id, pillarNode, pillarNodeDescription)
         VALUES (:sid, :name, :desc);
     """)
-    with engine.begin() as cx:
-        cx.execute(sql, {"sid": subcat_id, "name": name, "desc": desc if desc else None})
-
-def update_pillar_node(node_id: int, name: str, desc: str | None):
+    try:
+        with engine.begin() as cx:
+            cx.execute(sql, {"sid": subcat_id, "name": name, "desc": desc if desc else None})
+    except IntegrityError:
+        return False
+    invalidate_taxonomy()
+    return True
+
+def update_pillar_node(node_id: int, name: str, desc: str | None) -> bool:
+    # False when a concurrent write took the name first (unique index, migration 7)
     sql = text("""
         UPDATE dbo.pillarNode
         SET pillarNode = :name,
             pillarNodeDescription = :desc
         WHERE id = :id;
     """)
-    with engine.begin() as cx:
-        cx.execute(sql, {"id": node_id, "name": name, "desc": desc if desc else None})
-
-def mapping_count_for_node(node_id: int) -> int:
-    sql = text("""
-        SELECT COUNT(*) AS cnt
-        FROM dbo.pillarNodeValueMapping
-        WHERE pillarNode_id = :pid;
-    """)
-    with engine.begin() as cx:
-        row = cx.execute(sql, {"pid": node_id}).fetchone()
-        return int(row[0]) if row else 0
+    try:
+        with engine.begin() as cx:
+            cx.execute(sql, {"id": node_id, "name": name, "desc": desc if desc else None})
+    except IntegrityError:
+        return False
+    invalidate_taxonomy()
+    return True
 
 def delete_pillar_node(node_id: int) -> tuple[bool, str]:
     # Guard against FK violations to mapping table
-    cnt = mapping_count_for_node(node_id)
+    cnt = mapping_count_for_node(engine, node_id)
     if cnt > 0:
         return False, f"Cannot delete: {cnt} mapping(s) exist in pillarNodeValueMapping. Remove those first."
     try:
         with engine.begin() as cx:
             cx.execute(text("DELETE FROM dbo.pillarNode WHERE id = :id;"), {"id": node_id})
+        invalidate_taxonomy()
         return True, f"Deleted pillar node id={node_id}."
     except DBAPIError as e:
         return False, f"Delete failed: {e.orig if hasattr(e, 'orig') else e}"
 
 # -----------------------------
-# UI
+# Fragments
 # -----------------------------
-st.title("🌿 Pillar Nodes Admin (SQL Server)")
-st.caption("Manage **dbo.pillarNode** entries by Category → Subcategory.")
-
-left, right = st.columns([1, 2], gap="large")
-
-with left:
-    st.subheader("1) Choose Category")
-    cat_df = fetch_categories()
-    if cat_df.empty:
-        st.info("No categories found. Create some on the Subcategories page.")
-        st.stop()
-    cat_options = {f"{r.category} (id={int(r.id)})": int(r.id) for r in cat_df.itertuples()}
-    cat_label = st.selectbox("Category", list(cat_options.keys()))
-    cat_id = cat_options[cat_label]
-
-    st.subheader("2) Choose Subcategory")
-    sub_df = fetch_subcategories(cat_id)
-    if sub_df.empty:
-        st.info("No subcategories under this category yet.")
-        st.stop()
-    sub_options = {f"{r.subCategory} (id={int(r.id)})": int(r.id) for r in sub_df.itertuples()}
-    sub_label = st.selectbox("Subcategory", list(sub_options.keys()))
-    sub_id = sub_options[sub_label]
-
-    st.markdown("---")
+# The Category → Subcategory cascade runs in the main script, so it is recomputed only
+# when one of its selectors changes; widgets in these fragments rerun just the fragment.
+@profiled_fragment
+def add_node_form(sub_id: int, sub_label: str):
     st.subheader("3) Add a Pillar Node")
     with st.form("add_node_form", clear_on_submit=True):
         name = st.text_input("Pillar node (varchar(50))", max_chars=50, placeholder="e.g., RBAC, CDC Connectors, Purge Jobs")
@@ -151,14 +103,14 @@ with left:
             d = (desc or "").strip()
             if not n:
                 st.error("Name is required.")
-            elif pillar_node_exists(sub_id, n):
+            elif pillar_node_exists(sub_id, n) or not insert_pillar_node(sub_id, n, d if d else None):
                 st.warning(f"'{n}' already exists in {sub_label}.")
             else:
-                insert_pillar_node(sub_id, n, d if d else None)
                 st.success(f"Added '{n}' to {sub_label}.")
                 st.rerun()
 
-with right:
+@profiled_fragment
+def nodes_pane(sub_id: int):
     st.subheader("Existing Pillar Nodes")
     nodes = fetch_pillar_nodes(sub_id)
     if nodes.empty:
@@ -182,12 +134,12 @@ with right:
                         st.error("Name cannot be empty.")
                     else:
                         # prevent dup within same subcategory if name changed
-                        if nn.lower().strip() != str(current["pillarNode"]).lower().strip() and pillar_node_exists(sub_id, nn):
+                        renamed = nn.lower().strip() != str(current["pillarNode"]).lower().strip()
+                        if (renamed and pillar_node_exists(sub_id, nn)) or not update_pillar_node(node_id, nn, nd if nd else None):
                             st.warning(f"'{nn}' already exists in this subcategory.")
                         else:
-                            update_pillar_node(node_id, nn, nd if nd else None)
                             st.success("Updated.")
-                            st.rerun()
+                            st.rerun(scope="fragment")
 
         with st.expander("🗑️ Delete a pillar node", expanded=False):
             del_sel = st.selectbox(
@@ -201,7 +153,42 @@ with right:
                 ok, msg = delete_pillar_node(int(del_id))
                 (st.success if ok else st.error)(msg)
                 if ok:
-                    st.rerun()
+                    st.rerun(scope="fragment")
+
+# -----------------------------
+# UI
+# -----------------------------
+st.title("🌿 Pillar Nodes Admin")
+st.caption("Manage **dbo.pillarNode** entries by Category → Subcategory.")
+
+left, right = st.columns([1, 2], gap="large")
+
+with left:
+    st.subheader("1) Choose Category")
+    cat_df = fetch_categories()
+    if cat_df.empty:
+        st.info("No categories found. Create some on the Subcategories page.")
+        st.stop()
+    cat_options = {f"{r.category} (id={int(r.id)})": int(r.id) for r in cat_df.itertuples()}
+    cat_label = st.selectbox("Category", list(cat_options.keys()))
+    cat_id = cat_options[cat_label]
+
+    st.subheader("2) Choose Subcategory")
+    sub_df = fetch_subcategories(cat_id)
+    if sub_df.empty:
+        st.info("No subcategories under this category yet.")
+        st.stop()
+    sub_options = {f"{r.subCategory} (id={int(r.id)})": int(r.id) for r in sub_df.itertuples()}
+    sub_label = st.selectbox("Subcategory", list(sub_options.keys()))
+    sub_id = sub_options[sub_label]
+
+    st.markdown("---")
+    add_node_form(sub_id, sub_label)
+
+with right:
+    nodes_pane(sub_id)
 
 st.markdown("---")
-st.caption(f"Connected to **{st.secrets['sqlserver']['database']}** · {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
+st.caption(f"Connected to **{database_label()}** · {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
+query_panel()
+finish_rerun_profile()
@@ -1,105 +1,105 @@
 # pages/03_PillarNodeValues.py
-import urllib.parse
 from datetime import datetime
 import pandas as pd
 import streamlit as st
-from sqlalchemy import create_engine, text
-from sqlalchemy.exc import DBAPIError
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, IntegrityError
+
+from helpers.db import database_label, get_engine
+from helpers.dialect import dialect_for
+from helpers.mapping_counts import mapping_count_for_value
+from helpers.paging import fetch_page, keyset_clause, page_cursor, pager_controls
+from helpers.profiling import finish_rerun_profile, start_rerun_profile
+from helpers.query_stats import query_panel
+from helpers.taxonomy import get_taxonomy, invalidate_taxonomy
+from helpers.value_search import get_value_index, index_value, unindex_value, value_search_filter
 
 st.set_page_config(page_title="Pillar Node Values Admin", layout="wide")
-
-# -----------------------------
-# Connection (Windows Auth-friendly)
-# -----------------------------
-def _build_sqlalchemy_url():
-    cfg = st.secrets["sqlserver"]
-    driver = cfg.get("driver", "ODBC Driver 18 for SQL Server")
-    parts = [
-        f"DRIVER={{{driver}}}",
-        f"SERVER={cfg['server']}",
-        f"DATABASE={cfg['database']}",
-        f"Encrypt={cfg.get('encrypt','no')}",
-        f"TrustServerCertificate={cfg.get('trust_server_certificate','yes')}",
-    ]
-    if cfg.get("windows_auth", True):
-        parts.append("Trusted_Connection=yes")  # Integrated Security
-    else:
-        parts += [f"UID={cfg['username']}", f"PWD={cfg['password']}"]
-    odbc = ";".join(parts) + ";"
-    return "mssql+pyodbc:///?odbc_connect=" + urllib.parse.quote_plus(odbc)
-
-@st.cache_resource(show_spinner=False)
-def get_engine():
-    return create_engine(_build_sqlalchemy_url(), pool_pre_ping=True, fast_executemany=True)
+start_rerun_profile()
 
 engine = get_engine()
 
 # -----------------------------
 # Data access helpers
 # -----------------------------
-def fetch_values(search: str | None = None) -> pd.DataFrame:
-    base = """
-        SELECT v.id,
+def fetch_values(search: str | None = None, after: tuple | None = None) -> tuple[pd.DataFrame, bool]:
+    # One keyset page in (pillarNodeValue, id) order; returns (page, has_next)
+    d = dialect_for(engine)
+    keyset, params = keyset_clause("v.pillarNodeValue", "v.id", after)
+    base = f"""
+        SELECT {d.top()}
+               v.id,
                v.pillarNodeValue,
                v.pillarNodeValueDescription,
                v.dateAdded,
-               COUNT(m.pillarNode_id) AS mappingCount
+               v.mappingCount
         FROM dbo.pillarNodeValue v
-        LEFT JOIN dbo.pillarNodeValueMapping m
-          ON m.pillarNodeValue_id = v.id
     """
-    where = " WHERE v.pillarNodeValue LIKE :pat OR v.pillarNodeValueDescription LIKE :pat " if search else ""
-    tail = " GROUP BY v.id, v.pillarNodeValue, v.pillarNodeValueDescription, v.dateAdded ORDER BY v.pillarNodeValue;"
-    sql = text(base + where + tail)
-    params = {"pat": f"%{search}%"} if search else {}
-    with engine.begin() as cx:
-        return pd.read_sql(sql, cx, params=params)
+    where = f" WHERE {keyset} "
+    if search:
+        # Substring matching is answered by the trigram index; SQL only seeks the ids
+        matches, match_params = value_search_filter(engine, search)
+        where += f" AND {matches} "
+        params.update(match_params)
+    tail = f" ORDER BY v.pillarNodeValue, v.id {d.limit()};"
+    return fetch_page(engine, base + where + tail, params)
+
+def value_count_estimate(search: str | None = None) -> int:
+    # From the cached taxonomy/index: no COUNT(*) per rerun
+    if search:
+        return len(get_value_index(engine).search(search))
+    return len(get_taxonomy(engine).values)
 
 def value_exists(name: str) -> bool:
-    sql = text("""
+    d = dialect_for(engine)
+    sql = text(f"""
         SELECT 1
         FROM dbo.pillarNodeValue
-        WHERE LTRIM(RTRIM(pillarNodeValue)) = LTRIM(RTRIM(:name));
+        WHERE {d.fold(d.trimmed_name("pillarNodeValue"))} = {d.fold("LTRIM(RTRIM(:name))")};
     """)
     with engine.begin() as cx:
         row = cx.execute(sql, {"name": name}).fetchone()
         return row is not None
 
-def insert_value(name: str, desc: str | None):
-    sql = text("""
-        INSERT INTO dbo.pillarNodeValue (pillarNodeValue, pillarNodeValueDescription)
-        VALUES (:name, :desc);
-    """)
-    with engine.begin() as cx:
-        cx.execute(sql, {"name": name, "desc": desc if desc else None})
-
-def update_value(val_id: int, name: str, desc: str | None):
+def insert_value(name: str, desc: str | None) -> int | None:
+    # New id, or None when a concurrent insert of the same name reached the unique index first
+    sql = text(dialect_for(engine).insert_returning(
+        "dbo.pillarNodeValue", "pillarNodeValue, pillarNodeValueDescription", ":name, :desc"))
+    try:
+        with engine.begin() as cx:
+            new_id = cx.execute(sql, {"name": name, "desc": desc if desc else None}).scalar()
+    except IntegrityError:
+        return None
+    invalidate_taxonomy()
+    index_value(new_id, name, desc)
+    return new_id
+
+def update_value(val_id: int, name: str, desc: str | None) -> bool:
+    # False when a concurrent write took the name first (unique index, migration 7)
     sql = text("""
         UPDATE dbo.pillarNodeValue
         SET pillarNodeValue = :name,
             pillarNodeValueDescription = :desc
         WHERE id = :id;
     """)
-    with engine.begin() as cx:
-        cx.execute(sql, {"id": val_id, "name": name, "desc": desc if desc else None})
-
-def mapping_count_for_value(val_id: int) -> int:
-    sql = text("""
-        SELECT COUNT(*) AS cnt
-        FROM dbo.pillarNodeValueMapping
-        WHERE pillarNodeValue_id = :vid;
-    """)
-    with engine.begin() as cx:
-        row = cx.execute(sql, {"vid": val_id}).fetchone()
-        return int(row[0]) if row else 0
+    try:
+        with engine.begin() as cx:
+            cx.execute(sql, {"id": val_id, "name": name, "desc": desc if desc else None})
+    except IntegrityError:
+        return False
+    invalidate_taxonomy()
+    index_value(val_id, name, desc)
+    return True
 
 def delete_value(val_id: int) -> tuple[bool, str]:
-    cnt = mapping_count_for_value(val_id)
+    cnt = mapping_count_for_value(engine, val_id)
     if cnt > 0:
         return False, f"Cannot delete: {cnt} mapping(s) exist in pillarNodeValueMapping. Remove those first."
     try:
         with engine.begin() as cx:
             cx.execute(text("DELETE FROM dbo.pillarNodeValue WHERE id = :id;"), {"id": val_id})
+        invalidate_taxonomy()
+        unindex_value(val_id)
         return True, f"Deleted pillar node value id={val_id}."
     except DBAPIError as e:
         return False, f"Delete failed: {e.orig if hasattr(e, 'orig') else e}"
@@ -107,12 +107,19 @@ def delete_value(val_id: int) -> tuple[bool, str]:
 # -----------------------------
 # UI
 # -----------------------------
-st.title("🔗 Pillar Node Values Admin (SQL Server)")
+st.title("🔗 Pillar Node Values Admin")
 st.caption("Manage **dbo.pillarNodeValue** entries (add, edit, delete). Deletions are blocked if mapped to any pillar nodes.")
 
 # Controls row
 search = st.text_input("Search values/description", placeholder="Type to filter…")
-values_df = fetch_values(search.strip() or None)
+term = search.strip() or None
+values_df, values_has_next = fetch_values(term, page_cursor("values_pager", term))
+if term and values_df.empty:
+    suggestions = get_value_index(engine).fuzzy(term, limit=5)
+    if suggestions:
+        by_id = get_taxonomy(engine).value_by_id
+        names = [by_id[vid].pillarNodeValue for vid, _ in suggestions if vid in by_id]
+        st.caption("No exact matches. Did you mean: " + ", ".join(f"**{n}**" for n in names) + "?")
 
 left, right = st.columns([1, 2], gap="large")
 
@@ -128,16 +135,16 @@ with left:
             d = (desc or "").strip()
             if not n:
                 st.error("Value is required.")
-            elif value_exists(n):
+            elif value_exists(n) or insert_value(n, d if d else None) is None:
                 st.warning(f"'{n}' already exists.")
             else:
-                insert_value(n, d if d else None)
                 st.success(f"Added '{n}'.")
                 st.rerun()
 
 # ---- Existing table + Edit/Delete
 with right:
     st.subheader("Existing values")
+    pager_controls("values_pager", values_df, values_has_next, value_count_estimate(term), "pillarNodeValue")
     if values_df.empty:
         st.info("No values found.")
     else:
@@ -168,10 +175,10 @@ with right:
                         st.error("Value cannot be empty.")
                     else:
                         # prevent global dup if changed
-                        if nn.lower().strip() != str(current["pillarNodeValue"]).lower().strip() and value_exists(nn):
+                        renamed = nn.lower().strip() != str(current["pillarNodeValue"]).lower().strip()
+                        if (renamed and value_exists(nn)) or not update_value(val_id, nn, nd if nd else None):
                             st.warning(f"'{nn}' already exists.")
                         else:
-                            update_value(val_id, nn, nd if nd else None)
                             st.success("Updated.")
                             st.rerun()
 
@@ -190,4 +197,6 @@ with right:
                     st.rerun()
 
 st.markdown("---")
-st.caption(f"Connected to **{st.secrets['sqlserver']['database']}** · {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
+st.caption(f"Connected to **{database_label()}** · {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
+query_panel()
+finish_rerun_profile()
@@ -1,36 +1,18 @@
 # pages/04_NodeValueMapping.py
-import urllib.parse
 from datetime import datetime
-import pandas as pd
 import streamlit as st
-from sqlalchemy import create_engine, text
-from sqlalchemy.exc import DBAPIError
 
-st.set_page_config(page_title="Pillar Node ↔ Value Mapping", layout="wide")
-
-# -----------------------------
-# Connection (Windows Auth-friendly)
-# -----------------------------
-def _build_sqlalchemy_url():
-    cfg = st.secrets["sqlserver"]
-    driver = cfg.get("driver", "ODBC Driver 18 for SQL Server")
-    parts = [
-        f"DRIVER={{{driver}}}",
-        f"SERVER={cfg['server']}",
-        f"DATABASE={cfg['database']}",
-        f"Encrypt={cfg.get('encrypt','no')}",
-        f"TrustServerCertificate={cfg.get('trust_server_certificate','yes')}",
-    ]
-    if cfg.get("windows_auth", True):
-        parts.append("Trusted_Connection=yes")  # Integrated Security
-    else:
-        parts += [f"UID={cfg['username']}", f"PWD={cfg['password']}"]
-    odbc = ";".join(parts) + ";"
-    return "mssql+pyodbc:///?odbc_connect=" + urllib.parse.quote_plus(odbc)
+from helpers.db import database_label, get_engine
+from helpers.dialect import dialect_for
+from helpers.mappings import add_mappings, remove_mappings
+from helpers.paging import fetch_page, keyset_clause, page_cursor, pager_controls
+from helpers.profiling import finish_rerun_profile, profiled_fragment, start_rerun_profile
+from helpers.query_stats import query_panel
+from helpers.taxonomy import Category, PillarNode, SubCategory, get_taxonomy, to_frame
+from helpers.value_search import get_value_index, value_search_filter
 
-@st.cache_resource(show_spinner=False)
-def get_engine():
-    return create_engine(_build_sqlalchemy_url(), pool_pre_ping=True, fast_executemany=True)
+st.set_page_config(page_title="Pillar Node ↔ Value Mapping", layout="wide")
+start_rerun_profile()
 
 engine = get_engine()
 
@@ -38,125 +20,86 @@ engine = get_engine()
 # Data helpers
 # -----------------------------
 def fetch_categories():
-    sql = text("SELECT id, category FROM dbo.category ORDER BY category;")
-    with engine.begin() as cx:
-        return pd.read_sql(sql, cx)
+    taxonomy = get_taxonomy(engine)
+    return to_frame(taxonomy.categories, Category, ["id", "category"])
 
 def fetch_subcategories(category_id: int):
-    sql = text("""
-        SELECT id, subCategory
-        FROM dbo.subCategory
-        WHERE category_id = :cid
-        ORDER BY subCategory;
-    """)
-    with engine.begin() as cx:
-        return pd.read_sql(sql, cx, params={"cid": category_id})
+    taxonomy = get_taxonomy(engine)
+    return to_frame(taxonomy.subcategories(category_id), SubCategory, ["id", "subCategory"])
 
 def fetch_pillar_nodes(subcat_id: int):
-    sql = text("""
-        SELECT id, pillarNode, pillarNodeDescription, dateAdded
-        FROM dbo.pillarNode
-        WHERE subCategory_id = :sid
-        ORDER BY pillarNode;
-    """)
-    with engine.begin() as cx:
-        return pd.read_sql(sql, cx, params={"sid": subcat_id})
-
-def fetch_mapped_values(node_id: int, search: str | None = None):
-    sql = """
-        SELECT v.id,
+    taxonomy = get_taxonomy(engine)
+    return to_frame(taxonomy.nodes(subcat_id), PillarNode, ["id", "pillarNode", "pillarNodeDescription", "dateAdded"])
+
+def fetch_mapped_values(node_id: int, search: str | None = None, after: tuple | None = None):
+    # One keyset page in (pillarNodeValue, id) order; returns (page, has_next)
+    d = dialect_for(engine)
+    keyset, params = keyset_clause("v.pillarNodeValue", "v.id", after)
+    sql = f"""
+        SELECT {d.top()}
+               v.id,
                v.pillarNodeValue,
                v.pillarNodeValueDescription,
                m.dateAdded
         FROM dbo.pillarNodeValueMapping m
         JOIN dbo.pillarNodeValue v
           ON v.id = m.pillarNodeValue_id
-        WHERE m.pillarNode_id = :nid
+        WHERE m.pillarNode_id = :nid AND {keyset}
     """
-    params = {"nid": node_id}
+    params["nid"] = node_id
     if search:
-        sql += " AND (v.pillarNodeValue LIKE :pat OR v.pillarNodeValueDescription LIKE :pat) "
-        params["pat"] = f"%{search}%"
-    sql += " ORDER BY v.pillarNodeValue;"
-    with engine.begin() as cx:
-        return pd.read_sql(text(sql), cx, params=params)
-
-def fetch_available_values(node_id: int, search: str | None = None):
-    # All values NOT currently mapped to this node
-    sql = """
-        SELECT v.id,
+        matches, match_params = value_search_filter(engine, search)
+        sql += f" AND {matches} "
+        params.update(match_params)
+    sql += f" ORDER BY v.pillarNodeValue, v.id {d.limit()};"
+    return fetch_page(engine, sql, params)
+
+def fetch_available_values(node_id: int, search: str | None = None, after: tuple | None = None):
+    # Values NOT currently mapped to this node, one keyset page at a time
+    d = dialect_for(engine)
+    keyset, params = keyset_clause("v.pillarNodeValue", "v.id", after)
+    sql = f"""
+        SELECT {d.top()}
+               v.id,
                v.pillarNodeValue,
                v.pillarNodeValueDescription
         FROM dbo.pillarNodeValue v
         LEFT JOIN dbo.pillarNodeValueMapping m
           ON m.pillarNodeValue_id = v.id
          AND m.pillarNode_id = :nid
-        WHERE m.pillarNode_id IS NULL
+        WHERE m.pillarNode_id IS NULL AND {keyset}
     """
-    params = {"nid": node_id}
+    params["nid"] = node_id
     if search:
-        sql += " AND (v.pillarNodeValue LIKE :pat OR v.pillarNodeValueDescription LIKE :pat) "
-        params["pat"] = f"%{search}%"
-    sql += " ORDER BY v.pillarNodeValue;"
-    with engine.begin() as cx:
-        return pd.read_sql(text(sql), cx, params=params)
-
-def add_mappings(node_id: int, value_ids: list[int]) -> tuple[int, list[int]]:
-    """Insert mappings; ignore ones that already exist. Returns (inserted_count, skipped_ids)."""
-    inserted = 0
-    skipped = []
-    if not value_ids:
-        return 0, skipped
-    with engine.begin() as cx:
-        for vid in value_ids:
-            try:
-                cx.execute(
-                    text("""
-                        IF NOT EXISTS (
-                          SELECT 1 FROM dbo.pillarNodeValueMapping
-                          WHERE pillarNode_id = :nid AND pillarNodeValue_id = :vid
-                        )
-                        INSERT INTO dbo.pillarNodeValueMapping (pillarNode_id, pillarNodeValue_id)
-                        VALUES (:nid, :vid);
-                    """),
-                    {"nid": node_id, "vid": int(vid)},
-                )
-                # We can't easily know if it inserted vs skipped without OUTPUT; do a small check:
-                check = cx.execute(
-                    text("""
-                        SELECT COUNT(*) AS c FROM dbo.pillarNodeValueMapping
-                        WHERE pillarNode_id = :nid AND pillarNodeValue_id = :vid
-                    """),
-                    {"nid": node_id, "vid": int(vid)}
-                ).fetchone()
-                if check and int(check[0]) >= 1:
-                    # naive: treat as success (but we can't distinguish brand-new vs pre-existing cheaply)
-                    inserted += 1  # count as mapped
-            except DBAPIError:
-                skipped.append(int(vid))
-    # Adjust 'inserted' to count unique final mappings only:
-    inserted = len(set(value_ids)) - len(skipped)
-    return inserted, skipped
-
-def remove_mappings(node_id: int, value_ids: list[int]) -> int:
-    """Delete mappings for given ids. Returns count attempted (approx)."""
-    if not value_ids:
-        return 0
-    with engine.begin() as cx:
-        for vid in value_ids:
-            cx.execute(
-                text("""
-                    DELETE FROM dbo.pillarNodeValueMapping
-                    WHERE pillarNode_id = :nid AND pillarNodeValue_id = :vid
-                """),
-                {"nid": node_id, "vid": int(vid)},
-            )
-    return len(value_ids)
+        matches, match_params = value_search_filter(engine, search)
+        sql += f" AND {matches} "
+        params.update(match_params)
+    sql += f" ORDER BY v.pillarNodeValue, v.id {d.limit()};"
+    return fetch_page(engine, sql, params)
+
+def filtered_value_count(node_id: int, search: str | None, mapped: bool) -> int:
+    # Row-count estimate for a pane, from the cached taxonomy + search index: the
+    # value count less the node's mappings, never a list of every value
+    taxonomy = get_taxonomy(engine)
+    on_node = taxonomy.values_for_node(node_id)
+    if not search:
+        return len(on_node) if mapped else len(taxonomy.values) - len(on_node)
+    matched = get_value_index(engine).search(search)
+    matched_on_node = sum(1 for v in on_node if v.id in matched)
+    return matched_on_node if mapped else len(matched) - matched_on_node
+
+def filtered_value_ids(node_id: int, search: str | None, mapped: bool) -> list[int]:
+    # Every id behind a pane (all pages); only built for the "ALL filtered" actions
+    taxonomy = get_taxonomy(engine)
+    mapped_ids = {v.id for v in taxonomy.values_for_node(node_id)}
+    matched = get_value_index(engine).search(search) if search else None
+    pool = mapped_ids if mapped else [v.id for v in taxonomy.values if v.id not in mapped_ids]
+    return [vid for vid in pool if matched is None or vid in matched]
 
 # -----------------------------
 # UI
 # -----------------------------
-st.title("🔗 Map Values to Pillar Nodes (SQL Server)")
+st.title("🔗 Map Values to Pillar Nodes")
 st.caption("Associate **pillarNodeValue** entries to a **pillarNode** via `dbo.pillarNodeValueMapping`.")
 
 # Step 1: Category
@@ -191,13 +134,21 @@ node_id = node_options[node_label]
 
 st.markdown("---")
 
+# -----------------------------
 # Two-pane mapping manager
-left, right = st.columns(2, gap="large")
-
-with left:
+# -----------------------------
+# Each pane is a fragment: typing in its filter, paging or ticking values reruns only
+# that pane and its query, not the cascade above or the other pane. Mapping changes
+# touch both panes, so they rerun the whole page.
+@profiled_fragment
+def available_pane(node_id: int):
     st.subheader("Available values (not mapped)")
     search_available = st.text_input("Filter available values", key="search_avail", placeholder="Type to filter…")
-    available_df = fetch_available_values(node_id, search_available.strip() or None)
+    avail_term = search_available.strip() or None
+    available_df, avail_has_next = fetch_available_values(
+        node_id, avail_term, page_cursor("avail_pager", (node_id, avail_term)))
+    pager_controls("avail_pager", available_df, avail_has_next,
+                   filtered_value_count(node_id, avail_term, mapped=False), "pillarNodeValue")
 
     if available_df.empty:
         st.info("No unmapped values match the filter.")
@@ -217,23 +168,28 @@ with left:
     c1, c2 = st.columns([1,1])
     with c1:
         if st.button("➕ Add selected", type="primary", use_container_width=True, disabled=(len(to_add_ids) == 0)):
-            inserted, skipped = add_mappings(node_id, to_add_ids)
+            inserted, already = add_mappings(engine, node_id, to_add_ids)
             st.success(f"Mapped {inserted} value(s).")
-            if skipped:
-                st.warning(f"Skipped {len(skipped)} (errors).")
+            if already:
+                st.info(f"{already} already mapped.")
             st.rerun()
     with c2:
         if not available_df.empty and st.button("➕ Add ALL filtered", use_container_width=True):
-            inserted, skipped = add_mappings(node_id, ids_avail)
+            inserted, already = add_mappings(engine, node_id, filtered_value_ids(node_id, avail_term, mapped=False))
             st.success(f"Mapped {inserted} value(s).")
-            if skipped:
-                st.warning(f"Skipped {len(skipped)} (errors).")
+            if already:
+                st.info(f"{already} already mapped.")
             st.rerun()
 
-with right:
+@profiled_fragment
+def mapped_pane(node_id: int):
     st.subheader("Currently mapped values")
     search_mapped = st.text_input("Filter mapped values", key="search_mapped", placeholder="Type to filter…")
-    mapped_df = fetch_mapped_values(node_id, search_mapped.strip() or None)
+    mapped_term = search_mapped.strip() or None
+    mapped_df, mapped_has_next = fetch_mapped_values(
+        node_id, mapped_term, page_cursor("mapped_pager", (node_id, mapped_term)))
+    pager_controls("mapped_pager", mapped_df, mapped_has_next,
+                   filtered_value_count(node_id, mapped_term, mapped=True), "pillarNodeValue")
 
     if mapped_df.empty:
         st.info("No mapped values match the filter.")
@@ -262,14 +218,22 @@ with right:
     c3, c4 = st.columns([1,1])
     with c3:
         if st.button("🗑️ Remove selected", type="primary", use_container_width=True, disabled=(len(to_remove_ids) == 0)):
-            removed = remove_mappings(node_id, to_remove_ids)
+            removed = remove_mappings(engine, node_id, to_remove_ids)
             st.success(f"Removed {removed} mapping(s).")
             st.rerun()
     with c4:
         if not mapped_df.empty and st.button("🗑️ Remove ALL filtered", use_container_width=True):
-            removed = remove_mappings(node_id, ids_map)
+            removed = remove_mappings(engine, node_id, filtered_value_ids(node_id, mapped_term, mapped=True))
             st.success(f"Removed {removed} mapping(s).")
             st.rerun()
 
+left, right = st.columns(2, gap="large")
+with left:
+    available_pane(node_id)
+with right:
+    mapped_pane(node_id)
+
 st.markdown("---")
-st.caption(f"{node_label} · Connected to **{st.secrets['sqlserver']['database']}** · {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
+st.caption(f"{node_label} · Connected to **{database_label()}** · {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
+query_panel()
+finish_rerun_profile()
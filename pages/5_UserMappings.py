@@ -1,109 +1,30 @@
 # pages/05_UserPreferences_MultiSource.py
 import os
-import urllib.parse
 from datetime import datetime
 from typing import Dict, List, Optional
 
 import pandas as pd
 import streamlit as st
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.exc import DBAPIError
 
-st.set_page_config(page_title="User Preferences by Data Source", layout="wide")
-
-# -----------------------------
-# Connection (Windows Auth-friendly)
-# -----------------------------
-def _build_sqlalchemy_url():
-    cfg = st.secrets["sqlserver"]
-    driver = cfg.get("driver", "ODBC Driver 18 for SQL Server")
-    parts = [
-        f"DRIVER={{{driver}}}",
-        f"SERVER={cfg['server']}",
-        f"DATABASE={cfg['database']}",
-        f"Encrypt={cfg.get('encrypt','no')}",
-        f"TrustServerCertificate={cfg.get('trust_server_certificate','yes')}",
-    ]
-    if cfg.get("windows_auth", True):
-        parts.append("Trusted_Connection=yes")  # Integrated Security
-    else:
-        parts += [f"UID={cfg['username']}", f"PWD={cfg['password']}"]
-    odbc = ";".join(parts) + ";"
-    return "mssql+pyodbc:///?odbc_connect=" + urllib.parse.quote_plus(odbc)
+from helpers.db import database_label, get_engine
+from helpers.dialect import dialect_for
+from helpers.preferences import PREF_COLUMNS, PREF_KEYS, diff_prefs, save_prefs, stamp_profile_change
+from helpers.profiling import finish_rerun_profile, start_rerun_profile
+from helpers.query_stats import query_panel
+from helpers.rules import ProfileEvaluator, get_compiled_rules
+from helpers.taxonomy import get_taxonomy
+from helpers.value_search import get_value_index
 
-@st.cache_resource(show_spinner=False)
-def get_engine():
-    return create_engine(_build_sqlalchemy_url(), pool_pre_ping=True, fast_executemany=True)
+st.set_page_config(page_title="User Preferences by Data Source", layout="wide")
+start_rerun_profile()
 
 engine = get_engine()
 
-# -----------------------------
-# Schema bootstrap (idempotent)
-# Keeps simple string-based dataSource (no extra table required)
-# -----------------------------
-def init_schema():
-    ddl = """
-    IF NOT EXISTS (SELECT * FROM sys.objects WHERE object_id = OBJECT_ID(N'[dbo].[userNodePreference]') AND type in (N'U'))
-    BEGIN
-        CREATE TABLE dbo.userNodePreference (
-            userName            varchar(200) NOT NULL,
-            pillarNode_id       int NOT NULL,
-            pillarNodeValue_id  int NOT NULL,
-            dataSource          varchar(100) NOT NULL CONSTRAINT DF_userNodePreference_dataSource DEFAULT(''),
-            dateAdded           datetime NOT NULL CONSTRAINT DF_userNodePreference_dateAdded DEFAULT (GETDATE()),
-            CONSTRAINT PK_userNodePreference PRIMARY KEY CLUSTERED (userName, pillarNode_id, dataSource)
-        );
-        ALTER TABLE dbo.userNodePreference WITH CHECK
-            ADD CONSTRAINT FK_userPref_Node  FOREIGN KEY(pillarNode_id)      REFERENCES dbo.pillarNode(id);
-        ALTER TABLE dbo.userNodePreference WITH CHECK
-            ADD CONSTRAINT FK_userPref_Value FOREIGN KEY(pillarNodeValue_id) REFERENCES dbo.pillarNodeValue(id);
-
-        CREATE INDEX IX_userNodePreference_user_ds ON dbo.userNodePreference(userName, dataSource);
-    END
-    """
-    with engine.begin() as cx:
-        cx.execute(text(ddl))
-
-init_schema()
-
 # -----------------------------
 # Data helpers
 # -----------------------------
-def fetch_categories() -> pd.DataFrame:
-    with engine.begin() as cx:
-        return pd.read_sql(text("SELECT id, category FROM dbo.category ORDER BY category;"), cx)
-
-def fetch_subcategories(category_id: int) -> pd.DataFrame:
-    with engine.begin() as cx:
-        return pd.read_sql(
-            text("""SELECT id, subCategory
-                    FROM dbo.subCategory
-                    WHERE category_id = :cid
-                    ORDER BY subCategory;"""),
-            cx, params={"cid": category_id}
-        )
-
-def fetch_nodes(subcat_id: int) -> pd.DataFrame:
-    with engine.begin() as cx:
-        return pd.read_sql(
-            text("""SELECT id, pillarNode, pillarNodeDescription
-                    FROM dbo.pillarNode
-                    WHERE subCategory_id = :sid
-                    ORDER BY pillarNode;"""),
-            cx, params={"sid": subcat_id}
-        )
-
-def fetch_values_for_node(node_id: int) -> pd.DataFrame:
-    with engine.begin() as cx:
-        return pd.read_sql(
-            text("""SELECT v.id, v.pillarNodeValue, v.pillarNodeValueDescription
-                    FROM dbo.pillarNodeValueMapping m
-                    JOIN dbo.pillarNodeValue v ON v.id = m.pillarNodeValue_id
-                    WHERE m.pillarNode_id = :nid
-                    ORDER BY v.pillarNodeValue;"""),
-            cx, params={"nid": node_id}
-        )
-
 def fetch_user_contexts(user_name: str) -> List[str]:
     with engine.begin() as cx:
         rows = cx.execute(
@@ -125,67 +46,35 @@ def fetch_user_pref_map(user_name: str, data_source: str) -> Dict[int, int]:
         ).fetchall()
     return {int(r[0]): int(r[1]) for r in rows}
 
-def upsert_pref(user_name: str, data_source: str, node_id: int, value_id: int):
-    with engine.begin() as cx:
-        cx.execute(
-            text("""
-            MERGE dbo.userNodePreference AS tgt
-            USING (SELECT :u AS userName, :nid AS pillarNode_id, :ds AS dataSource) AS src
-            ON (tgt.userName = src.userName AND tgt.pillarNode_id = src.pillarNode_id AND tgt.dataSource = src.dataSource)
-            WHEN MATCHED THEN UPDATE
-                SET pillarNodeValue_id = :vid, dateAdded = GETDATE()
-            WHEN NOT MATCHED THEN
-                INSERT (userName, pillarNode_id, pillarNodeValue_id, dataSource)
-                VALUES (:u, :nid, :vid, :ds);
-            """),
-            {"u": user_name, "ds": data_source, "nid": int(node_id), "vid": int(value_id)}
-        )
-
-def clear_pref(user_name: str, data_source: str, node_id: int):
-    with engine.begin() as cx:
-        cx.execute(
-            text("""DELETE FROM dbo.userNodePreference
-                    WHERE userName = :u AND dataSource = :ds AND pillarNode_id = :nid;"""),
-            {"u": user_name, "ds": data_source, "nid": int(node_id)}
-        )
-
 def clear_all_prefs(user_name: str, data_source: str):
+    params = {"u": user_name, "ds": data_source}
     with engine.begin() as cx:
+        stamp_profile_change(cx, dialect_for(engine), params)
         cx.execute(
             text("""DELETE FROM dbo.userNodePreference
                     WHERE userName = :u AND dataSource = :ds;"""),
-            {"u": user_name, "ds": data_source}
+            params
         )
 
 def rename_context(user_name: str, old: str, new: str):
+    # Stamped so the incremental hit refresh evaluates the profile under its new name
     with engine.begin() as cx:
         cx.execute(
-            text("""UPDATE dbo.userNodePreference
-                    SET dataSource = :new
-                    WHERE userName = :u AND dataSource = :old;"""),
+            text(f"""UPDATE dbo.userNodePreference
+                     SET dataSource = :new, dateAdded = {dialect_for(engine).now}
+                     WHERE userName = :u AND dataSource = :old;"""),
             {"u": user_name, "old": old, "new": new}
         )
 
 def duplicate_context(user_name: str, src: str, dest: str):
     # Copy/overwrite prefs from src -> dest
+    sql = dialect_for(engine).upsert("dbo.userNodePreference", PREF_KEYS, PREF_COLUMNS, """
+        SELECT :u AS userName, p.pillarNode_id, p.pillarNodeValue_id, :dest AS dataSource
+        FROM dbo.userNodePreference p
+        WHERE p.userName = :u AND p.dataSource = :src
+    """)
     with engine.begin() as cx:
-        cx.execute(
-            text("""
-            MERGE dbo.userNodePreference AS tgt
-            USING (
-                SELECT :u AS userName, p.pillarNode_id, :dest AS dataSource, p.pillarNodeValue_id
-                FROM dbo.userNodePreference p
-                WHERE p.userName = :u AND p.dataSource = :src
-            ) AS srcq
-            ON (tgt.userName = srcq.userName AND tgt.pillarNode_id = srcq.pillarNode_id AND tgt.dataSource = srcq.dataSource)
-            WHEN MATCHED THEN UPDATE
-                SET pillarNodeValue_id = srcq.pillarNodeValue_id, dateAdded = GETDATE()
-            WHEN NOT MATCHED THEN
-                INSERT (userName, pillarNode_id, pillarNodeValue_id, dataSource)
-                VALUES (srcq.userName, srcq.pillarNode_id, srcq.pillarNodeValue_id, srcq.dataSource);
-            """),
-            {"u": user_name, "src": src, "dest": dest}
-        )
+        cx.execute(text(sql), {"u": user_name, "src": src, "dest": dest})
 
 def fetch_current_prefs_table(user_name: str, data_source: str) -> pd.DataFrame:
     sql = text("""
@@ -283,102 +172,198 @@ with st.expander("🔎 Filters", expanded=False):
     filter_text = st.text_input("Filter nodes/values", placeholder="Type to filter by node or value…").strip().lower()
 
 # -----------------------------
-# Drilldown + Editor (same pattern as before)
+# Drilldown + Editor
 # -----------------------------
 pref_map = fetch_user_pref_map(user_name, active_source)
-cat_df = fetch_categories()
-if cat_df.empty:
+taxonomy = get_taxonomy(engine)
+if not taxonomy.categories:
     st.info("No categories found. Add categories first.")
     st.stop()
 
+# -----------------------------
+# Unsaved selections
+# -----------------------------
+# Only the chosen category's selectboxes exist on a rerun and Streamlit drops the state
+# of widgets it does not render, so edits live in a per-source draft until saved.
+def sel_key(node) -> str:
+    sub = taxonomy.subcategory_by_id[node.subCategory_id]
+    return f"sel_{sub.category_id}_{sub.id}_{node.id}"
+
+def current_drafts() -> Dict[int, Optional[int]]:
+    store = st.session_state.setdefault("pref_drafts", {})
+    return store.setdefault((user_name, active_source), {})
+
+def record_draft(draft: Dict[int, Optional[int]], node_id: int, stored: Optional[int], key: str):
+    # on_change: runs before the rerun, so the live warnings below already see it
+    choice = st.session_state.get(key)
+    vid = choice[1] if isinstance(choice, tuple) else None
+    if vid == stored:
+        draft.pop(node_id, None)
+    else:
+        draft[node_id] = vid
+
+def discard_drafts():
+    current_drafts().clear()
+    for key in [k for k in st.session_state if isinstance(k, str) and k.startswith("sel_")]:
+        del st.session_state[key]
+
+drafts = current_drafts()
+
+def working_profile() -> Dict[int, Optional[int]]:
+    # Stored profile overlaid with the unsaved selections, wherever they were made
+    working: Dict[int, Optional[int]] = dict(pref_map)
+    for nid, vid in drafts.items():
+        if vid is None:
+            working.pop(nid, None)
+        else:
+            working[nid] = vid
+    return working
+
+# -----------------------------
+# Live warnings (in-progress selections, evaluated in memory)
+# -----------------------------
+def live_evaluator(compiled, working: Dict[int, Optional[int]]) -> ProfileEvaluator:
+    # One evaluator per session; reruns only feed it the nodes that changed
+    key = (user_name, active_source, id(compiled))
+    ev = st.session_state.get("live_rule_eval")
+    if ev is None or st.session_state.get("live_rule_eval_key") != key:
+        ev = ProfileEvaluator(compiled, working, active_source)
+        st.session_state["live_rule_eval"] = ev
+        st.session_state["live_rule_eval_key"] = key
+    else:
+        delta = {nid: vid for nid, vid in working.items() if ev.prefs.get(nid) != vid}
+        delta.update({nid: None for nid in ev.prefs if nid not in working})
+        ev.update(delta)
+    return ev
+
+OPTION_MARKERS = {"Error": "⛔", "Warning": "⚠️"}
+
+compiled_rules = get_compiled_rules(engine)
+live_eval = live_evaluator(compiled_rules, working_profile())
+live_hits = live_eval.hit_indexes()
+
 st.markdown("---")
-changes: List[Dict] = []
+if live_hits:
+    st.subheader(f"⚠️ {len(live_hits)} warning(s) for the current selections")
+    for ri in live_hits:
+        sev = compiled_rules.severities[ri]
+        show = st.error if sev == "Error" else st.warning if sev == "Warning" else st.info
+        show(f"**{compiled_rules.names[ri]}** — {compiled_rules.messages[ri]}")
+elif compiled_rules.rule_ids:
+    st.caption("✅ No warning rules triggered by the current selections.")
+
+# -----------------------------
+# Category picker: only the chosen category (or one of its subcategories) is built
+# -----------------------------
+unsaved_by_category: Dict[int, int] = {}
+for nid in drafts:
+    node = taxonomy.node_by_id.get(nid)
+    if node is not None:
+        cid = taxonomy.subcategory_by_id[node.subCategory_id].category_id
+        unsaved_by_category[cid] = unsaved_by_category.get(cid, 0) + 1
+
+def category_label(cid: int) -> str:
+    n = unsaved_by_category.get(cid)
+    return f"📁 {taxonomy.category_by_id[cid].category}" + (f" · {n} unsaved" if n else "")
+
+cat_ids = [cat.id for cat in taxonomy.categories if taxonomy.subcategories(cat.id)]
+if not cat_ids:
+    st.info("No subcategories found. Add subcategories first.")
+    st.stop()
 
-for cat in cat_df.itertuples():
-    sub_df = fetch_subcategories(int(cat.id))
-    if sub_df.empty:
+pick_cat, pick_sub = st.columns(2)
+with pick_cat:
+    cat_id = st.selectbox("Category", cat_ids, format_func=category_label, key="pref_category")
+subs = [sub for sub in taxonomy.subcategories(cat_id) if taxonomy.nodes(sub.id)]
+with pick_sub:
+    sub_id = st.selectbox(
+        "Subcategory",
+        [None] + [sub.id for sub in subs],
+        format_func=lambda sid: "All subcategories" if sid is None else taxonomy.subcategory_by_id[sid].subCategory,
+        key=f"pref_subcategory_{cat_id}",
+    )
+
+matching_ids = get_value_index(engine).search(filter_text) if filter_text else set()
+
+if not subs:
+    st.info("No pillar nodes in this category yet.")
+for sub in subs:
+    if sub_id is not None and sub.id != sub_id:
         continue
-    with st.expander(f"📁 {cat.category}", expanded=False):
-        for sub in sub_df.itertuples():
-            nodes_df = fetch_nodes(int(sub.id))
-            if nodes_df.empty:
+    nodes = taxonomy.nodes(sub.id)
+    st.markdown(f"### 🧩 {sub.subCategory}")
+
+    cols = st.columns(2, gap="large")
+    col_idx = 0
+
+    for node in nodes:
+        node_text = f"{node.pillarNode} {(node.pillarNodeDescription or '')}".lower()
+        values = taxonomy.values_for_node(node.id)
+        if filter_text:
+            matching = [v for v in values if v.id in matching_ids]
+            if filter_text not in node_text and not matching:
                 continue
-            st.markdown(f"### 🧩 {sub.subCategory}")
-
-            cols = st.columns(2, gap="large")
-            col_idx = 0
-
-            for node in nodes_df.itertuples():
-                node_text = f"{node.pillarNode} {(node.pillarNodeDescription or '')}".lower()
-                values_df = fetch_values_for_node(int(node.id))
-                if filter_text:
-                    if (filter_text not in node_text) and (
-                        values_df.empty or not (
-                            values_df["pillarNodeValue"].str.lower().str.contains(filter_text).any()
-                            | values_df["pillarNodeValueDescription"].fillna("").str.lower().str.contains(filter_text).any()
-                        )
-                    ):
-                        continue
-                    # filter values
-                    values_df = values_df[
-                        values_df["pillarNodeValue"].str.lower().str.contains(filter_text)
-                        | values_df["pillarNodeValueDescription"].fillna("").str.lower().str.contains(filter_text)
-                    ]
-
-                with cols[col_idx]:
-                    with st.container(border=True):
-                        st.markdown(f"**{node.pillarNode}**")
-                        if node.pillarNodeDescription:
-                            st.caption(node.pillarNodeDescription)
-
-                        if values_df.empty:
-                            st.info("No mapped values (or filtered out).")
-                            sel = None
-                        else:
-                            labels = [f"{r.pillarNodeValue}" for r in values_df.itertuples()]
-                            ids = [int(r.id) for r in values_df.itertuples()]
-                            options = [("— N/A —", None)] + list(zip(labels, ids))
-
-                            current_vid = pref_map.get(int(node.id))
-                            default_index = 0
-                            if current_vid and current_vid in ids:
-                                default_index = 1 + ids.index(current_vid)
-
-                            choice = st.selectbox(
-                                "Select value",
-                                options=options,
-                                index=default_index,
-                                format_func=lambda t: t[0],
-                                key=f"sel_{cat.id}_{sub.id}_{node.id}",
-                            )
-                            sel = choice[1] if isinstance(choice, tuple) else None
-
-                        changes.append({"node_id": int(node.id), "value_id": sel})
-
-                col_idx = 1 - col_idx
+            # filter values
+            values = matching
+
+        with cols[col_idx]:
+            with st.container(border=True):
+                st.markdown(f"**{node.pillarNode}**")
+                if node.pillarNodeDescription:
+                    st.caption(node.pillarNodeDescription)
+
+                if not values:
+                    st.info("No mapped values (or filtered out).")
+                else:
+                    labels = [f"{r.pillarNodeValue}" for r in values]
+                    ids = [r.id for r in values]
+                    options = [("— N/A —", None)] + list(zip(labels, ids))
+
+                    # Mark options that would trigger a rule given the rest of the profile;
+                    # markers go through format_func so the option tuples stay stable
+                    flagged = live_eval.option_hits(node.id, ids, severities=OPTION_MARKERS)
+                    markers = {}
+                    for vid, rule_idxs in flagged.items():
+                        sevs = {compiled_rules.severities[ri] for ri in rule_idxs}
+                        markers[vid] = OPTION_MARKERS["Error" if "Error" in sevs else "Warning"]
+
+                    stored_vid = pref_map.get(node.id)
+                    current_vid = drafts[node.id] if node.id in drafts else stored_vid
+                    default_index = 0
+                    if current_vid and current_vid in ids:
+                        default_index = 1 + ids.index(current_vid)
+
+                    st.selectbox(
+                        "Select value",
+                        options=options,
+                        index=default_index,
+                        format_func=lambda t, m=markers: f"{t[0]} {m[t[1]]}" if t[1] in m else t[0],
+                        key=sel_key(node),
+                        on_change=record_draft,
+                        args=(drafts, node.id, stored_vid, sel_key(node)),
+                    )
+
+        col_idx = 1 - col_idx
 
 st.markdown("---")
+if drafts:
+    st.caption(f"✳️ {len(drafts)} unsaved change(s) across {len(unsaved_by_category)} categor(ies).")
 c1, c2, c3 = st.columns([1,1,1])
 with c1:
     if st.button("💾 Save selections", type="primary"):
-        updated, cleared = 0, 0
-        for ch in changes:
-            nid, vid = ch["node_id"], ch["value_id"]
-            if vid is None:
-                if pref_map.get(nid) is not None:
-                    clear_pref(user_name, active_source, nid)
-                    cleared += 1
-            else:
-                upsert_pref(user_name, active_source, nid, vid)
-                updated += 1
-        st.success(f"Saved. Updated {updated}, cleared {cleared}.")
+        changed = diff_prefs(drafts, pref_map)
+        updated, inserted, cleared = save_prefs(engine, user_name, active_source, changed)
+        discard_drafts()
+        st.success(f"Saved. Updated {updated}, inserted {inserted}, cleared {cleared}.")
         st.rerun()
 with c2:
     if st.button("↩️ Revert (reload)"):
+        discard_drafts()
         st.rerun()
 with c3:
     if st.button("🗑️ Clear ALL in this source"):
         clear_all_prefs(user_name, active_source)
+        discard_drafts()
         st.success(f"Cleared all preferences for '{active_source}'.")
         st.rerun()
 
@@ -393,4 +378,6 @@ else:
     st.dataframe(cur, use_container_width=True, hide_index=True)
 
 st.markdown("---")
-st.caption(f"Connected to **{st.secrets['sqlserver']['database']}** · {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
+st.caption(f"Connected to **{database_label()}** · {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
+query_panel()
+finish_rerun_profile()
@@ -1,91 +1,56 @@
 # pages/06_WarningRules.py
 import os
-import urllib.parse
 from datetime import datetime
 from typing import Dict, List, Optional
 
 import pandas as pd
 import streamlit as st
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.exc import DBAPIError
 
-st.set_page_config(page_title="Warning Rules (Combinations)", layout="wide")
-
-# -----------------------------
-# Connection (Windows Auth-friendly)
-# -----------------------------
-def _build_sqlalchemy_url():
-    cfg = st.secrets["sqlserver"]
-    driver = cfg.get("driver", "ODBC Driver 18 for SQL Server")
-    parts = [
-        f"DRIVER={{{driver}}}",
-        f"SERVER={cfg['server']}",
-        f"DATABASE={cfg['database']}",
-        f"Encrypt={cfg.get('encrypt','no')}",
-        f"TrustServerCertificate={cfg.get('trust_server_certificate','yes')}",
-    ]
-    if cfg.get("windows_auth", True):
-        parts.append("Trusted_Connection=yes")
-    else:
-        parts += [f"UID={cfg['username']}", f"PWD={cfg['password']}"]
-    odbc = ";".join(parts) + ";"
-    return "mssql+pyodbc:///?odbc_connect=" + urllib.parse.quote_plus(odbc)
+from helpers.db import database_label, get_engine
+from helpers.dialect import dialect_for
+from helpers.profiling import finish_rerun_profile, profiled_fragment, start_rerun_profile
+from helpers.query_stats import query_panel
+from helpers.rule_analysis import analyze_rules
+from helpers.rule_batch import evaluate_profiles
+from helpers.rules import get_compiled_rules, invalidate_rules, load_compiled_rules
+from helpers.taxonomy import Category, PillarNode, PillarNodeValue, SubCategory, get_taxonomy, to_frame
 
-@st.cache_resource(show_spinner=False)
-def get_engine():
-    return create_engine(_build_sqlalchemy_url(), pool_pre_ping=True, fast_executemany=True)
+st.set_page_config(page_title="Warning Rules (Combinations)", layout="wide")
+start_rerun_profile()
 
 engine = get_engine()
 
-# -----------------------------
-# Schema bootstrap (idempotent)
-# -----------------------------
-
-
 # -----------------------------
 # Taxonomy helpers
 # -----------------------------
 def fetch_categories() -> pd.DataFrame:
-    with engine.begin() as cx:
-        return pd.read_sql(text("SELECT id, category FROM dbo.category ORDER BY category;"), cx)
+    taxonomy = get_taxonomy(engine)
+    return to_frame(taxonomy.categories, Category, ["id", "category"])
 
 def fetch_subcategories(category_id: int) -> pd.DataFrame:
-    with engine.begin() as cx:
-        return pd.read_sql(
-            text("SELECT id, subCategory FROM dbo.subCategory WHERE category_id = :cid ORDER BY subCategory;"),
-            cx, params={"cid": category_id}
-        )
+    taxonomy = get_taxonomy(engine)
+    return to_frame(taxonomy.subcategories(category_id), SubCategory, ["id", "subCategory"])
 
 def fetch_nodes(subcat_id: int) -> pd.DataFrame:
-    with engine.begin() as cx:
-        return pd.read_sql(
-            text("""SELECT id, pillarNode, pillarNodeDescription
-                    FROM dbo.pillarNode WHERE subCategory_id = :sid ORDER BY pillarNode;"""),
-            cx, params={"sid": subcat_id}
-        )
+    taxonomy = get_taxonomy(engine)
+    return to_frame(taxonomy.nodes(subcat_id), PillarNode, ["id", "pillarNode", "pillarNodeDescription"])
 
 def fetch_values_for_node(node_id: int) -> pd.DataFrame:
-    with engine.begin() as cx:
-        return pd.read_sql(
-            text("""SELECT v.id, v.pillarNodeValue, v.pillarNodeValueDescription
-                    FROM dbo.pillarNodeValueMapping m
-                    JOIN dbo.pillarNodeValue v ON v.id = m.pillarNodeValue_id
-                    WHERE m.pillarNode_id = :nid
-                    ORDER BY v.pillarNodeValue;"""),
-            cx, params={"nid": node_id}
-        )
+    taxonomy = get_taxonomy(engine)
+    return to_frame(taxonomy.values_for_node(node_id), PillarNodeValue,
+                    ["id", "pillarNodeValue", "pillarNodeValueDescription"])
 
 # -----------------------------
 # Rules CRUD
 # -----------------------------
 def list_rules() -> pd.DataFrame:
-    sql = text("""
+    d = dialect_for(engine)
+    condition = d.concat("n.pillarNode", "' '", "c.operator", "' '", "COALESCE(v.pillarNodeValue, 'NULL')")
+    sql = text(f"""
         SELECT r.id, r.name, r.severity, r.isActive, r.dataSourceFilter, r.dateAdded,
-               STRING_AGG(
-                   CONCAT(n.pillarNode, ' ', c.operator, ' ',
-                          COALESCE(v.pillarNodeValue, 'NULL')
-                   ), ' AND '
-               ) WITHIN GROUP (ORDER BY c.id) AS conditions
+               {d.string_agg(condition, "' AND '", "c.id")} AS conditions
         FROM dbo.warningRule r
         LEFT JOIN dbo.warningRuleCondition c ON c.rule_id = r.id
         LEFT JOIN dbo.pillarNode n ON n.id = c.pillarNode_id
@@ -115,9 +80,8 @@ def fetch_rule_conditions(rule_id: int) -> pd.DataFrame:
 def insert_rule(name: str, message: str, severity: str, is_active: bool, ds_filter: Optional[str], conditions: List[dict]) -> int:
     with engine.begin() as cx:
         rid = cx.execute(
-            text("""INSERT INTO dbo.warningRule (name, message, severity, isActive, dataSourceFilter)
-                    OUTPUT INSERTED.id
-                    VALUES (:n, :m, :s, :a, :d);"""),
+            text(dialect_for(engine).insert_returning(
+                "dbo.warningRule", "name, message, severity, isActive, dataSourceFilter", ":n, :m, :s, :a, :d")),
             {"n": name, "m": message, "s": severity, "a": 1 if is_active else 0, "d": ds_filter or None}
         ).scalar_one()
         for cond in conditions:
@@ -126,6 +90,7 @@ def insert_rule(name: str, message: str, severity: str, is_active: bool, ds_filt
                         VALUES (:rid, :nid, :op, :vid);"""),
                 {"rid": rid, "nid": int(cond["node_id"]), "op": cond["operator"], "vid": cond.get("value_id", None)}
             )
+    invalidate_rules()
     return int(rid)
 
 def update_rule_meta(rule_id: int, name: str, message: str, severity: str, is_active: bool, ds_filter: Optional[str]):
@@ -136,10 +101,27 @@ def update_rule_meta(rule_id: int, name: str, message: str, severity: str, is_ac
                     WHERE id=:id;"""),
             {"id": rule_id, "n": name, "m": message, "s": severity, "a": 1 if is_active else 0, "d": ds_filter or None}
         )
+    invalidate_rules()
 
 def delete_rule(rule_id: int):
+    # Conditions are deleted explicitly: DuckDB has no ON DELETE CASCADE
+    params = {"id": rule_id}
+    if dialect_for(engine).name != "duckdb":
+        with engine.begin() as cx:
+            cx.execute(text("DELETE FROM dbo.warningRuleCondition WHERE rule_id = :id;"), params)
+            cx.execute(text("DELETE FROM dbo.warningRule WHERE id = :id;"), params)
+        invalidate_rules()
+        return
+    # DuckDB checks foreign keys against committed rows, so the rule can only go once
+    # its conditions' delete has committed. A rule without conditions fires for every
+    # profile, so it is deactivated first and never fires half-deleted.
     with engine.begin() as cx:
-        cx.execute(text("DELETE FROM dbo.warningRule WHERE id = :id;"), {"id": rule_id})
+        cx.execute(text("UPDATE dbo.warningRule SET isActive = 0 WHERE id = :id;"), params)
+    with engine.begin() as cx:
+        cx.execute(text("DELETE FROM dbo.warningRuleCondition WHERE rule_id = :id;"), params)
+    with engine.begin() as cx:
+        cx.execute(text("DELETE FROM dbo.warningRule WHERE id = :id;"), params)
+    invalidate_rules()
 
 def add_condition(rule_id: int, node_id: int, operator: str, value_id: Optional[int]):
     with engine.begin() as cx:
@@ -148,10 +130,12 @@ def add_condition(rule_id: int, node_id: int, operator: str, value_id: Optional[
                     VALUES (:rid, :nid, :op, :vid);"""),
             {"rid": rule_id, "nid": node_id, "op": operator, "vid": value_id}
         )
+    invalidate_rules()
 
 def delete_condition(cond_id: int):
     with engine.begin() as cx:
         cx.execute(text("DELETE FROM dbo.warningRuleCondition WHERE id = :id;"), {"id": cond_id})
+    invalidate_rules()
 
 # -----------------------------
 # Optional: evaluate rules for a user+source
@@ -168,47 +152,17 @@ def fetch_user_pref_map(user_name: str, data_source: str) -> Dict[int, Optional[
 
 def evaluate_rules(user_name: str, data_source: str) -> pd.DataFrame:
     prefs = fetch_user_pref_map(user_name, data_source)
-    rules = list_rules()
-    hits = []
-    with engine.begin() as cx:
-        for r in rules.itertuples():
-            if not r.isActive:
-                continue
-            if r.dataSourceFilter and r.dataSourceFilter != data_source:
-                continue
-            conds = fetch_rule_conditions(int(r.id))
-            ok = True
-            for c in conds.itertuples():
-                val = prefs.get(int(c.pillarNode_id))  # may be None
-                op = c.operator.upper()
-                target = int(c.pillarNodeValue_id) if pd.notna(c.pillarNodeValue_id) else None
-                if op == '=':
-                    ok &= (val == target)
-                elif op in ('!=', '<>'):
-                    ok &= (val is None or val != target)
-                elif op == 'IS NULL':
-                    ok &= (val is None)
-                elif op == 'IS NOT NULL':
-                    ok &= (val is not None)
-                else:
-                    ok = False
-                if not ok:
-                    break
-            if ok:
-                hits.append({"id": r.id, "name": r.name, "severity": r.severity, "message": r.message})
-    return pd.DataFrame(hits)
+    compiled = get_compiled_rules(engine)
+    return compiled.hits_frame(compiled.evaluate(prefs, data_source))
 
 # -----------------------------
-# UI
+# Fragments
 # -----------------------------
-st.title("⚠️ Warning Rules — Define Combinations")
-st.caption("Create rules like: **Source Format = Unstructured AND Target Platform = Structured → show warning**.")
-
-OPERATORS = ["=", "!=", "IS NULL", "IS NOT NULL"]
-SEVERITIES = ["Info", "Warning", "Error"]
-
-# --- Sidebar: quick preview evaluator (optional) ---
-with st.sidebar:
+# Widgets inside a fragment rerun only that fragment: the Category → Subcategory → Node
+# pickers recompute just their own cascade, without re-querying the rule list. Saves
+# that change the rule list rerun the whole page.
+@profiled_fragment
+def preview_panel():
     st.header("Preview warnings (optional)")
     default_user = os.getenv("USERNAME") or os.getenv("USER") or "me"
     prev_user = st.text_input("User", value=default_user)
@@ -223,34 +177,21 @@ with st.sidebar:
             else:
                 st.write(df_hits)
 
-st.markdown("---")
-
-# ========== Create New Rule ==========
-st.subheader("➕ Create a new rule")
-with st.form("new_rule_meta_form"):
-    c1, c2, c3 = st.columns([2,1,1])
-    name = c1.text_input("Rule name", placeholder="e.g., Unstructured source into Structured target")
-    severity = c2.selectbox("Severity", SEVERITIES, index=1)
-    is_active = c3.checkbox("Active", value=True)
-    message = st.text_area("Message (shown to user)", max_chars=400,
-                           placeholder="Add a staging/parsing step (OCR/extraction/schema mapping) or land to a lake first.")
-    ds_filter = st.text_input("Limit to Data Source (optional)", placeholder="Leave blank to apply to all sources")
-    submitted_meta = st.form_submit_button("Start rule & add conditions")
-    if submitted_meta:
-        if not name.strip() or not message.strip():
-            st.error("Name and Message are required.")
+    st.markdown("---")
+    st.header("All profiles")
+    if st.button("Evaluate every user & source"):
+        all_hits, strategy = evaluate_profiles(engine)
+        st.caption(f"Evaluated {'on the server (SQL)' if strategy == 'sql' else 'in memory'}.")
+        if all_hits.empty:
+            st.success("No profile triggers any rule.")
         else:
-            st.session_state["new_rule_meta"] = {
-                "name": name.strip(),
-                "severity": severity,
-                "is_active": is_active,
-                "message": message.strip(),
-                "ds_filter": ds_filter.strip() or None,
-            }
-            st.success("Rule draft created. Add conditions below.")
+            st.write(f"{len(all_hits)} hit(s) across {all_hits[['userName', 'dataSource']].drop_duplicates().shape[0]} profile(s).")
+            st.dataframe(all_hits, use_container_width=True, hide_index=True)
+            st.download_button("Download hits.csv", data=all_hits.to_csv(index=False).encode("utf-8"),
+                               file_name="warning_hits.csv", mime="text/csv")
 
-# Condition builder for the *new* rule (collect in session, then save)
-if "new_rule_meta" in st.session_state:
+@profiled_fragment
+def new_rule_conditions():
     st.markdown("**Conditions (ANDed):**")
     if "new_rule_conds" not in st.session_state:
         st.session_state["new_rule_conds"] = []
@@ -315,26 +256,8 @@ if "new_rule_meta" in st.session_state:
                 del st.session_state["new_rule_conds"]
                 st.rerun()
 
-st.markdown("---")
-
-# ========== Existing Rules ==========
-st.subheader("📚 Existing rules")
-rules_df = list_rules()
-if rules_df.empty:
-    st.info("No rules yet.")
-else:
-    st.dataframe(
-        rules_df.rename(columns={
-            "dataSourceFilter":"Scope (dataSource)",
-            "conditions":"Conditions"
-        }),
-        use_container_width=True, hide_index=True
-    )
-
-    # Select a rule to edit
-    pick = st.selectbox("Select a rule to edit", options=[(int(r.id), f"[{r.severity}{'•off' if not r.isActive else ''}] {r.name} (id={int(r.id)})") for r in rules_df.itertuples()], format_func=lambda t: t[1])
-    rid = pick[0]
-
+@profiled_fragment
+def rule_editor(rid: int):
     meta = fetch_rule(rid).iloc[0]
     with st.expander("✏️ Edit rule meta", expanded=False):
         e1, e2, e3 = st.columns([2,1,1])
@@ -412,5 +335,92 @@ else:
                     st.success("Condition added.")
                     st.rerun()
 
+@profiled_fragment
+def rule_analysis(rule_names: Dict[int, str]):
+    if st.button("Analyze rules"):
+        analysis = analyze_rules(load_compiled_rules(engine, prune=False))
+        findings = analysis.findings_frame()
+        if findings.empty:
+            st.success("No unsatisfiable, duplicate or subsumed rules.")
+        else:
+            findings.insert(1, "name", findings["rule_id"].map(rule_names))
+            findings["other_name"] = findings["other_rule_id"].map(lambda r: rule_names.get(int(r)) if pd.notna(r) else None)
+            st.write(f"{len(findings)} rule(s) skipped by the evaluators.")
+            st.dataframe(findings, use_container_width=True, hide_index=True)
+
+# -----------------------------
+# UI
+# -----------------------------
+st.title("⚠️ Warning Rules — Define Combinations")
+st.caption("Create rules like: **Source Format = Unstructured AND Target Platform = Structured → show warning**.")
+
+OPERATORS = ["=", "!=", "IS NULL", "IS NOT NULL"]
+SEVERITIES = ["Info", "Warning", "Error"]
+
+# --- Sidebar: quick preview evaluator (optional) ---
+with st.sidebar:
+    preview_panel()
+
+st.markdown("---")
+
+# ========== Create New Rule ==========
+st.subheader("➕ Create a new rule")
+with st.form("new_rule_meta_form"):
+    c1, c2, c3 = st.columns([2,1,1])
+    name = c1.text_input("Rule name", placeholder="e.g., Unstructured source into Structured target")
+    severity = c2.selectbox("Severity", SEVERITIES, index=1)
+    is_active = c3.checkbox("Active", value=True)
+    message = st.text_area("Message (shown to user)", max_chars=400,
+                           placeholder="Add a staging/parsing step (OCR/extraction/schema mapping) or land to a lake first.")
+    ds_filter = st.text_input("Limit to Data Source (optional)", placeholder="Leave blank to apply to all sources")
+    submitted_meta = st.form_submit_button("Start rule & add conditions")
+    if submitted_meta:
+        if not name.strip() or not message.strip():
+            st.error("Name and Message are required.")
+        else:
+            st.session_state["new_rule_meta"] = {
+                "name": name.strip(),
+                "severity": severity,
+                "is_active": is_active,
+                "message": message.strip(),
+                "ds_filter": ds_filter.strip() or None,
+            }
+            st.success("Rule draft created. Add conditions below.")
+
+# Condition builder for the *new* rule (collect in session, then save)
+if "new_rule_meta" in st.session_state:
+    new_rule_conditions()
+
+st.markdown("---")
+
+# ========== Existing Rules ==========
+st.subheader("📚 Existing rules")
+rules_df = list_rules()
+if rules_df.empty:
+    st.info("No rules yet.")
+else:
+    st.dataframe(
+        rules_df.rename(columns={
+            "dataSourceFilter":"Scope (dataSource)",
+            "conditions":"Conditions"
+        }),
+        use_container_width=True, hide_index=True
+    )
+
+    # Select a rule to edit
+    pick = st.selectbox("Select a rule to edit", options=[(int(r.id), f"[{r.severity}{'•off' if not r.isActive else ''}] {r.name} (id={int(r.id)})") for r in rules_df.itertuples()], format_func=lambda t: t[1])
+    rid = pick[0]
+
+    rule_editor(rid)
+
+# ========== Rule set analysis ==========
+st.markdown("---")
+st.subheader("🧹 Rule set analysis")
+st.caption("Unsatisfiable, duplicate and subsumed rules are skipped by the evaluators; "
+           "subsumed/duplicate rules only when the covering rule has the same severity, message and scope.")
+rule_analysis(dict(zip(rules_df["id"].astype(int), rules_df["name"])) if not rules_df.empty else {})
+
 st.markdown("---")
-st.caption(f"Connected to **{st.secrets['sqlserver']['database']}** · {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
+st.caption(f"Connected to **{database_label()}** · {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
+query_panel()
+finish_rerun_profile()
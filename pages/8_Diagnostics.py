@@ -0,0 +1,129 @@
+# pages/08_Diagnostics.py
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+from helpers.db import database_label, get_engine, pool_stats
+from helpers.profiling import CATEGORIES, profiling_settings, recent_profiles
+from helpers.query_stats import diagnostics_settings, recent_reruns
+
+st.set_page_config(page_title="Diagnostics", layout="wide")
+
+engine = get_engine()
+
+st.title("🩺 Diagnostics")
+st.caption("Connection pool, per-rerun statement counts and (when profiling is on) where each rerun's time goes. "
+           "Figures are for this app process, across all sessions.")
+
+settings = {**diagnostics_settings(), **profiling_settings()}
+
+# -----------------------------
+# Connection pool
+# -----------------------------
+st.subheader("Connection pool")
+stats = pool_stats()
+c1, c2, c3, c4 = st.columns(4)
+c1.metric("Checked out", f"{stats['checked_out']} / {stats['pool_size']}")
+c2.metric("Checkouts", f"{stats['checkouts']:,}")
+c3.metric("Avg wait", f"{stats['avg_wait_ms']:.1f} ms")
+c4.metric("Timeouts", stats["timeouts"])
+
+# -----------------------------
+# Statements per rerun
+# -----------------------------
+st.subheader("Statements per rerun")
+runs = recent_reruns()
+if not settings["query_stats"]:
+    st.info("Statement instrumentation is off (`query_stats = false` under `[diagnostics]`).")
+elif not runs:
+    st.info("No reruns recorded yet — open a data page first.")
+else:
+    threshold = settings["n_plus_one_threshold"]
+    runs_df = pd.DataFrame([{
+        "page": f"{r.page or '?'} (fragment)" if r.fragment else r.page or "?",
+        "started": datetime.fromtimestamp(r.started),
+        "statements": r.statements,
+        "dbMs": round(r.duration_ms, 1),
+        "nPlusOne": len(r.n_plus_one(threshold)),
+    } for r in runs])
+    per_page = (runs_df.groupby("page")
+                       .agg(reruns=("page", "size"),
+                            avgStatements=("statements", "mean"),
+                            maxStatements=("statements", "max"),
+                            avgDbMs=("dbMs", "mean"),
+                            maxDbMs=("dbMs", "max"),
+                            nPlusOneReruns=("nPlusOne", lambda s: int((s > 0).sum())))
+                       .reset_index()
+                       .sort_values("maxDbMs", ascending=False))
+    st.dataframe(per_page.round(1), use_container_width=True, hide_index=True)
+
+    with st.expander("N+1 suspects", expanded=False):
+        suspects = [s.assign(page=r.page) for r in runs for s in [r.n_plus_one(threshold)] if not s.empty]
+        if suspects:
+            flat = (pd.concat(suspects)
+                      .drop_duplicates(["page", "fingerprint"])
+                      [["page", "caller", "executions", "totalMs", "statement"]])
+            st.dataframe(flat, use_container_width=True, hide_index=True)
+        else:
+            st.caption(f"No statement ran more than {threshold}× in one rerun.")
+
+# -----------------------------
+# Profiled reruns
+# -----------------------------
+st.subheader("Slowest reruns")
+if not settings["enabled"]:
+    st.info("Profiling is off. Enable it with `profile = true` under `[diagnostics]` in secrets.toml "
+            "or `PILLARS_PROFILE=1` in the environment.")
+else:
+    profiles = recent_profiles()
+    if not profiles:
+        st.info("No profiled reruns yet — open a data page first.")
+    else:
+        pages = sorted({p.page for p in profiles})
+        page = st.selectbox("Page", ["All pages"] + pages)
+        shown = sorted(recent_profiles(None if page == "All pages" else page),
+                       key=lambda p: p.wall_ms, reverse=True)[:25]
+
+        rows = []
+        for p in shown:
+            split = p.breakdown_ms()
+            rows.append({
+                "page": p.page,
+                "fragment": p.fragment or "",
+                "started": datetime.fromtimestamp(p.started),
+                "wallMs": round(p.wall_ms, 1),
+                **{c: round(split[c], 1) for c in CATEGORIES},
+                "statements": p.db_statements,
+                "dbMs": round(p.db_ms, 1),
+                "interrupted": p.interrupted,
+                "capture": p.capture_path or "",
+            })
+        st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+
+        choice = st.selectbox(
+            "Inspect rerun",
+            options=list(range(len(shown))),
+            format_func=lambda i: f"{shown[i].page}{' · ' + shown[i].fragment if shown[i].fragment else ''} · {datetime.fromtimestamp(shown[i].started):%H:%M:%S} · {shown[i].wall_ms:,.0f} ms",
+        )
+        prof = shown[choice]
+        split = prof.breakdown_ms()
+        st.bar_chart(pd.DataFrame({"ms": [split[c] for c in CATEGORIES]}, index=list(CATEGORIES)))
+
+        top = pd.DataFrame(prof.stacks.most_common(20), columns=["stack", "samples"])
+        top["leaf"] = top["stack"].str.rsplit(";", n=1).str[-1]
+        st.dataframe(top[["leaf", "samples", "stack"]], use_container_width=True, hide_index=True)
+
+        d1, d2 = st.columns(2)
+        d1.download_button("Download flame data (collapsed stacks)", prof.folded(),
+                           file_name=f"{prof.page}-{int(prof.started)}.folded", mime="text/plain")
+        if prof.capture_path:
+            try:
+                with open(prof.capture_path, "rb") as fh:
+                    d2.download_button(f"Download {prof.capture_path.rsplit('.', 1)[-1]} capture", fh.read(),
+                                       file_name=prof.capture_path.replace("\\", "/").rsplit("/", 1)[-1])
+            except OSError:
+                d2.caption(f"Capture file {prof.capture_path} is no longer on disk.")
+
+st.markdown("---")
+st.caption(f"Connected to **{database_label()}** · {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
@@ -0,0 +1,177 @@
+# tests/test_rules.py
+"""Every rule evaluator against the plain per-rule condition_holds loop.
+
+Random rule sets mix '=', '!=', '<>', IS [NOT] NULL, NULL targets, unknown
+operators, rules without conditions, inactive rules and dataSource scopes; random
+profiles leave nodes unset. Seeds are fixed, so a failure reproduces.
+"""
+import random
+from typing import Dict, List, Optional
+
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from helpers.dialect import create_engine_for_url
+from helpers.migrations import migrate
+from helpers.rule_batch import evaluate_prefs_frame, evaluate_rules_sql
+from helpers.rules import (CompiledRules, ProfileEvaluator, condition_holds, invalidate_rules,
+                           load_compiled_rules, op_code)
+
+N_NODES = 8
+VALUES_PER_NODE = 4
+SOURCES = ["A", "B", "C"]
+OPERATORS = ["=", "=", "=", "!=", "<>", "IS NULL", "IS NOT NULL", " is not null ", "LIKE"]
+SEEDS = range(12)
+
+
+def node_values(nid: int) -> List[int]:
+    return list(range((nid - 1) * VALUES_PER_NODE + 1, nid * VALUES_PER_NODE + 1))
+
+
+def random_rules(rng: random.Random, n_rules: int = 40):
+    rules, conds = [], []
+    for rid in range(1, n_rules + 1):
+        scope = rng.choice([None, None, None, "", "A", "B"])
+        rules.append((rid, f"Rule {rid}", f"message {rid}", rng.choice(["Info", "Warning", "Error"]),
+                      rng.random() > 0.15, scope))
+        for nid in rng.sample(range(1, N_NODES + 1), rng.choice([0, 1, 1, 2, 2, 3])):
+            op = rng.choice(OPERATORS)
+            target = rng.choice(node_values(nid)) if rng.random() > 0.1 else None
+            conds.append((rid, nid, op, target if op_code(op) in (0, 1) or rng.random() < 0.2 else None))
+    return rules, conds
+
+
+def random_profile(rng: random.Random) -> Dict[int, int]:
+    return {nid: rng.choice(node_values(nid)) for nid in range(1, N_NODES + 1) if rng.random() < 0.6}
+
+
+def random_profiles(rng: random.Random, n_users: int = 15) -> Dict[tuple, Dict[int, int]]:
+    profiles = {}
+    for u in range(n_users):
+        for ds in rng.sample(SOURCES, rng.randint(1, len(SOURCES))):
+            prefs = random_profile(rng)
+            if prefs:  # the SQL path only sees profiles with at least one row
+                profiles[(f"user{u:02d}", ds)] = prefs
+    return profiles
+
+
+def oracle(rules, conds, prefs: Dict[int, Optional[int]], data_source: str, skip=()) -> List[int]:
+    """Rule ids that fire, one rule and one condition at a time."""
+    fired = []
+    for rid, _, _, _, active, scope in rules:
+        if not active or rid in skip or (scope and scope != data_source):
+            continue
+        if all(condition_holds(op_code(op), target, prefs.get(nid))
+               for crid, nid, op, target in conds if crid == rid):
+            fired.append(rid)
+    return sorted(fired)
+
+
+def rule_ids(compiled: CompiledRules, indexes) -> List[int]:
+    return sorted(compiled.rule_ids[ri] for ri in indexes)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_compiled_evaluate(seed):
+    rng = random.Random(seed)
+    rules, conds = random_rules(rng)
+    compiled = CompiledRules(rules, conds)
+    for _ in range(50):
+        prefs, ds = random_profile(rng), rng.choice(SOURCES)
+        assert rule_ids(compiled, compiled.evaluate(prefs, ds)) == oracle(rules, conds, prefs, ds)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_evaluate_prefs_frame(seed):
+    rng = random.Random(seed)
+    rules, conds = random_rules(rng)
+    profiles = random_profiles(rng)
+    compiled = CompiledRules(rules, conds)
+    frame = pd.DataFrame(list(profiles), columns=["userName", "dataSource"])
+    prefs = pd.DataFrame([(u, ds, nid, vid) for (u, ds), p in profiles.items() for nid, vid in p.items()],
+                         columns=["userName", "dataSource", "pillarNode_id", "pillarNodeValue_id"])
+    hits = evaluate_prefs_frame(compiled, frame, prefs, chunk_size=7)
+    got = {key: sorted(g["rule_id"].astype(int)) for key, g in hits.groupby(["userName", "dataSource"])}
+    for (u, ds), p in profiles.items():
+        assert got.get((u, ds), []) == oracle(rules, conds, p, ds), (u, ds)
+
+
+def test_evaluate_prefs_frame_without_rules():
+    frame = pd.DataFrame([("u", "A")], columns=["userName", "dataSource"])
+    prefs = pd.DataFrame([("u", "A", 1, 1)], columns=["userName", "dataSource", "pillarNode_id", "pillarNodeValue_id"])
+    assert evaluate_prefs_frame(CompiledRules([], []), frame, prefs).empty
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_profile_evaluator_update_and_option_hits(seed):
+    rng = random.Random(seed)
+    rules, conds = random_rules(rng)
+    compiled = CompiledRules(rules, conds)
+    ds = rng.choice(SOURCES)
+    prefs: Dict[int, Optional[int]] = random_profile(rng)
+    ev = ProfileEvaluator(compiled, prefs, ds)
+    for _ in range(30):
+        assert rule_ids(compiled, ev.hit_indexes()) == oracle(rules, conds, prefs, ds)
+
+        nid = rng.randint(1, N_NODES)
+        candidates = node_values(nid)
+        options = ev.option_hits(nid, candidates)
+        on_node = {rid for rid, cnid, _, _ in conds if cnid == nid}
+        for vid in candidates:
+            expected = [rid for rid in oracle(rules, conds, {**prefs, nid: vid}, ds) if rid in on_node]
+            assert rule_ids(compiled, options.get(vid, [])) == expected, (nid, vid)
+
+        changes = {n: (rng.choice(node_values(n)) if rng.random() < 0.7 else None)
+                   for n in rng.sample(range(1, N_NODES + 1), rng.randint(1, 3))}
+        ev.update(changes)
+        for n, v in changes.items():
+            if v is None:
+                prefs.pop(n, None)
+            else:
+                prefs[n] = v
+
+
+def _load(engine, rules, conds, profiles):
+    with engine.begin() as cx:
+        cx.execute(text("INSERT INTO dbo.category (id, category) VALUES (1, 'c');"))
+        cx.execute(text("INSERT INTO dbo.subCategory (id, category_id, subCategory) VALUES (1, 1, 's');"))
+        cx.execute(text("INSERT INTO dbo.pillarNode (id, subCategory_id, pillarNode) VALUES (:id, 1, :n);"),
+                   [{"id": nid, "n": f"node {nid}"} for nid in range(1, N_NODES + 1)])
+        cx.execute(text("INSERT INTO dbo.pillarNodeValue (id, pillarNodeValue) VALUES (:id, :v);"),
+                   [{"id": vid, "v": f"value {vid}"} for nid in range(1, N_NODES + 1) for vid in node_values(nid)])
+        cx.execute(text("""INSERT INTO dbo.warningRule (id, name, message, severity, isActive, dataSourceFilter)
+                           VALUES (:id, :n, :m, :s, :a, :f);"""),
+                   [{"id": r[0], "n": r[1], "m": r[2], "s": r[3], "a": int(r[4]), "f": r[5]} for r in rules])
+        if conds:
+            cx.execute(text("""INSERT INTO dbo.warningRuleCondition (rule_id, pillarNode_id, operator, pillarNodeValue_id)
+                               VALUES (:r, :n, :o, :v);"""),
+                       [{"r": r, "n": n, "o": o, "v": v} for r, n, o, v in conds])
+        cx.execute(text("""INSERT INTO dbo.userNodePreference (userName, pillarNode_id, pillarNodeValue_id, dataSource)
+                           VALUES (:u, :n, :v, :ds);"""),
+                   [{"u": u, "ds": ds, "n": nid, "v": vid} for (u, ds), p in profiles.items() for nid, vid in p.items()])
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_evaluate_rules_sql_on_sqlite(seed):
+    rng = random.Random(seed)
+    rules, conds = random_rules(rng)
+    profiles = random_profiles(rng)
+    engine = create_engine_for_url("sqlite://")
+    try:
+        migrate(engine)
+        _load(engine, rules, conds, profiles)
+        invalidate_rules()
+        skip = set(load_compiled_rules(engine).pruned_rule_ids)  # the pushdown leaves these out too
+
+        hits = evaluate_rules_sql(engine)
+        got = {key: sorted(g["rule_id"].astype(int)) for key, g in hits.groupby(["userName", "dataSource"])}
+        for (u, ds), p in profiles.items():
+            assert got.get((u, ds), []) == oracle(rules, conds, p, ds, skip), (u, ds)
+
+        (u, ds), p = next(iter(profiles.items()))
+        single = evaluate_rules_sql(engine, u, ds)
+        assert sorted(single["rule_id"].astype(int)) == oracle(rules, conds, p, ds, skip)
+    finally:
+        invalidate_rules()
+        engine.dispose()
@@ -0,0 +1,76 @@
+# tests/test_warning_hits.py
+"""Incremental warning-hit refreshes against preference deletes, on SQLite and DuckDB.
+
+Deleted rows leave no dateAdded behind; the deleting paths stamp the profile in
+dbo.userNodePreferenceChange instead, and the next incremental run must drop its hits.
+"""
+import pytest
+from sqlalchemy import text
+
+from helpers.dialect import create_engine_for_url
+from helpers.migrations import migrate
+from helpers.preferences import clear_pref, save_prefs, upsert_pref
+from helpers.rules import invalidate_rules
+from helpers.warning_hits import refresh_warning_hits
+
+USER, SOURCE = "alice", "A"
+
+
+@pytest.fixture(params=["sqlite://", "duckdb:///:memory:"])
+def engine(request):
+    if request.param.startswith("duckdb"):
+        pytest.importorskip("duckdb_engine")
+    engine = create_engine_for_url(request.param)
+    migrate(engine)
+    with engine.begin() as cx:
+        cx.execute(text("INSERT INTO dbo.category (id, category) VALUES (1, 'c');"))
+        cx.execute(text("INSERT INTO dbo.subCategory (id, category_id, subCategory) VALUES (1, 1, 's');"))
+        cx.execute(text("INSERT INTO dbo.pillarNode (id, subCategory_id, pillarNode) VALUES (1, 1, 'n1'), (2, 1, 'n2');"))
+        cx.execute(text("INSERT INTO dbo.pillarNodeValue (id, pillarNodeValue) VALUES (1, 'v1'), (2, 'v2');"))
+        cx.execute(text("""INSERT INTO dbo.warningRule (id, name, message, severity, isActive)
+                           VALUES (1, 'n1 is v1', 'm', 'Warning', 1);"""))
+        cx.execute(text("""INSERT INTO dbo.warningRuleCondition (rule_id, pillarNode_id, operator, pillarNodeValue_id)
+                           VALUES (1, 1, '=', 1);"""))
+    invalidate_rules()
+    upsert_pref(engine, USER, SOURCE, 1, 1)
+    upsert_pref(engine, USER, SOURCE, 2, 2)  # keeps the profile alive once node 1 is cleared
+    yield engine
+    invalidate_rules()
+    engine.dispose()
+
+
+def hits(engine):
+    with engine.begin() as cx:
+        return cx.execute(text("SELECT userName, dataSource, rule_id FROM dbo.warningHit;")).fetchall()
+
+
+def age_preferences(engine):
+    # Push every remaining row well behind the watermark and its overlap window
+    with engine.begin() as cx:
+        cx.execute(text("UPDATE dbo.userNodePreference SET dateAdded = '2000-01-01 00:00:00';"))
+
+
+@pytest.mark.parametrize("clear", [
+    lambda e: clear_pref(e, USER, SOURCE, 1),
+    lambda e: save_prefs(e, USER, SOURCE, {1: None}),
+], ids=["clear_pref", "save_prefs"])
+def test_incremental_refresh_drops_hits_of_cleared_preferences(engine, clear):
+    assert refresh_warning_hits(engine)["mode"] == "full"
+    assert [tuple(r) for r in hits(engine)] == [(USER, SOURCE, 1)]
+
+    age_preferences(engine)
+    clear(engine)
+    stats = refresh_warning_hits(engine, overlap_seconds=0)
+    assert stats["mode"] == "incremental"
+    assert stats["profilesEvaluated"] == 1
+    assert hits(engine) == []
+
+
+def test_unchanged_profiles_are_not_reevaluated(engine):
+    refresh_warning_hits(engine)
+    age_preferences(engine)
+    with engine.begin() as cx:
+        cx.execute(text("DELETE FROM dbo.userNodePreferenceChange;"))
+    stats = refresh_warning_hits(engine, overlap_seconds=0)
+    assert stats["profilesEvaluated"] == 0
+    assert len(hits(engine)) == 1